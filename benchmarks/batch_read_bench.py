@@ -0,0 +1,115 @@
+"""events + participants の読み込みにかかる Sheets API の往復回数と時間。
+
+gspread の Client / Spreadsheet / Worksheet を、1回の往復ごとに --latency 秒待つ
+メモリ上の偽物に差し替えて
+
+- per-sheet: streamlit_gsheets の conn.read() と同じ処理（シートごとに開き直す）
+- batch:     ecoride.sheets.batch_read（開いたスプレッドシートを使い回し、batchGet 1回）
+
+を比べる。ネットワークには接続しない。
+
+    python benchmarks/batch_read_bench.py
+    python benchmarks/batch_read_bench.py --latency 0.2 --participants 5000
+"""
+import argparse
+import sys
+import time
+
+from harness import sample_data
+
+WORKSHEETS = ("events", "participants")
+
+
+class _Backend:
+    """往復の回数を数え、1回ごとに latency 秒待つ。"""
+
+    def __init__(self, sheets, latency):
+        self.values = {name: [list(df.columns)] + df.astype(object).where(df.notna(), "").values.tolist()
+                       for name, df in sheets.items()}
+        self.latency = latency
+        self.requests = 0
+
+    def request(self):
+        self.requests += 1
+        time.sleep(self.latency)
+
+
+class _Worksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        rows = spreadsheet.backend.values[title]
+        self.row_count, self.col_count = len(rows), len(rows[0])
+
+
+class _Spreadsheet:
+    def __init__(self, backend):
+        self.backend = backend
+        backend.request()  # gspread の Spreadsheet() はメタデータを取得する
+
+    def worksheet(self, title):
+        self.backend.request()
+        return _Worksheet(self, title)
+
+    def values_get(self, range_name, params=None):
+        self.backend.request()
+        return {"values": self.backend.values[range_name.strip("'")]}
+
+    def values_batch_get(self, ranges, params=None):
+        self.backend.request()
+        return {"valueRanges": [{"values": self.backend.values[r.strip("'")]} for r in ranges]}
+
+
+class _Client:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_by_url(self, url):
+        return _Spreadsheet(self.backend)
+
+
+def per_sheet(backend):
+    from streamlit_gsheets.gsheets_connection import GSheetsServiceAccountClient
+
+    client = GSheetsServiceAccountClient.__new__(GSheetsServiceAccountClient)
+    client._client = _Client(backend)
+    client._spreadsheet = "https://docs.google.com/spreadsheets/d/bench"
+    client._worksheet = None
+    return [client.read(worksheet=name, ttl=0) for name in WORKSHEETS]
+
+
+def batch(backend, spreadsheet):
+    from ecoride.sheets import batch_read
+
+    frames = batch_read(spreadsheet, WORKSHEETS)
+    return [frames[name] for name in WORKSHEETS]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.1, help="1回の往復の待ち時間（秒）")
+    parser.add_argument("--participants", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    backend = _Backend(sample_data(n_participants=args.participants), args.latency)
+    # バッチ側はアプリと同じく、開いたスプレッドシートを使い回す（開く往復は起動時の1回だけ）
+    spreadsheet = _Client(backend).open_by_url("bench")
+
+    results = {}
+    for label, read in (("per-sheet", lambda: per_sheet(backend)), ("batch", lambda: batch(backend, spreadsheet))):
+        backend.requests = 0
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            frames = read()
+        results[label] = frames
+        print(f"{label:10s} {backend.requests / args.repeat:4.1f} requests/page"
+              f"  {(time.perf_counter() - t0) / args.repeat * 1000:7.1f}ms/page")
+
+    same = all(a.equals(b) for a, b in zip(results["per-sheet"], results["batch"]))
+    print("same DataFrames:", same)
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
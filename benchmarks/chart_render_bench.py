@@ -0,0 +1,119 @@
+"""CO2 棒グラフの1ティックあたりの描画コスト（キャッシュなし / あり）。
+
+ライブモニターの10秒ごとの更新を模して、合計値が --change-every ティックに1回だけ
+変わる列で
+
+- figure:  グラフの組み立て + st.plotly_chart と同じ変換（検証と JSON 化）
+- monitor: AppTest でのライブモニター画面全体の再実行
+
+をそれぞれキャッシュを毎回捨てた場合（従来と同じ）と、キャッシュを使う場合で計測する。
+
+    python benchmarks/chart_render_bench.py
+    python benchmarks/chart_render_bench.py --ticks 200 --change-every 3
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from harness import fake_sheets, make_app, sample_data
+
+
+def _totals(ticks, change_every):
+    solo, share = 1234.5, 456.7
+    for i in range(ticks):
+        if i and i % change_every == 0:
+            solo += 3.2
+            share += 1.1
+        yield solo, share
+
+
+def _streamlit_convert(fig):
+    """st.plotly_chart が Figure に対して行う処理（検証 + JSON 化）。"""
+    import plotly.io as pio
+    import plotly.tools
+
+    figure = plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True)
+    return pio.to_json(figure, validate=False)
+
+
+def bench_figure(ticks, change_every):
+    from ecoride import charts
+
+    results = {}
+    for label, cached in (("rebuild", False), ("cached", True)):
+        charts.cache_clear()
+        times = []
+        for solo, share in _totals(ticks, change_every):
+            t0 = time.perf_counter()
+            if cached:
+                fig = charts.co2_bar_figure(solo, share)
+            else:
+                fig = charts.build_co2_bar_figure(solo, share, charts.PALETTES["normal"])
+            _streamlit_convert(fig)
+            times.append(time.perf_counter() - t0)
+        results[label] = times
+    return results
+
+
+def bench_monitor(ticks, change_every):
+    from ecoride import charts
+
+    results = {}
+    for label, cached in (("rebuild", False), ("cached", True)):
+        data = sample_data()
+        with fake_sheets(data):
+            at = make_app("participant")
+            at.run()
+            at.sidebar.radio[0].set_value("ライブモニター").run()
+            if at.exception:
+                raise RuntimeError([e.value for e in at.exception])
+            times = []
+            rows = data["participants"].index
+            for i in range(ticks):
+                if i and i % change_every == 0:
+                    # 他のワーカーの登録の代わりに人数を変えて、合計値を動かす
+                    data["participants"].loc[rows[i % len(rows)], "people"] = 1 + i % 8
+                    _publish_participants(at)
+                if not cached:
+                    charts.cache_clear()
+                t0 = time.perf_counter()
+                at.run()
+                times.append(time.perf_counter() - t0)
+        results[label] = times
+    return results
+
+
+def _publish_participants(at):
+    """共有キャッシュに participants の変更を知らせる（ハーネスのシートを直接書き換えたため）。"""
+    from ecoride.sharedcache import SharedCache
+
+    SharedCache(at.secrets["general"]["shared_cache_path"]).publish("participants")
+
+
+def _report(title, results):
+    print(title)
+    base = statistics.median(results["rebuild"])
+    for label, times in results.items():
+        med = statistics.median(times)
+        print(f"  {label:8s} median {med * 1000:7.2f}ms  p90 {sorted(times)[int(len(times) * 0.9)] * 1000:7.2f}ms"
+              f"  ({base / med:4.1f}x)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--change-every", type=int, default=6, help="合計値が変わる間隔（ティック数）")
+    parser.add_argument("--skip-monitor", action="store_true", help="AppTest での計測を省く")
+    args = parser.parse_args(argv)
+
+    _report(f"figure ({args.ticks} ticks, totals change every {args.change_every})",
+            bench_figure(args.ticks, args.change_every))
+    if not args.skip_monitor:
+        _report("monitor (AppTest, ライブモニター画面の再実行)",
+                bench_monitor(max(args.ticks // 5, 10), args.change_every))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
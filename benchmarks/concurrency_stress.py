@@ -0,0 +1,298 @@
+"""同時書き込みの負荷試験: 複数プロセス × 複数スレッドが同じ参加者シートに登録・修正する。
+
+シートはファイル（読み書きに --latency 秒かかる）で代用し、各プロセスは本番と同じく
+SharedCache と SheetCommitter を持つ。各スレッドは --events 個のイベントのどれか1つを受け持ち、
+
+- 新しい参加者を --inserts 件登録する（Insert）
+- そのイベントの共有のカウンター行（イベントごとに --counters 行）の people を
+  「読む → +1 して比較交換 → 衝突したら読み直し」で --increments 回増やす（Update）
+
+終了後、登録がすべて残っていること・カウンターの合計が増やした回数と一致すること
+（更新の消失が無いこと）を確かめ、件数・書き込み回数・スループットを表示する。
+
+書き込み方式は3つ。
+
+- 既定: 行単位の書き込み（WorksheetStore と同じく、変えた行だけを書く）。書き込み権はイベント単位
+- --whole: シート全体の書き直し（WholeSheetStore）。書き込み権はシート単位
+- --naive: 従来の「読んだ DataFrame を丸ごと書き戻す」方式（登録や更新が消えることを確認できる）
+
+--sweep を付けると、書き手（プロセス）を 1, 2, 4, 8 と増やし、書き手ごとに別のイベントを
+受け持たせたときのスループットを、行単位とシート全体の両方で表にする。
+
+    python benchmarks/concurrency_stress.py
+    python benchmarks/concurrency_stress.py -p 4 -t 8 --events 4 --latency 0.05
+    python benchmarks/concurrency_stress.py --whole
+    python benchmarks/concurrency_stress.py --naive
+    python benchmarks/concurrency_stress.py --sweep
+"""
+import argparse
+import contextlib
+import copy
+import fcntl
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+class FileSheet:
+    """ファイル1つを participants シートに見立てる（行の dict のリストを pickle で保存）。
+
+    読み書きそれぞれに latency 秒（ネットワークの往復）かかる。書き込みは待ち時間の後に
+    ファイルロックの中で行うので、Sheets API がリクエストを1件ずつ適用するのと同じく、
+    行単位の書き込みどうしは互いの行を消さない。
+    """
+
+    row_level = True
+
+    def __init__(self, path, latency):
+        self.path = Path(path)
+        self.latency = latency
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.path.with_suffix(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+    def _save(self, rows):
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(rows, f)
+        os.replace(tmp, self.path)
+
+    def read(self):
+        import pandas as pd
+
+        time.sleep(self.latency)
+        return pd.DataFrame(self._load())
+
+    def write(self, df):
+        time.sleep(self.latency)
+        with self._locked():
+            self._save(df.to_dict("records"))
+
+    def write_rows(self, df, updates, appends):
+        time.sleep(self.latency)
+        with self._locked():
+            rows = self._load()
+            for position, row in updates.items():
+                rows[position] = row
+            rows.extend(appends)
+            self._save(rows)
+
+    def replace(self, df):
+        self.write(df)
+
+
+def _counter_id(event, i):
+    return f"counter-{event}-{i}"
+
+
+def _seed(path, events, counters):
+    rows = [{
+        "participant_id": _counter_id(e, i),
+        "event_id": f"stress-{e}",
+        "name": f"カウンター{e}-{i}",
+        "start_point": "東京都千代田区丸の内1-1",
+        "distance": 10.0,
+        "people": 0,
+        "car_type": "軽自動車 | 16km/L",
+        "row_revision": 0,
+    } for e in range(events) for i in range(counters)]
+    with open(path, "wb") as f:
+        pickle.dump(rows, f)
+
+
+def _worker(args, worker, queue):
+    import pandas as pd
+
+    from ecoride.concurrency import ConflictError, Insert, SheetCommitter, Update, WholeSheetStore
+    from ecoride.sharedcache import SharedCache
+
+    sheet = FileSheet(args.sheet, args.latency)
+    cache = SharedCache(args.cache)
+    store = WholeSheetStore(sheet.read, sheet.write) if args.whole else sheet
+    committer = SheetCommitter("participants", store, cache)
+    lock = threading.Lock()
+    stats = {"inserts": 0, "increments": 0, "conflicts": 0}
+
+    def naive_insert(row):
+        df = sheet.read()
+        sheet.write(pd.concat([df, pd.DataFrame([row])], ignore_index=True))
+
+    def naive_increment(pid):
+        df = sheet.read()
+        df.loc[df["participant_id"] == pid, "people"] += 1
+        sheet.write(df)
+
+    def increment(pid):
+        conflicts = 0
+        while True:
+            df = sheet.read()
+            row = df[df["participant_id"] == pid].iloc[0]
+            try:
+                committer.commit([Update(pid, {"people": int(row["people"]) + 1}, int(row["row_revision"]))])
+                return conflicts
+            except ConflictError:
+                conflicts += 1
+
+    def run(thread):
+        event = (worker * args.threads + thread) % args.events
+        conflicts = 0
+        for i in range(max(args.inserts, args.increments)):
+            if i < args.inserts:
+                row = {"participant_id": f"w{worker}-t{thread}-{i}", "event_id": f"stress-{event}",
+                       "name": f"登録{i}", "start_point": "東京都八王子市", "distance": 20.0, "people": 1,
+                       "car_type": "軽自動車 | 16km/L"}
+                if args.naive:
+                    naive_insert(row)
+                else:
+                    committer.commit([Insert(row)])
+            if i < args.increments:
+                pid = _counter_id(event, (worker + thread + i) % args.counters)
+                if args.naive:
+                    naive_increment(pid)
+                else:
+                    conflicts += increment(pid)
+        with lock:
+            stats["inserts"] += args.inserts
+            stats["increments"] += args.increments
+            stats["conflicts"] += conflicts
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(args.threads)]
+    # 全プロセスの準備（import など）が済んでから一斉に始める
+    args.start.wait()
+    stats["started"] = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats["finished"] = time.time()
+    stats["writes"] = committer.writes
+    queue.put(stats)
+
+
+def run(args) -> dict:
+    """1回の負荷試験。件数・書き込み回数・経過時間の dict を返す。"""
+    import pandas as pd
+
+    args = copy.copy(args)
+    workdir = Path(tempfile.mkdtemp(prefix="ecoride-stress-"))
+    args.sheet = str(workdir / "participants.pkl")
+    args.cache = str(workdir / "shared-cache.sqlite")
+    _seed(args.sheet, args.events, args.counters)
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    args.start = ctx.Barrier(args.processes)
+    procs = [ctx.Process(target=_worker, args=(args, w, queue)) for w in range(args.processes)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = max(r["finished"] for r in results) - min(r["started"] for r in results)
+
+    with open(args.sheet, "rb") as f:
+        final = pd.DataFrame(pickle.load(f))
+    counters = final["participant_id"].str.startswith("counter-")
+    return {
+        "expected_inserts": sum(r["inserts"] for r in results),
+        "expected_increments": sum(r["increments"] for r in results),
+        "inserted": int((~counters).sum()),
+        "counted": int(final.loc[counters, "people"].sum()),
+        "conflicts": sum(r["conflicts"] for r in results),
+        "writes": sum(r["writes"] for r in results),
+        "elapsed": elapsed,
+    }
+
+
+def _lost(result) -> bool:
+    return (result["inserted"] != result["expected_inserts"]
+            or result["counted"] != result["expected_increments"])
+
+
+def _ops(result) -> float:
+    return (result["expected_inserts"] + result["expected_increments"]) / result["elapsed"]
+
+
+def sweep(args) -> int:
+    """書き手を増やしたときのスループット（書き手ごとに別のイベント）。"""
+    print(f"latency {args.latency * 1000:.0f}ms, 書き手 = プロセス × {args.threads} スレッド, 書き手ごとに別のイベント")
+    print(f"{'writers':>8} {'row-level ops/s':>16} {'whole-sheet ops/s':>18}")
+    lost = False
+    base = {}
+    for processes in (1, 2, 4, 8):
+        cells = []
+        for whole in (False, True):
+            config = copy.copy(args)
+            config.processes, config.events, config.whole = processes, processes * args.threads, whole
+            result = run(config)
+            lost = lost or _lost(result)
+            ops = _ops(result)
+            base.setdefault(whole, ops)
+            cells.append(f"{ops:.1f} ({ops / base[whole]:.1f}x)")
+        print(f"{processes * args.threads:8d} {cells[0]:>16} {cells[1]:>18}", flush=True)
+    if lost:
+        print("LOST UPDATES", file=sys.stderr)
+    return 1 if lost else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--processes", type=int, default=3)
+    parser.add_argument("-t", "--threads", type=int, help="プロセスあたりのスレッド数（既定 6、--sweep では 1）")
+    parser.add_argument("--events", type=int, default=1, help="書き込み先のイベント（パーティション）の数")
+    parser.add_argument("--inserts", type=int, default=10, help="スレッドあたりの登録数")
+    parser.add_argument("--increments", type=int, default=10, help="スレッドあたりのカウンター更新数")
+    parser.add_argument("--counters", type=int, default=4, help="イベントごとのカウンター行の数")
+    parser.add_argument("--latency", type=float, default=0.02, help="シートの読み書き1回の所要時間 [秒]")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--whole", action="store_true", help="シート全体を書き直す方式（シート単位の書き込み権）で試す")
+    mode.add_argument("--naive", action="store_true", help="丸ごと書き戻す従来方式で試す")
+    mode.add_argument("--sweep", action="store_true", help="書き手の数を変えてスループットを比べる")
+    args = parser.parse_args(argv)
+
+    if args.threads is None:
+        args.threads = 1 if args.sweep else 6
+    if args.sweep:
+        return sweep(args)
+
+    result = run(args)
+    if args.naive:
+        mode_name = "naive (丸ごと書き戻し)"
+    elif args.whole:
+        mode_name = "changeset + シート全体の書き直し（シート単位の書き込み権）"
+    else:
+        mode_name = "changeset + 行単位の書き込み（イベント単位の書き込み権）"
+    print(f"mode        {mode_name}")
+    print(f"workers     {args.processes} プロセス × {args.threads} スレッド, {args.events} イベント, "
+          f"latency {args.latency * 1000:.0f}ms")
+    print(f"inserts     {result['inserted']} / {result['expected_inserts']}")
+    print(f"increments  {result['counted']} / {result['expected_increments']}")
+    if not args.naive:
+        print(f"conflicts   {result['conflicts']}（読み直して再試行した回数）")
+        print(f"writes      {result['writes']}（シートへの書き込み回数）")
+    print(f"elapsed     {result['elapsed']:.2f}s  ({_ops(result):.1f} ops/s)")
+
+    lost = _lost(result)
+    if lost:
+        print("LOST UPDATES", file=sys.stderr)
+    return 1 if lost and not args.naive else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
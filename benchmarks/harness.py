@@ -0,0 +1,94 @@
+"""ベンチマーク用の共通ハーネス。
+
+Google Sheets の代わりにメモリ上の DataFrame を返すよう GSheetsConnection を差し替え、
+streamlit.testing の AppTest で eco_ride_app.py を実行する。ネットワークには接続しない。
+"""
+import contextlib
+import random
+import tempfile
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "eco_ride_app.py"
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+SAMPLE_EVENT_ID = "bench0001"
+
+_CAR_TYPES = [
+    "ガソリン車 (普通) | 14km/L",
+    "ガソリン車 (大型・ミニバン) | 9km/L",
+    "軽自動車 | 16km/L",
+    "ディーゼル車 | 13km/L",
+    "ハイブリッド車 | 22km/L",
+    "電気自動車 (EV) | 走行時ゼロ",
+]
+_CITIES = [
+    "東京都千代田区", "東京都八王子市", "神奈川県横浜市", "埼玉県さいたま市",
+    "千葉県船橋市", "茨城県つくば市", "群馬県高崎市", "栃木県宇都宮市",
+]
+
+
+def sample_data(n_events: int = 20, n_participants: int = 500, seed: int = 0) -> dict:
+    """events / participants シートと同じ列構成のダミーデータを作る。"""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    event_ids = [SAMPLE_EVENT_ID] + [f"ev{i:06d}" for i in range(1, n_events)]
+    events = pd.DataFrame([
+        {
+            "event_id": eid,
+            "event_name": f"ベンチイベント {i}",
+            "event_date": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "location_name": "会場",
+            "location_address": "東京都千代田区丸の内1-1",
+        }
+        for i, eid in enumerate(event_ids)
+    ])
+    participants = pd.DataFrame([
+        {
+            "event_id": rng.choice(event_ids),
+            "name": f"グループ{i}",
+            "start_point": f"日本、〒100-0001 {rng.choice(_CITIES)}{rng.randint(1, 9)}-{rng.randint(1, 30)}",
+            "distance": round(rng.uniform(1, 120), 1),
+            "people": rng.randint(1, 8),
+            "car_type": rng.choice(_CAR_TYPES),
+        }
+        for i in range(n_participants)
+    ])
+    return {"events": events, "participants": participants}
+
+
+@contextlib.contextmanager
+def fake_sheets(sheets: dict):
+    """GSheetsConnection の接続・読み書きを sheets（シート名 → DataFrame）に差し替える。"""
+    from unittest import mock
+
+    import pandas as pd
+    import streamlit_gsheets
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        return sheets.get(worksheet, pd.DataFrame()).copy()
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        sheets[worksheet] = data.copy()
+
+    cls = streamlit_gsheets.GSheetsConnection
+    with mock.patch.object(cls, "_connect", lambda self, **kwargs: None), \
+            mock.patch.object(cls, "read", read), \
+            mock.patch.object(cls, "update", update):
+        yield sheets
+
+
+def make_app(mode: str, timeout: float = 120):
+    """admin（管理画面）または participant（参加者画面）を開く AppTest を返す（未実行）。"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+    # 共有キャッシュは実行ごとに別ファイルにする（前回の計測のシートが残らないように）
+    cache_path = Path(tempfile.mkdtemp(prefix="ecoride-bench-")) / "shared-cache.sqlite"
+    at.secrets["general"] = {"google_maps_api_key": "bench-dummy-key", "shared_cache_path": str(cache_path)}
+    if mode != "admin":
+        at.query_params["event_id"] = SAMPLE_EVENT_ID
+    return at
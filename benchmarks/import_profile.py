@@ -0,0 +1,59 @@
+"""import 時間のプロファイル（python -X importtime の集計）。
+
+指定した画面を1回描画するまでに読み込まれたモジュールを、トップレベルパッケージ単位の
+累積時間で並べる。どの依存がコールドスタートを支配しているかを確認する用途。
+
+    python benchmarks/import_profile.py participant --top 15
+"""
+import argparse
+import collections
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(mode: str) -> list[tuple[str, int, int, int]]:
+    """(モジュール名, self μs, cumulative μs, 入れ子の深さ) のリストを返す。"""
+    bench = Path(__file__).with_name("startup_bench.py")
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", str(bench), "--child", mode],
+        check=True, capture_output=True, text=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3))))
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("mode", choices=["admin", "participant"])
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rows = profile(args.mode)
+    # 累積時間は入れ子の一番外側（インデント最小）の行だけを数える
+    top_indent = min((r[3] for r in rows), default=0)
+    by_package = collections.Counter()
+    for name, _self_us, cum_us, indent in rows:
+        if indent == top_indent:
+            by_package[name.split(".")[0]] += cum_us
+    self_by_package = collections.Counter()
+    for name, self_us, _cum_us, _indent in rows:
+        self_by_package[name.split(".")[0]] += self_us
+
+    total = sum(self_by_package.values())
+    print(f"[{args.mode}] import 合計 {total / 1000:.0f} ms（{len(rows)} モジュール）")
+    print(f"{'package':28s} {'cumulative':>11s} {'self':>9s}")
+    for pkg, cum_us in by_package.most_common(args.top):
+        print(f"{pkg:28s} {cum_us / 1000:9.1f}ms {self_by_package[pkg] / 1000:7.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
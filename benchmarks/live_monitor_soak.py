@@ -0,0 +1,166 @@
+"""ライブモニターの長時間試験（ソークテスト）: メモリの増加と更新時間の悪化を検出する。
+
+プロジェクターに映したライブモニターは1日中10秒ごとに更新される。ハーネスの偽シートに
+対して、--monitors 個のモニター（イベントごとの AppTest）を待ち時間なしで更新し続け、
+--hours 時間分（1ティック = --tick 秒として換算）を早回しで再現する。その間
+--register-every ティックごとに参加登録を1件加える。
+
+- tracemalloc のスナップショットを --snapshot-every ティックごとに取り、ウォームアップ後の
+  基準との差をコードの場所（ファイル:行）ごとに「1ティックあたりの増加量」で表示する
+- 確保中のメモリの増加の傾き（後半の1ティックあたり）が --max-growth-kb を超えるか、
+  更新時間の中央値が最初の区間の --max-latency-drift 倍を超えたら失敗（終了コード 1）
+
+AppTest は fragment だけを再実行できないため、1ティックは参加者画面全体の再実行になる。
+登録の registered_at は実際の時刻なので、時系列の区間は実時間の5分ごとに切り替わる。
+
+    python benchmarks/live_monitor_soak.py                   # 2時間分
+    python benchmarks/live_monitor_soak.py --hours 8 --monitors 3
+    python benchmarks/live_monitor_soak.py --hours 0.2 --snapshot-every 20
+"""
+import argparse
+import datetime
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+from harness import SAMPLE_EVENT_ID, fake_sheets, make_app, sample_data
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# 計測の対象外にする（計測自体やモジュールの読み込みによる確保）
+_IGNORED = ("<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>",
+            tracemalloc.__file__)
+
+
+def _open_monitors(data, count):
+    event_ids = [SAMPLE_EVENT_ID] + [e for e in data["events"]["event_id"] if e != SAMPLE_EVENT_ID][:count - 1]
+    monitors = []
+    for event_id in event_ids:
+        at = make_app("participant")
+        if monitors:
+            # 同じサーバーのタブとして、共有キャッシュは1つにする
+            at.secrets["general"] = monitors[0][1].secrets["general"]
+        at.query_params["event_id"] = event_id
+        at.run()
+        at.sidebar.radio[0].set_value("ライブモニター").run()
+        if at.exception:
+            raise RuntimeError([e.value for e in at.exception])
+        monitors.append((event_id, at))
+    return monitors
+
+
+def _register(data, event_id, rng):
+    """他の端末からの参加登録の代わりに、偽シートへ1行加える。"""
+    import pandas as pd
+
+    participants = data["participants"]
+    row = participants.iloc[rng.randrange(len(participants))].to_dict()
+    row.update({
+        "participant_id": uuid.uuid4().hex,
+        "row_revision": 1,
+        "event_id": event_id,
+        "name": f"ソーク{len(participants)}",
+        "people": rng.randint(1, 8),
+        "registered_at": datetime.datetime.now(JST).isoformat(timespec="seconds"),
+    })
+    data["participants"] = pd.concat([participants, pd.DataFrame([row])], ignore_index=True)
+
+
+def _publish_participants(at):
+    from ecoride.sharedcache import SharedCache
+
+    SharedCache(at.secrets["general"]["shared_cache_path"]).publish("participants")
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, f) for f in _IGNORED])
+
+
+def _slope(points):
+    """(ティック, バイト) の後半の最小二乗の傾き。
+
+    上限のあるキャッシュ（グラフ・集計）が埋まるまでの増加は前半に出るので、後半だけで判定する。
+    """
+    points = points[len(points) // 2:]
+    if len(points) < 2:
+        return 0.0
+    xs, ys = zip(*points)
+    return statistics.linear_regression(xs, ys).slope
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=2.0, help="再現するイベントの長さ（時間）")
+    parser.add_argument("--tick", type=float, default=10.0, help="1ティックが表す秒数（run_every と同じ）")
+    parser.add_argument("--monitors", type=int, default=2)
+    parser.add_argument("--register-every", type=int, default=6, help="参加登録を1件加える間隔（ティック数）")
+    parser.add_argument("--warmup", type=int, default=30, help="基準を取る前に捨てるティック数")
+    parser.add_argument("--snapshot-every", type=int, default=60)
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc が記録するスタックの深さ")
+    parser.add_argument("--top", type=int, default=10, help="表示する増加箇所の数")
+    parser.add_argument("--max-growth-kb", type=float, default=16.0, help="許容するメモリ増加 [KB/ティック]")
+    parser.add_argument("--max-latency-drift", type=float, default=1.5, help="許容する更新時間の悪化（倍率）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ticks = max(int(args.hours * 3600 / args.tick), args.warmup + 2 * args.snapshot_every)
+    rng = random.Random(args.seed)
+    data = sample_data(seed=args.seed)
+
+    tracemalloc.start(args.frames)
+    with fake_sheets(data):
+        monitors = _open_monitors(data, args.monitors)
+        latencies, memory = [], []
+        baseline = None
+        t_start = time.perf_counter()
+        for tick in range(ticks):
+            if tick and tick % args.register_every == 0:
+                _register(data, monitors[tick % len(monitors)][0], rng)
+                _publish_participants(monitors[0][1])
+            t0 = time.perf_counter()
+            for _, at in monitors:
+                at.run()
+                if at.exception:
+                    raise RuntimeError([e.value for e in at.exception])
+            latencies.append((time.perf_counter() - t0) / len(monitors))
+
+            if tick == args.warmup:
+                baseline = _snapshot()
+            if tick >= args.warmup and (tick - args.warmup) % args.snapshot_every == 0:
+                memory.append((tick, tracemalloc.get_traced_memory()[0]))
+                print(f"  tick {tick:6d}  traced {memory[-1][1] / 1e6:7.1f}MB  "
+                      f"median {statistics.median(latencies[-args.snapshot_every:]) * 1000:6.1f}ms/monitor",
+                      flush=True)
+        final = _snapshot()
+        memory.append((ticks - 1, tracemalloc.get_traced_memory()[0]))
+    tracemalloc.stop()
+
+    measured = ticks - 1 - args.warmup
+    growth = _slope(memory)
+    first = statistics.median(latencies[args.warmup:args.warmup + args.snapshot_every])
+    last = statistics.median(latencies[-args.snapshot_every:])
+    drift = last / first
+
+    print(f"simulated   {ticks} ticks × {len(monitors)} monitors ({ticks * args.tick / 3600:.1f}h)"
+          f" in {time.perf_counter() - t_start:.0f}s, {len(data['participants'])} participants at the end")
+    print(f"memory      {growth / 1024:+.2f} KB/tick (limit {args.max_growth_kb:.1f})")
+    print(f"latency     {first * 1000:.1f}ms → {last * 1000:.1f}ms per monitor ({drift:.2f}x, limit {args.max_latency_drift:.2f}x)")
+    print(f"top {args.top} growth by location since tick {args.warmup}:")
+    for stat in final.compare_to(baseline, "lineno")[:args.top]:
+        frame = stat.traceback[0]
+        print(f"  {stat.size_diff / measured:+10.0f} B/tick  {stat.count_diff:+7d} blocks  {frame.filename}:{frame.lineno}")
+
+    failed = []
+    if growth > args.max_growth_kb * 1024:
+        failed.append("memory growth")
+    if drift > args.max_latency_drift:
+        failed.append("latency drift")
+    print("result     ", "FAIL (" + ", ".join(failed) + ")" if failed else "ok")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""コールドスタート計測: 管理画面と参加者画面の初回描画までの時間。
+
+各計測は新しい Python プロセスで行うので、import キャッシュの無い状態を再現できる。
+
+    python benchmarks/startup_bench.py            # 両画面を 5 回ずつ
+    python benchmarks/startup_bench.py -n 10 admin
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+_T0 = time.perf_counter()
+
+# plotly 本体は streamlit の import 時に読み込まれる（Plotly のテーマ設定）ので、アプリが遅延させられる
+# plotly.express を数える
+HEAVY_MODULES = ("plotly.express", "qrcode", "requests", "streamlit_gsheets", "gspread", "pyarrow")
+MODES = ("admin", "participant")
+
+
+def _child(mode: str) -> None:
+    import streamlit  # noqa: F401  （ハーネス側の import として分けて計測する）
+    t_streamlit = time.perf_counter()
+    # ハーネスは差し替えのために streamlit_gsheets（と gspread・requests）を読み込むので、その前に記録する
+    # （アプリも最初のシート読み込みで streamlit_gsheets を読み込むので、本番と同じものが数えられる）
+    before = set(sys.modules)
+
+    from harness import fake_sheets, make_app, sample_data
+
+    with fake_sheets(sample_data()):
+        at = make_app(mode)
+        t_start = time.perf_counter()
+        at.run()
+        t_render = time.perf_counter()
+
+    loaded = sorted(m for m in HEAVY_MODULES if m in sys.modules and m not in before)
+    print(json.dumps({
+        "streamlit_import_s": t_streamlit - _T0,
+        "first_render_s": t_render - t_start,
+        "total_s": t_render - _T0,
+        "exceptions": [str(e.value) for e in at.exception],
+        "loaded": loaded,
+    }))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modes", nargs="*", metavar="{admin,participant}", default=list(MODES))
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode: {', '.join(sorted(unknown))}")
+
+    print(f"{'mode':12s} {'render(med)':>12s} {'render(min)':>12s} {'total(med)':>11s}  heavy modules imported by app")
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode],
+                check=True, capture_output=True, text=True,
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            if result["exceptions"]:
+                print(f"{mode}: app raised {result['exceptions']}", file=sys.stderr)
+                return 1
+            runs.append(result)
+        render = [r["first_render_s"] for r in runs]
+        total = [r["total_s"] for r in runs]
+        print(
+            f"{mode:12s} {statistics.median(render) * 1000:10.0f}ms {min(render) * 1000:10.0f}ms "
+            f"{statistics.median(total) * 1000:9.0f}ms  {', '.join(runs[0]['loaded']) or '-'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        _child(sys.argv[2])
+    else:
+        sys.exit(main())
@@ -1,32 +1,69 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import math
+import numpy as np
 import uuid
-import requests
-import re
-import qrcode
 import io
-from streamlit_gsheets import GSheetsConnection
-
-# --- 設定・定数 ---
-CO2_EMISSION_FACTORS = {
-    "ガソリン車 (普通) | 14km/L": 166,
-    "ガソリン車 (大型・ミニバン) | 9km/L": 258,
-    "軽自動車 | 16km/L": 145,
-    "ディーゼル車 | 13km/L": 198,
-    "ハイブリッド車 | 22km/L": 105,
-    "電気自動車 (EV) | 走行時ゼロ": 0,
-}
-
-MAX_CAPACITY = {
-    "ガソリン車 (普通) | 14km/L": 5,
-    "ガソリン車 (大型・ミニバン) | 9km/L": 8,
-    "軽自動車 | 16km/L": 4,
-    "ディーゼル車 | 13km/L": 5,
-    "ハイブリッド車 | 22km/L": 5,
-    "電気自動車 (EV) | 走行時ゼロ": 5,
-}
+import math
+import functools
+import html
+import datetime
+import logging
+import tempfile
+import time
+from pathlib import Path
+from ecoride import archive, maps
+from ecoride.carpool import grid_cells, plan_carpool
+from ecoride.charts import co2_bar_figure
+from ecoride.concurrency import (
+    ID_COLUMN,
+    REVISION_COLUMN,
+    ConflictError,
+    Delete,
+    Insert,
+    SheetCommitter,
+    Update,
+    WholeSheetStore,
+    ensure_ids,
+    live_rows,
+    new_participant_id,
+)
+from ecoride.dedup import IDEMPOTENCY_WINDOW, RegistrationIndex, registration_key
+from ecoride.export import (
+    REPORT_COLUMNS,
+    ChunkStream,
+    display_frame,
+    iter_csv,
+    iter_parquet,
+    iter_summary_html,
+)
+from ecoride.geo import SOURCE_ESTIMATED, SOURCE_MEASURED, estimate_road_km
+from ecoride.maps import DistanceRefiner, MapsError, MapsUnavailable
+from ecoride.prewarm import Prewarmer, upcoming_event_ids
+from ecoride.sheets import WorksheetStore, batch_read
+from ecoride.ratelimit import JST, DailyQuota, TokenBucket
+from ecoride.regions import MunicipalityTally, get_city_level_address, leaderboard, normalize_addresses
+from ecoride.scenarios import reduction_grid
+from ecoride.sharedcache import SharedCache
+from ecoride.stats import (
+    CEDAR_KG_PER_TREE,
+    CO2_EMISSION_FACTORS,
+    MODEL_VERSION,
+    SUM_COLUMNS,
+    VEHICLE_MODEL,
+    add_summary_columns,
+    aggregate_by_event,
+    emission_rows,
+    frame_revision,
+    monthly_trend,
+    overall_totals,
+    with_event_info,
+)
+from ecoride.theme import PALETTES, ensure_theme_assets
+from ecoride.timeline import BUCKET, TimelineTally
+from ecoride.vehicles import split_car_info
+
+# plotly / qrcode / requests / streamlit_gsheets は重いので各関数内で初回使用時に import する。
+# 管理画面ではグラフも QR も描かないため、起動直後の読み込み時間を短縮できる。
 
 # ページ設定
 st.set_page_config(
@@ -36,6 +73,7 @@ st.set_page_config(
 )
 
 # --- SVG アイコン定義（Feather Icons ベース） ---
+@functools.lru_cache(maxsize=None)
 def _icon(inner, size=28, color="currentColor"):
     return (
         f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
@@ -70,887 +108,556 @@ _P_PARKING = (
 )
 
 # --- カラーテーマ ---
-_C = {
-    "normal": {
-        "bar_solo":   "#EF5350",
-        "bar_share":  "#66BB6A",
-        "bar_text":   "white",
-        "grid":       "rgba(200,230,201,0.6)",
-        "chart_font": "#1A2B1A",
-        "car_solo":   "#EF5350",
-        "car_share":  "#66BB6A",
-        "car_arrow":  "#888",
-        "reduce_txt": "#66BB6A",
-        "reduce_bg":  "rgba(102,187,106,0.18)",
-        "icon":       "#2E7D32",
-    },
-    "hc": {
-        "bar_solo":   "#CC0000",
-        "bar_share":  "#005500",
-        "bar_text":   "white",
-        "grid":       "rgba(0,0,0,0.4)",
-        "chart_font": "#000000",
-        "car_solo":   "#CC0000",
-        "car_share":  "#005500",
-        "car_arrow":  "#000000",
-        "reduce_txt": "#FFFFFF",
-        "reduce_bg":  "rgba(0,100,0,0.9)",
-        "icon":       "#005500",
-    },
-}
+_C = PALETTES
+
+def _theme():
+    return "hc" if st.session_state.get("hc_mode", False) else "normal"
 
 
 # --- UI ヘルパー関数 ---
 
-def inject_head_icons():
-    """Apple Touch / Android / manifest の <link> タグを body 内に注入する。
-    favicon は st.set_page_config に任せ、components.html は使わない。"""
-    st.markdown("""
+_HEAD_ICON_LINKS = """
 <link rel="apple-touch-icon"             href="/app/static/apple-touch-icon.png">
 <link rel="apple-touch-icon" sizes="152x152" href="/app/static/apple-touch-icon-152x152.png">
 <link rel="apple-touch-icon" sizes="167x167" href="/app/static/apple-touch-icon-167x167.png">
 <link rel="apple-touch-icon" sizes="180x180" href="/app/static/apple-touch-icon-180x180.png">
 <link rel="manifest"                     href="/app/static/site.webmanifest">
-""", unsafe_allow_html=True)
-
-
-def inject_css():
-    st.markdown("""
-    <style>
-    /* ===== アニメーション定義 ===== */
-    @keyframes fadeSlideUp {
-        from { opacity: 0; transform: translateY(20px); }
-        to   { opacity: 1; transform: translateY(0); }
-    }
-    @keyframes heroFadeIn {
-        from { opacity: 0; transform: scale(0.97); }
-        to   { opacity: 1; transform: scale(1); }
-    }
-    @keyframes pulseLive {
-        0%, 100% { opacity: 1; }
-        50%       { opacity: 0.3; }
-    }
-
-    /* ===== グローバル（モード共通） ===== */
-    * { box-sizing: border-box; }
-
-    .block-container {
-        padding-top: 2rem !important;
-        padding-bottom: 2rem !important;
-        max-width: 1600px !important;
-    }
-
-    /* ===== ボタン（モード共通） ===== */
-    .stButton > button {
-        background: linear-gradient(135deg, #2E7D32 0%, #43A047 100%) !important;
-        color: #FFFFFF !important;
-        border: none !important;
-        border-radius: 10px !important;
-        padding: 0.55rem 1.4rem !important;
-        font-weight: 600 !important;
-        font-size: 0.9rem !important;
-        transition: all 0.25s ease !important;
-        box-shadow: 0 3px 10px rgba(46,125,50,0.30) !important;
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 6px 20px rgba(46,125,50,0.45) !important;
-        background: linear-gradient(135deg, #1B5E20 0%, #2E7D32 100%) !important;
-    }
-    .stButton > button:active { transform: translateY(0) !important; }
-    .stButton > button[kind="primary"] {
-        background: linear-gradient(135deg, #B71C1C 0%, #E53935 100%) !important;
-        box-shadow: 0 3px 10px rgba(183,28,28,0.30) !important;
-    }
-    .stButton > button[kind="primary"]:hover {
-        background: linear-gradient(135deg, #7F0000 0%, #B71C1C 100%) !important;
-        box-shadow: 0 6px 20px rgba(183,28,28,0.45) !important;
-    }
-    .stButton > button *, .stButton > button { color: #FFFFFF !important; }
-
-    /* ===== フォーム送信ボタン（モード共通） ===== */
-    [data-testid="stFormSubmitButton"] > button {
-        background: linear-gradient(135deg, #2E7D32 0%, #43A047 100%) !important;
-        color: #FFFFFF !important;
-        border: none !important;
-        border-radius: 10px !important;
-        font-weight: 600 !important;
-        transition: all 0.25s ease !important;
-        box-shadow: 0 3px 10px rgba(46,125,50,0.30) !important;
-        width: 100% !important;
-    }
-    [data-testid="stFormSubmitButton"] > button:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 6px 20px rgba(46,125,50,0.45) !important;
-    }
-    [data-testid="stFormSubmitButton"] > button,
-    [data-testid="stFormSubmitButton"] > button *,
-    [data-testid="stExpander"] [data-testid="stFormSubmitButton"] > button,
-    [data-testid="stExpander"] [data-testid="stFormSubmitButton"] > button *,
-    button[kind="secondaryFormSubmit"],
-    button[kind="secondaryFormSubmit"] *,
-    button[kind="primaryFormSubmit"],
-    button[kind="primaryFormSubmit"] * { color: #FFFFFF !important; }
-
-    /* ===== リンクボタン（モード共通） ===== */
-    .stLinkButton > a {
-        background: linear-gradient(135deg, #2E7D32 0%, #43A047 100%) !important;
-        color: #FFFFFF !important;
-        border-radius: 10px !important;
-        border: none !important;
-        font-weight: 600 !important;
-        padding: 0.5rem 1.2rem !important;
-        box-shadow: 0 3px 10px rgba(46,125,50,0.30) !important;
-        transition: all 0.25s ease !important;
-    }
-    .stLinkButton > a:hover {
-        transform: translateY(-2px) !important;
-        box-shadow: 0 6px 20px rgba(46,125,50,0.45) !important;
-    }
-    .stLinkButton > a, .stLinkButton > a * { color: #FFFFFF !important; }
-
-    /* ===== タブ アクティブ（モード共通） ===== */
-    .stTabs [aria-selected="true"] {
-        background: linear-gradient(135deg, #2E7D32 0%, #43A047 100%) !important;
-        color: #FFFFFF !important;
-        box-shadow: 0 3px 10px rgba(46,125,50,0.3) !important;
-    }
-    .stTabs [aria-selected="true"],
-    .stTabs [aria-selected="true"] * { color: #FFFFFF !important; }
-
-    /* ===== ヒーローヘッダー（モード共通） ===== */
-    .hero-header {
-        background: linear-gradient(135deg, #1B5E20 0%, #2E7D32 50%, #43A047 100%);
-        border-radius: 18px;
-        padding: 2.2rem 2.5rem 1.8rem;
-        color: white;
-        margin-bottom: 1.8rem;
-        animation: heroFadeIn 0.6s ease both;
-        position: relative;
-        overflow: hidden;
-        display: flex;
-        align-items: center;
-        gap: 1.4rem;
-    }
-    .hero-header::before {
-        content: '';
-        position: absolute;
-        top: -40%; right: -10%;
-        width: 350px; height: 350px;
-        border-radius: 50%;
-        background: rgba(255,255,255,0.06);
-        pointer-events: none;
-    }
-    .hero-icon-wrap {
-        flex-shrink: 0;
-        width: 56px; height: 56px;
-        background: rgba(255,255,255,0.15);
-        border-radius: 14px;
-        display: flex; align-items: center; justify-content: center;
-    }
-    .hero-text { flex: 1; }
-    .hero-title {
-        font-size: 1.75rem !important;
-        font-weight: 700 !important;
-        margin: 0 0 0.3rem !important;
-        color: white !important;
-        line-height: 1.3 !important;
-    }
-    .hero-subtitle {
-        font-size: 0.95rem;
-        color: rgba(255,255,255,0.85) !important;
-        margin: 0;
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-    }
-    .hero-header, .hero-header * { color: white !important; }
-
-    /* ===== LIVE バッジ（モード共通） ===== */
-    .live-badge {
-        display: inline-flex;
-        align-items: center;
-        gap: 6px;
-        background: rgba(198,40,40,0.15);
-        color: #EF5350;
-        font-size: 0.78rem;
-        font-weight: 700;
-        padding: 3px 10px;
-        border-radius: 999px;
-        letter-spacing: 0.05em;
-        margin-left: 10px;
-        vertical-align: middle;
-    }
-    .live-dot {
-        width: 8px; height: 8px;
-        background: #E53935;
-        border-radius: 50%;
-        display: inline-block;
-        animation: pulseLive 1.2s ease-in-out infinite;
-    }
-    .live-monitor-header {
-        display: flex;
-        align-items: center;
-        margin-bottom: 0.5rem;
-    }
-
-    /* ===== カスタムメトリクスカード 構造（モード共通） ===== */
-    .metric-card {
-        flex: 1;
-        border-radius: 16px;
-        padding: 1.4rem 1.2rem;
-        text-align: center;
-        animation: fadeSlideUp 0.5s ease both;
-        transition: transform 0.25s ease, box-shadow 0.25s ease;
-        cursor: default;
-    }
-    .metric-card:hover { transform: translateY(-5px); }
-    .metric-card:nth-child(2) { animation-delay: 0.1s; }
-    .metric-card:nth-child(3) { animation-delay: 0.2s; }
-    .metric-card-icon {
-        margin-bottom: 0.6rem;
-        display: flex;
-        justify-content: center;
-    }
-    .metric-card-value {
-        font-size: 1.6rem;
-        font-weight: 700;
-        line-height: 1.2;
-        margin-bottom: 0.3rem;
-    }
-    .metric-card-label {
-        font-size: 0.8rem;
-        font-weight: 500;
-    }
-
-    /* ===== alert ===== */
-    [data-testid="stAlert"] {
-        border-radius: 12px !important;
-        border: none !important;
-        font-weight: 500 !important;
-    }
-
-    /* ===== spinner ===== */
-    .stSpinner > div { border-top-color: #43A047 !important; }
-
-    /* ===== section-divider（ライト） ===== */
-    .section-divider {
-        border: none;
-        margin: 1.5rem 0;
-    }
-
-    /* ============================================================
-       ライトモード
-    ============================================================ */
-    @media (prefers-color-scheme: light) {
-        html, body, .stApp,
-        [data-testid="stAppViewContainer"],
-        [data-testid="stMain"],
-        [data-testid="stMain"] > div,
-        .main, .main > div {
-            background: linear-gradient(160deg, #EFF6EF 0%, #F5F9F5 50%, #EEF4EE 100%) !important;
-        }
-        [data-testid="stHeader"] {
-            background: rgba(239,246,239,0.92) !important;
-            backdrop-filter: blur(8px) !important;
-            border-bottom: 1px solid #C8E6C9 !important;
-        }
-        [data-testid="stSidebar"] {
-            background: #FFFFFF !important;
-            border-right: 3px solid #C8E6C9 !important;
-            box-shadow: 2px 0 12px rgba(46,125,50,0.08) !important;
-        }
-        .stTabs [data-baseweb="tab-list"] {
-            background: #FFFFFF !important;
-            border-radius: 12px !important;
-            padding: 4px !important;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.06) !important;
-            gap: 4px !important;
-        }
-        .stTabs [data-baseweb="tab"] {
-            border-radius: 9px !important;
-            font-weight: 500 !important;
-            padding: 0.5rem 1.2rem !important;
-            color: #2A3A2A !important;
-            transition: all 0.2s ease !important;
-        }
-        [data-testid="stExpander"] {
-            background: #FFFFFF !important;
-            border-radius: 12px !important;
-            border: 1px solid #E8F5E9 !important;
-            box-shadow: 0 2px 8px rgba(46,125,50,0.08) !important;
-            margin-bottom: 0.75rem !important;
-            overflow: hidden !important;
-            transition: box-shadow 0.25s ease !important;
-        }
-        [data-testid="stExpander"]:hover {
-            box-shadow: 0 6px 18px rgba(46,125,50,0.15) !important;
-        }
-        [data-testid="stVerticalBlockBorderWrapper"] > div {
-            background: #FFFFFF !important;
-            border-radius: 14px !important;
-            border: 2px solid #A5D6A7 !important;
-            border-left: 6px solid #43A047 !important;
-            box-shadow: 0 4px 16px rgba(46,125,50,0.13) !important;
-            margin-bottom: 1.1rem !important;
-            transition: box-shadow 0.25s ease, transform 0.25s ease !important;
-        }
-        [data-testid="stVerticalBlockBorderWrapper"] > div:hover {
-            box-shadow: 0 10px 28px rgba(46,125,50,0.2) !important;
-            transform: translateY(-3px) !important;
-        }
-        [data-testid="stMetric"] {
-            background: #FFFFFF !important;
-            border-radius: 14px !important;
-            padding: 1.2rem 1.4rem !important;
-            box-shadow: 0 3px 12px rgba(46,125,50,0.1) !important;
-            border: 1px solid #E8F5E9 !important;
-            animation: fadeSlideUp 0.5s ease forwards !important;
-            transition: box-shadow 0.25s, transform 0.25s !important;
-        }
-        [data-testid="stMetric"]:hover {
-            box-shadow: 0 8px 24px rgba(46,125,50,0.18) !important;
-            transform: translateY(-3px) !important;
-        }
-        [data-testid="stMetricValue"] { font-size: 1.8rem !important; font-weight: 700 !important; color: #2E7D32 !important; }
-        [data-testid="stMetricLabel"] { font-weight: 500 !important; color: #5C6B5C !important; }
-        [data-testid="stMetricLabel"] p,
-        [data-testid="stMetricLabel"] span { color: #5C6B5C !important; }
-        [data-testid="stDataFrame"] {
-            border-radius: 12px !important;
-            overflow: hidden !important;
-            box-shadow: 0 2px 10px rgba(46,125,50,0.08) !important;
-            border: 1px solid #E8F5E9 !important;
-        }
-        .stTextInput > div > div > input,
-        .stNumberInput > div > div > input,
-        .stSelectbox > div > div {
-            border-radius: 8px !important;
-            border: 1.5px solid #C8E6C9 !important;
-            background: #FAFFFE !important;
-            color: #1A2B1A !important;
-            transition: border-color 0.2s, box-shadow 0.2s !important;
-        }
-        .stTextInput > div > div > input:focus,
-        .stNumberInput > div > div > input:focus {
-            border-color: #43A047 !important;
-            box-shadow: 0 0 0 3px rgba(67,160,71,0.15) !important;
-        }
-        /* テキスト色 */
-        .stApp { color: #1A2B1A !important; }
-        h1, h2, h3, h4, h5, h6 { color: #1A2B1A !important; }
-        [data-testid="stMarkdownContainer"] p,
-        [data-testid="stMarkdownContainer"] li,
-        [data-testid="stMarkdownContainer"] strong,
-        [data-testid="stMarkdownContainer"] em,
-        [data-testid="stMarkdownContainer"] span { color: #1A2B1A !important; }
-        [data-testid="stSidebar"],
-        [data-testid="stSidebar"] p,
-        [data-testid="stSidebar"] label,
-        [data-testid="stSidebar"] span,
-        [data-testid="stSidebar"] div { color: #1A2B1A !important; }
-        .stTextInput input, .stNumberInput input, .stTextArea textarea { color: #1A2B1A !important; }
-        .stTextInput label, .stNumberInput label, .stSelectbox label,
-        .stDateInput label, .stRadio label, .stRadio p { color: #2A3A2A !important; font-weight: 500 !important; }
-        .stSelectbox [data-baseweb="select"] div,
-        .stSelectbox [data-baseweb="select"] span,
-        .stSelectbox [data-baseweb="select"] input { color: #1A2B1A !important; }
-        [data-testid="stRadio"] label,
-        [data-testid="stRadio"] p,
-        [data-testid="stRadio"] span { color: #1A2B1A !important; }
-        [data-testid="stExpander"] summary p,
-        [data-testid="stExpander"] [data-testid="stMarkdownContainer"] p { color: #1A2B1A !important; }
-        [data-testid="stCaptionContainer"],
-        [data-testid="stCaptionContainer"] p { color: #4A5A4A !important; }
-        [data-testid="stTable"] th,
-        [data-testid="stTable"] td,
-        [data-testid="stTable"] p { color: #1A2B1A !important; }
-        .live-monitor-title { color: #1A2B1A; }
-        .metric-card {
-            background: #FFFFFF;
-            box-shadow: 0 4px 16px rgba(46,125,50,0.10);
-            border: 1px solid #E8F5E9;
-        }
-        .metric-card:hover { box-shadow: 0 10px 30px rgba(46,125,50,0.18); }
-        .metric-card-value { color: #2E7D32; }
-        .metric-card-label { color: #5C6B5C; }
-        .section-divider { border-top: 2px solid #E8F5E9; }
-        .event-card-url {
-            color: #7B9E7B;
-            background: #F1F8F1;
-        }
-        /* ボタン・リンク・タブの白文字（テキスト色ルールより後に記述して優先） */
-        .stButton > button,
-        .stButton > button * { color: #FFFFFF !important; }
-        [data-testid="stFormSubmitButton"] > button,
-        [data-testid="stFormSubmitButton"] > button *,
-        [data-testid="stExpander"] [data-testid="stFormSubmitButton"] > button,
-        [data-testid="stExpander"] [data-testid="stFormSubmitButton"] > button *,
-        button[kind="secondaryFormSubmit"],
-        button[kind="secondaryFormSubmit"] *,
-        button[kind="primaryFormSubmit"],
-        button[kind="primaryFormSubmit"] * { color: #FFFFFF !important; }
-        .stLinkButton > a,
-        .stLinkButton > a * { color: #FFFFFF !important; }
-        .stTabs [aria-selected="true"],
-        .stTabs [aria-selected="true"] * { color: #FFFFFF !important; }
-        /* hero-header: stMarkdownContainer と組み合わせて詳細度を (0,2,1) に */
-        .hero-header, .hero-header *,
-        [data-testid="stMarkdownContainer"] .hero-header,
-        [data-testid="stMarkdownContainer"] .hero-header * { color: #FFFFFF !important; }
-        /* イベントカード内のイベント名（h3）を白文字に */
-        [data-testid="stVerticalBlockBorderWrapper"] h3,
-        [data-testid="stVerticalBlockBorderWrapper"] [data-testid="stMarkdownContainer"] h3 { color: #FFFFFF !important; }
-    }
-
-    /* ============================================================
-       ダークモード
-    ============================================================ */
-    @media (prefers-color-scheme: dark) {
-        html, body, .stApp,
-        [data-testid="stAppViewContainer"],
-        [data-testid="stMain"],
-        [data-testid="stMain"] > div,
-        .main, .main > div {
-            background: linear-gradient(160deg, #0C1A0C 0%, #111D11 50%, #0E1B0E 100%) !important;
-        }
-        [data-testid="stHeader"] {
-            background: rgba(12,26,12,0.92) !important;
-            backdrop-filter: blur(8px) !important;
-            border-bottom: 1px solid #2A4A2A !important;
-        }
-        [data-testid="stSidebar"] {
-            background: #111E11 !important;
-            border-right: 3px solid #2A4A2A !important;
-            box-shadow: 2px 0 12px rgba(0,0,0,0.3) !important;
-        }
-        .stTabs [data-baseweb="tab-list"] {
-            background: #1A2E1A !important;
-            border-radius: 12px !important;
-            padding: 4px !important;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.3) !important;
-            gap: 4px !important;
-        }
-        .stTabs [data-baseweb="tab"] {
-            border-radius: 9px !important;
-            font-weight: 500 !important;
-            padding: 0.5rem 1.2rem !important;
-            color: #A5C8A5 !important;
-            transition: all 0.2s ease !important;
-        }
-        [data-testid="stExpander"] {
-            background: #1A2E1A !important;
-            border-radius: 12px !important;
-            border: 1px solid #2A4A2A !important;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.25) !important;
-            margin-bottom: 0.75rem !important;
-            overflow: hidden !important;
-            transition: box-shadow 0.25s ease !important;
-        }
-        [data-testid="stExpander"]:hover {
-            box-shadow: 0 6px 18px rgba(0,0,0,0.4) !important;
-        }
-        [data-testid="stVerticalBlockBorderWrapper"] > div {
-            background: #1A2E1A !important;
-            border-radius: 14px !important;
-            border: 2px solid #2A4A2A !important;
-            border-left: 6px solid #43A047 !important;
-            box-shadow: 0 4px 16px rgba(0,0,0,0.3) !important;
-            margin-bottom: 1.1rem !important;
-            transition: box-shadow 0.25s ease, transform 0.25s ease !important;
-        }
-        [data-testid="stVerticalBlockBorderWrapper"] > div:hover {
-            box-shadow: 0 10px 28px rgba(0,0,0,0.45) !important;
-            transform: translateY(-3px) !important;
-        }
-        [data-testid="stMetric"] {
-            background: #1A2E1A !important;
-            border-radius: 14px !important;
-            padding: 1.2rem 1.4rem !important;
-            box-shadow: 0 3px 12px rgba(0,0,0,0.3) !important;
-            border: 1px solid #2A4A2A !important;
-            animation: fadeSlideUp 0.5s ease forwards !important;
-            transition: box-shadow 0.25s, transform 0.25s !important;
-        }
-        [data-testid="stMetric"]:hover {
-            box-shadow: 0 8px 24px rgba(0,0,0,0.45) !important;
-            transform: translateY(-3px) !important;
-        }
-        [data-testid="stMetricValue"] { font-size: 1.8rem !important; font-weight: 700 !important; color: #66BB6A !important; }
-        [data-testid="stMetricLabel"] { font-weight: 500 !important; color: #8BAF8B !important; }
-        [data-testid="stMetricLabel"] p,
-        [data-testid="stMetricLabel"] span { color: #8BAF8B !important; }
-        [data-testid="stDataFrame"] {
-            border-radius: 12px !important;
-            overflow: hidden !important;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.3) !important;
-            border: 1px solid #2A4A2A !important;
-        }
-        .stTextInput > div > div > input,
-        .stNumberInput > div > div > input,
-        .stSelectbox > div > div {
-            border-radius: 8px !important;
-            border: 1.5px solid #2A4A2A !important;
-            background: #1C341C !important;
-            color: #C8E6C8 !important;
-            transition: border-color 0.2s, box-shadow 0.2s !important;
-        }
-        .stTextInput > div > div > input:focus,
-        .stNumberInput > div > div > input:focus {
-            border-color: #66BB6A !important;
-            box-shadow: 0 0 0 3px rgba(102,187,106,0.2) !important;
-        }
-        /* テキスト色 */
-        .stApp { color: #C8E6C8 !important; }
-        h1, h2, h3, h4, h5, h6 { color: #C8E6C8 !important; }
-        [data-testid="stMarkdownContainer"] p,
-        [data-testid="stMarkdownContainer"] li,
-        [data-testid="stMarkdownContainer"] strong,
-        [data-testid="stMarkdownContainer"] em,
-        [data-testid="stMarkdownContainer"] span { color: #C8E6C8 !important; }
-        [data-testid="stSidebar"],
-        [data-testid="stSidebar"] p,
-        [data-testid="stSidebar"] label,
-        [data-testid="stSidebar"] span,
-        [data-testid="stSidebar"] div { color: #C8E6C8 !important; }
-        .stTextInput input, .stNumberInput input, .stTextArea textarea { color: #C8E6C8 !important; }
-        .stTextInput label, .stNumberInput label, .stSelectbox label,
-        .stDateInput label, .stRadio label, .stRadio p { color: #A5C8A5 !important; font-weight: 500 !important; }
-        .stSelectbox [data-baseweb="select"] div,
-        .stSelectbox [data-baseweb="select"] span,
-        .stSelectbox [data-baseweb="select"] input { color: #C8E6C8 !important; }
-        [data-testid="stRadio"] label,
-        [data-testid="stRadio"] p,
-        [data-testid="stRadio"] span { color: #C8E6C8 !important; }
-        [data-testid="stExpander"] summary p,
-        [data-testid="stExpander"] [data-testid="stMarkdownContainer"] p { color: #C8E6C8 !important; }
-        [data-testid="stCaptionContainer"],
-        [data-testid="stCaptionContainer"] p { color: #8BAF8B !important; }
-        [data-testid="stTable"] th,
-        [data-testid="stTable"] td,
-        [data-testid="stTable"] p { color: #C8E6C8 !important; }
-        .live-monitor-title { color: #C8E6C8; }
-        .metric-card {
-            background: #1A2E1A;
-            box-shadow: 0 4px 16px rgba(0,0,0,0.3);
-            border: 1px solid #2A4A2A;
-        }
-        .metric-card:hover { box-shadow: 0 10px 30px rgba(0,0,0,0.45); }
-        .metric-card-value { color: #66BB6A; }
-        .metric-card-label { color: #8BAF8B; }
-        .section-divider { border-top: 2px solid #2A4A2A; }
-        .event-card-url {
-            color: #8BAF8B;
-            background: transparent;
-        }
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-
-def inject_hc_css():
-    st.markdown("""
-    <style>
-    /* ===== ハイコントラストモード上書き ===== */
-    body, .stApp,
-    [data-testid="stAppViewContainer"],
-    [data-testid="stMain"],
-    [data-testid="block-container"] {
-        background: #FFFFFF !important;
-        background-image: none !important;
-    }
-    [data-testid="stHeader"] {
-        background: #FFFFFF !important;
-        border-bottom: 3px solid #000000 !important;
-    }
-    [data-testid="stSidebar"] {
-        background: #F0F0F0 !important;
-        background-image: none !important;
-        border-right: 3px solid #000000 !important;
-        box-shadow: none !important;
-    }
-    .stApp *, p, span, div, label,
-    [data-testid="stMarkdownContainer"],
-    [data-testid="stCaptionContainer"],
-    [data-testid="stSidebar"] * {
-        color: #000000 !important;
-    }
-    .hero-header {
-        background: #005500 !important;
-        background-image: none !important;
-    }
-    .hero-header *, .hero-title, .hero-subtitle {
-        color: #FFFFFF !important;
-    }
-    .live-badge {
-        background: rgba(204,0,0,0.12) !important;
-        border: 1.5px solid #CC0000 !important;
-    }
-    .live-badge, .live-badge * { color: #CC0000 !important; }
-    .live-dot { background: #CC0000 !important; }
-    .metric-card {
-        background: #FFFFFF !important;
-        border: 2.5px solid #000000 !important;
-        box-shadow: none !important;
-    }
-    @media (prefers-color-scheme: light) {
-        .metric-card-value { color: #000000 !important; }
-        .metric-card-label { color: #333333 !important; }
-    }
-    @media (prefers-color-scheme: dark) {
-        .metric-card-value { color: #FFFFFF !important; }
-        .metric-card-label { color: #CCCCCC !important; }
-    }
-    .stButton > button,
-    [data-testid="stFormSubmitButton"] > button,
-    .stLinkButton > a {
-        background: #005500 !important;
-        background-image: none !important;
-        color: #FFFFFF !important;
-        border: 2px solid #000000 !important;
-        box-shadow: none !important;
-    }
-    .stButton > button *, [data-testid="stFormSubmitButton"] > button *,
-    .stLinkButton > a * { color: #FFFFFF !important; }
-    .stButton > button[kind="primary"],
-    [data-testid="stFormSubmitButton"] > button[kind="primary"] {
-        background: #990000 !important;
-        background-image: none !important;
-    }
-    .stTabs [data-baseweb="tab-list"] {
-        background: #FFFFFF !important;
-        border: 2px solid #000000 !important;
-        box-shadow: none !important;
-    }
-    .stTabs [data-baseweb="tab"] { color: #000000 !important; }
-    .stTabs [aria-selected="true"] {
-        background: #005500 !important;
-        background-image: none !important;
-        box-shadow: none !important;
-    }
-    .stTabs [aria-selected="true"] * { color: #FFFFFF !important; }
-    [data-testid="stExpander"] {
-        background: #FFFFFF !important;
-        border: 2px solid #000000 !important;
-        box-shadow: none !important;
-    }
-    [data-testid="stVerticalBlockBorderWrapper"] > div {
-        background: #FFFFFF !important;
-        border: 2.5px solid #000000 !important;
-        box-shadow: none !important;
-    }
-    .stTextInput input, .stNumberInput input {
-        background: #FFFFFF !important;
-        color: #000000 !important;
-        border: 2px solid #000000 !important;
-    }
-    .section-divider { border-top: 3px solid #000000 !important; }
-    </style>
-    """, unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def _theme_asset_urls() -> dict:
+    """CSS をビルドして static/ に書き出す（プロセスにつき1回）。"""
+    return ensure_theme_assets()
+
+
+def inject_head_icons():
+    """Apple Touch / Android / manifest の <link> タグを body 内に注入する。
+    favicon は st.set_page_config に任せ、components.html は使わない。"""
+    st.markdown(_HEAD_ICON_LINKS, unsafe_allow_html=True)
+
+
+def inject_css(hc_mode: bool = False):
+    """ビルド済みテーマ CSS への <link> タグだけを送る。CSS 本体は ecoride/css/ を参照。"""
+    urls = _theme_asset_urls()
+    links = f'<link rel="stylesheet" href="{urls["normal"]}">'
+    if hc_mode:
+        links += f'<link rel="stylesheet" href="{urls["hc"]}">'
+    st.markdown(links, unsafe_allow_html=True)
+
+
+_HERO_HEADER_HTML = (
+    '<div class="hero-header">'
+    '<div class="hero-icon-wrap">{icon}</div>'
+    '<div class="hero-text">'
+    '<h1 class="hero-title">{title}</h1>'
+    '<p class="hero-subtitle">{subtitle}</p>'
+    '</div></div>'
+)
+
+_METRIC_CARD_HTML = (
+    '<div class="metric-card">'
+    '<div class="metric-card-icon">{icon}</div>'
+    '<div class="metric-card-value">{value}</div>'
+    '<div class="metric-card-label">{label}</div>'
+    '</div>'
+)
+
+_CAR_COUNT_HTML = (
+    '<div class="car-count">'
+    '<div class="car-count-col">'
+    '<div class="car-count-label car-count-solo">1人1台の場合</div>'
+    '<div class="car-count-value car-count-solo">{solo}<span class="car-count-unit">台</span></div>'
+    '</div>'
+    '<div class="car-count-mid">'
+    '<div class="car-count-arrow">→</div>'
+    '<div class="car-count-reduce">▼ {reduction}台 削減</div>'
+    '</div>'
+    '<div class="car-count-col">'
+    '<div class="car-count-label car-count-share">相乗り</div>'
+    '<div class="car-count-value car-count-share">{share}<span class="car-count-unit">台</span></div>'
+    '</div></div>'
+)
 
 
 def render_hero_header(icon_svg: str, title: str, subtitle: str) -> None:
-    st.markdown(f"""
-    <div class="hero-header">
-        <div class="hero-icon-wrap">{icon_svg}</div>
-        <div class="hero-text">
-            <h1 class="hero-title">{title}</h1>
-            <p class="hero-subtitle">{subtitle}</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(
+        _HERO_HEADER_HTML.format(icon=icon_svg, title=title, subtitle=subtitle),
+        unsafe_allow_html=True,
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _metric_card_html(icon: str, value: str, label: str) -> str:
+    return _METRIC_CARD_HTML.format(icon=icon, value=value, label=label)
 
 
 def render_metric_cards(cards: list[dict]) -> None:
     cols = st.columns(len(cards))
     for col, c in zip(cols, cards):
         with col:
-            st.markdown(f"""
-<div class="metric-card">
-<div class="metric-card-icon">{c['icon']}</div>
-<div class="metric-card-value">{c['value']}</div>
-<div class="metric-card-label">{c['label']}</div>
-</div>
-""", unsafe_allow_html=True)
+            st.markdown(_metric_card_html(c['icon'], c['value'], c['label']), unsafe_allow_html=True)
 
 
 # --- 関数群 ---
 
-def get_city_level_address(address):
-    if not isinstance(address, str):
-        return str(address)
-    clean_addr = re.sub(r'日本、\s*〒\d{3}-\d{4}\s*', '', address)
-    match = re.search(r'(.+?[都道府県])(.+?[市区町村])', clean_addr)
-    if match:
-        return match.group(0)
-    return clean_addr
+# Maps API の呼び出し制限（全セッション共通）。secrets の [general] maps_qps /
+# maps_daily_budget で上書きできる。Google 側の上限・無料枠より十分低くしておく
+MAPS_QPS = 10
+MAPS_DAILY_BUDGET = 2000
+SUGGESTION_STORE_SIZE = 5000
+
+@st.cache_resource
+def maps_client(api_key):
+    general = st.secrets.get("general", {})
+    qps = float(general.get("maps_qps", MAPS_QPS))
+    return maps.MapsClient(
+        api_key,
+        limiter=TokenBucket(rate=qps, burst=qps),
+        quota=DailyQuota(int(general.get("maps_daily_budget", MAPS_DAILY_BUDGET))),
+    )
+
+@st.cache_resource
+def suggestion_store():
+    """検索語 → 候補のプロセス共通キャッシュ。上限到達後はここにある候補だけを返す。"""
+    return {}
 
 def get_place_suggestions(query, api_key):
     if not query: return []
-    url = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
-    params = {"input": query, "key": api_key, "language": "ja", "components": "country:jp"}
+    store = suggestion_store()
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        if data["status"] == "OK":
-            return [{"label": p["description"], "value": p["description"]} for p in data["predictions"]]
-    except Exception as e:
+        suggestions = maps_client(api_key).place_suggestions(query)
+    except MapsUnavailable:
+        return store.get(query, [])
+    except MapsError as e:
         st.error(f"場所検索エラー: {e}")
-    return []
+        return store.get(query, [])
+    if suggestions:
+        if len(store) >= SUGGESTION_STORE_SIZE:
+            store.pop(next(iter(store)), None)
+        store[query] = suggestions
+    return suggestions
+
+@st.cache_data(ttl=7 * 24 * 3600, show_spinner=False, max_entries=5000)
+def _geocode_cached(address, api_key):
+    # MapsError はキャッシュされないので、通信失敗は次回また問い合わせる
+    return maps_client(api_key).geocode(address)
+
+# geocode_lookup() で座標を取得できなかった理由
+GEOCODE_NOT_FOUND = "not_found"      # 該当する住所が無い（この結果はキャッシュされる）
+GEOCODE_UNAVAILABLE = "unavailable"  # 日次上限・レート制限・通信エラーで問い合わせられなかった
+
+def geocode_lookup(address, api_key):
+    """住所 → (座標, 取得できなかった理由)。取得できれば理由は None。"""
+    if not isinstance(address, str) or not address:
+        return None, GEOCODE_NOT_FOUND
+    try:
+        coords = _geocode_cached(address, api_key)
+    except MapsError:
+        return None, GEOCODE_UNAVAILABLE
+    return coords, None if coords else GEOCODE_NOT_FOUND
+
+def geocode_address(address, api_key):
+    """住所 → (緯度, 経度)。取得できなければ None。"""
+    return geocode_lookup(address, api_key)[0]
 
-def get_distance(origin, destination, api_key):
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {"origins": origin, "destinations": destination, "key": api_key, "language": "ja"}
+def known_start_coords(origin):
+    """同じ出発地で登録済みの行の座標（Maps に問い合わせられないときに使う）。無ければ None。"""
+    all_p = load_sheet("participants")
+    if all_p.empty or not {"start_point", "start_lat", "start_lon"} <= set(all_p.columns):
+        return None
+    rows = all_p.loc[all_p["start_point"] == origin, ["start_lat", "start_lon"]].apply(pd.to_numeric, errors="coerce")
+    rows = rows.dropna()
+    if rows.empty:
+        return None
+    return float(rows.iloc[-1]["start_lat"]), float(rows.iloc[-1]["start_lon"])
+
+def _coord(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def venue_coords(event_data, loc_addr, api_key):
+    """イベント会場の座標。events シートに無ければ住所からジオコーディングする。"""
+    lat, lon = _coord(event_data.get("location_lat")), _coord(event_data.get("location_lon"))
+    if lat is not None and lon is not None:
+        return lat, lon
+    return geocode_address(loc_addr, api_key)
+
+def resolve_distance(origin, loc_addr, venue, api_key):
+    """出発地から会場までの距離を求める。(距離, distance_source, 出発地の座標, ジオコーディングの失敗理由) を返す。
+
+    Distance Matrix で測れない（遅い・上限超過・到達不可）ときは、座標が分かれば
+    haversine × 道路係数の推定値を使う。どちらも無理なら距離は None。
+    ジオコーディングも Distance Matrix も1回ずつ日次上限を消費する。出発地が見つからなければ
+    Distance Matrix でも測れないので問い合わせない。Maps に問い合わせられなかったときは、
+    同じ出発地で登録済みの座標があれば推定に使う。
+    """
+    start, failure = geocode_lookup(origin, api_key)
+    if failure == GEOCODE_NOT_FOUND:
+        return None, None, None, failure
+    if failure == GEOCODE_UNAVAILABLE:
+        start = known_start_coords(origin)
+    try:
+        dist = maps_client(api_key).distance_km(origin, loc_addr)
+    except MapsError:
+        dist = None
+    if dist:
+        return dist, SOURCE_MEASURED, start, failure
+    if start and venue:
+        return float(estimate_road_km(start[0], start[1], venue[0], venue[1])), SOURCE_ESTIMATED, start, failure
+    return None, None, start, failure
+
+def recalculate_event_distances(current_event_id, loc_addr, venue, api_key, progress=None):
+    """会場の変更後、イベントの全参加者の距離を並列に測り直し、1回の書き込みで反映する。
+
+    測れなかった出発地は座標があれば推定値にする。(更新した行数, 更新できなかった行数) を返す。
+    """
+    all_p = load_sheet("participants")
+    if all_p.empty or "event_id" not in all_p.columns:
+        return 0, 0
+    event_rows = all_p["event_id"].astype(str) == str(current_event_id)
+    if not event_rows.any():
+        return 0, 0
+
+    starts = all_p.loc[event_rows, "start_point"]
+    measured = maps.distance_many(maps_client(api_key), starts, loc_addr, progress=progress)
+    km = starts.map(measured).astype(float)
+    source = pd.Series(SOURCE_MEASURED, index=km.index, dtype=object)
+
+    missing = km.isna()
+    if missing.any() and venue and {"start_lat", "start_lon"} <= set(all_p.columns):
+        coords = all_p.loc[km.index[missing], ["start_lat", "start_lon"]].apply(pd.to_numeric, errors="coerce")
+        km[missing] = estimate_road_km(coords["start_lat"], coords["start_lon"], venue[0], venue[1])
+        source[missing] = SOURCE_ESTIMATED
+
+    ok = km.notna()
+    if not ok.any():
+        return 0, int((~ok).sum())
+    # 行ごとに書き込み、測っている間に修正・削除された行だけを飛ばす
+    rows = all_p.loc[km.index[ok]]
+    written, conflicts = commit_participant_rows([
+        [Update(pid, {"distance": d, "distance_source": src}, rev)]
+        for pid, rev, d, src in zip(rows["participant_id"], rows[REVISION_COLUMN], km[ok], source[ok])
+    ])
+    return written, int((~ok).sum()) + conflicts
+
+@st.cache_resource
+def distance_refiner(api_key):
+    return DistanceRefiner(maps_client(api_key))
+
+def apply_refined_distances(all_p, current_event_id, loc_addr, api_key, request=True):
+    """推定距離の行を測り直した結果で置き換え、request なら残りの推定行の測り直しを依頼する。
+
+    置き換えがあれば participants シートに1回だけ書き込む（その間に修正された行は置き換えない）。
+    ライブモニターは10秒ごとに呼ぶので request=False にし、結果の反映だけを行う
+    （課金される問い合わせは登録時と参加者一覧の表示時にだけ依頼する）。
+    """
+    if all_p.empty or "distance_source" not in all_p.columns:
+        return all_p
+    refiner = distance_refiner(api_key)
+    event_rows = all_p["event_id"].astype(str) == str(current_event_id)
+    estimated = event_rows & (all_p["distance_source"] == SOURCE_ESTIMATED)
+    if not estimated.any():
+        return all_p
+
+    results = refiner.take_results(current_event_id)
+    changesets = []
+    for (origin, dest), km in results.items():
+        if dest != loc_addr:
+            continue
+        hit = estimated & (all_p["start_point"] == origin)
+        if hit.any():
+            changesets.extend(
+                [Update(pid, {"distance": km, "distance_source": SOURCE_MEASURED}, rev)]
+                for pid, rev in zip(all_p.loc[hit, "participant_id"], all_p.loc[hit, REVISION_COLUMN])
+            )
+            all_p.loc[hit, "distance"] = km
+            all_p.loc[hit, "distance_source"] = SOURCE_MEASURED
+            estimated &= ~hit
+    if changesets:
+        commit_participant_rows(changesets)
+
+    if request:
+        for origin in all_p.loc[estimated, "start_point"].dropna().unique():
+            refiner.request(current_event_id, origin, loc_addr)
+    return all_p
+
+def _sheets_connection():
+    from streamlit_gsheets import GSheetsConnection
+    return st.connection("gsheets", type=GSheetsConnection)
+
+# シート・集計のキャッシュ（SQLite）。場所は secrets の [general] shared_cache_path で変えられ、
+# 未設定ならこのホストの一時ディレクトリのファイルを使う。レプリカどうしで書き込みがすぐ見えるのは、
+# 同じホストで動き同じファイルを開いている場合だけ（コンテナなら同じボリュームを共有する）。
+# 別のホストのレプリカは同じファイルを共有できず（WAL モードの SQLite は NFS・SMB などの
+# ネットワークファイルシステムでは正しくロックできない）、他のホストでの書き込みは
+# SHEET_CACHE_TTL 秒後に見える。スプレッドシートを直接編集した場合も同じく SHEET_CACHE_TTL 秒後に読み直す
+SHEET_CACHE_TTL = 60
+DEFAULT_SHARED_CACHE_PATH = Path(tempfile.gettempdir()) / "ecoride" / "shared-cache.sqlite"
+
+logger = logging.getLogger(__name__)
+
+@st.cache_resource
+def _shared_cache(path):
+    if path == str(DEFAULT_SHARED_CACHE_PATH):
+        logger.warning(
+            "secrets の [general] shared_cache_path が未設定のため %s を使います。"
+            "同じホストのレプリカだけがキャッシュを共有します。", path,
+        )
+    return SharedCache(path, max_age=SHEET_CACHE_TTL)
+
+def shared_cache():
+    path = st.secrets.get("general", {}).get("shared_cache_path") or DEFAULT_SHARED_CACHE_PATH
+    return _shared_cache(str(path))
+
+@st.cache_resource(ttl=3600)
+def _spreadsheet():
+    """batchGet・行単位の書き込み用に gspread で開いたスプレッドシート。
+
+    接続と同じ secrets の [connections.gsheets] を使う。サービスアカウントでなければ
+    （公開 URL での接続など）None を返し、呼び出し側は接続経由で1枚ずつ読み書きする。
+    """
+    import gspread
+    creds = dict(st.secrets.get("connections", {}).get("gsheets", {}))
+    spreadsheet = creds.pop("spreadsheet", None)
+    creds.pop("worksheet", None)
+    if creds.get("type") != "service_account" or not spreadsheet:
+        return None
+    client = gspread.service_account_from_dict(creds)
+    if spreadsheet.startswith(("https://", "http://")):
+        return client.open_by_url(spreadsheet)
+    return client.open(spreadsheet)
+
+def _read_worksheets(worksheet_names):
+    """シート名 → DataFrame（読めなかったシートは None）。できれば1回の batchGet で読む。"""
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        if data["status"] == "OK":
-            rows = data.get("rows", [])
-            if rows and rows[0].get("elements"):
-                elm = rows[0]["elements"][0]
-                if elm.get("status") == "OK":
-                    return elm["distance"]["value"] / 1000.0
-    except Exception as e:
-        st.error(f"距離計算エラー: {e}")
-    return None
+        spreadsheet = _spreadsheet()
+        if spreadsheet is not None:
+            return batch_read(spreadsheet, worksheet_names)
+    except Exception:
+        # 無いシートが1つでもあると batchGet 全体が失敗するので、1枚ずつ読み直す
+        pass
+    conn = _sheets_connection()
+    frames = {}
+    for name in worksheet_names:
+        try:
+            frames[name] = conn.read(worksheet=name, ttl=0)
+        except:
+            frames[name] = None
+    return frames
+
+def load_sheets(*worksheet_names):
+    """複数のシートを、共有キャッシュに無いものだけまとめて読む。シート名の順に DataFrame を返す。"""
+    cache = shared_cache()
+    # 読む前のバージョンで保存する（読んでいる間に他のワーカーが書けば、この値は使われない）
+    versions = {name: cache.version(name) for name in worksheet_names}
+    frames = {name: cache.get(name, versions[name]) for name in worksheet_names}
+    missing = [name for name, df in frames.items() if df is None]
+    if missing:
+        for name, df in _read_worksheets(missing).items():
+            if df is None:
+                frames[name] = pd.DataFrame()
+                continue
+            if name in SHEET_ID_COLUMNS:
+                df = live_rows(ensure_ids(df, SHEET_ID_COLUMNS[name]))
+            cache.put(name, versions[name], df)
+            frames[name] = df
+    return tuple(frames[name] for name in worksheet_names)
 
 def load_sheet(worksheet_name):
-    conn = st.connection("gsheets", type=GSheetsConnection)
+    return load_sheets(worksheet_name)[0]
+
+# events / participants シートへの書き込みは、シート全体ではなく変更（Insert / Update / Delete）として送る。
+# 行は ID の列で指定し（行番号は削除でずれるため使わない）、書く直前に最新のシートを読み直して
+# 適用するので、同時に行われた登録・修正を上書きしない。イベントは event_id が行 ID 兼パーティション。
+# サービスアカウントで開けるときは変更した行だけを書く（書き込み権はイベント単位なので、別のイベントへの
+# 書き込みは同時に進む）。開けなければシート全体を書き直す（書き込み権はシート単位）
+SHEET_ID_COLUMNS = {"participants": ID_COLUMN, "events": "event_id"}
+
+def _read_fresh(worksheet_name):
+    return _sheets_connection().read(worksheet=worksheet_name, ttl=0)
+
+def _write_whole(worksheet_name, df):
+    _sheets_connection().update(worksheet=worksheet_name, data=df)
+
+@st.cache_resource
+def _sheet_committer(worksheet_name, path):
+    cache = _shared_cache(path)
     try:
-        return conn.read(worksheet=worksheet_name, ttl=0)
-    except:
-        return pd.DataFrame()
+        spreadsheet = _spreadsheet()
+    except Exception:
+        spreadsheet = None
+    if spreadsheet is not None:
+        store = WorksheetStore(spreadsheet, worksheet_name, cache)
+    else:
+        store = WholeSheetStore(
+            functools.partial(_read_fresh, worksheet_name), functools.partial(_write_whole, worksheet_name),
+        )
+    return SheetCommitter(worksheet_name, store, cache, id_column=SHEET_ID_COLUMNS[worksheet_name])
+
+def participants_committer():
+    return _sheet_committer("participants", str(shared_cache().path))
+
+def events_committer():
+    return _sheet_committer("events", str(shared_cache().path))
+
+def commit_events(changeset):
+    """イベントの changeset を書き込む。他の人が先に同じイベントを変えていれば ConflictError。"""
+    return events_committer().commit(changeset)
 
-def append_to_sheet(worksheet_name, new_data_dict):
-    conn = st.connection("gsheets", type=GSheetsConnection)
-    df = load_sheet(worksheet_name)
-    new_df = pd.DataFrame([new_data_dict])
-    updated_df = pd.concat([df, new_df], ignore_index=True)
-    conn.update(worksheet=worksheet_name, data=updated_df)
+def commit_participants(changeset):
+    """1つの changeset をまとめて書き込む。他の人が先に同じ行を変えていれば ConflictError。"""
+    return participants_committer().commit(changeset)
 
-def update_sheet_data(worksheet_name, df):
-    conn = st.connection("gsheets", type=GSheetsConnection)
-    conn.update(worksheet=worksheet_name, data=df)
+def commit_participant_rows(changesets):
+    """行ごとの changeset を書き込み、(書けた数, 衝突した数) を返す。"""
+    results = participants_committer().commit_all(changesets)
+    conflicts = sum(isinstance(r, ConflictError) for r in results)
+    return len(results) - conflicts, conflicts
+
+# --- 終了イベントのアーカイブ ---
+def archive_dir() -> Path:
+    """secrets の [general] archive_dir（既定: アプリと同じ場所の archive/）。"""
+    return Path(st.secrets.get("general", {}).get("archive_dir", "archive"))
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _archive_index_cached(directory, mtime):
+    return archive.load_index(directory)
+
+def archived_events():
+    """アーカイブ済みイベントの一覧。一覧ファイルが書き換わったときだけ読み直す。"""
+    directory = archive_dir()
+    return _archive_index_cached(str(directory), _mtime(directory / archive.INDEX_FILE))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def archived_participants(directory, event_id, mtime):
+    return archive.load_participants(directory, event_id)
+
+def archive_finished_events(events_df, all_p):
+    """猶予期間を過ぎたイベントをスナップショットに移し、シートから取り除く。移した件数を返す。"""
+    today = datetime.datetime.now(JST).date()
+    targets = archive.archivable_event_ids(events_df, today)
+    if not targets:
+        return 0
+    done = archive.archive_events(events_df, all_p, targets, archive_dir())
+    if not done:
+        return 0
+    # 参加者 → イベントの順に消す（途中で失敗してもイベントだけが消えた状態にはしない）
+    if not all_p.empty and "event_id" in all_p.columns:
+        rows = all_p[all_p["event_id"].astype(str).isin(done)]
+        commit_participant_rows([[Delete(pid, rev)] for pid, rev in zip(rows["participant_id"], rows[REVISION_COLUMN])])
+    rows = events_df[events_df["event_id"].astype(str).isin(done)]
+    # 読んだ後に編集されたイベントは消さない（次回のアーカイブで、編集後の内容で移し直す）
+    results = events_committer().commit_all([[Delete(eid, rev)] for eid, rev in zip(rows["event_id"], rows[REVISION_COLUMN])])
+    # 削除した行は墓標として残っているので、ここでまとめてシートから取り除く
+    participants_committer().compact()
+    events_committer().compact()
+    return sum(not isinstance(r, ConflictError) for r in results)
 
 def calculate_stats(df_participants, current_event_id):
     if df_participants.empty or "event_id" not in df_participants.columns:
         return None, None, 0, 0, pd.DataFrame()
 
     df_participants["event_id"] = df_participants["event_id"].astype(str)
-    if 'original_index' not in df_participants.columns:
-        df_participants['original_index'] = df_participants.index
 
     df_p = df_participants[df_participants["event_id"] == str(current_event_id)].copy()
     if df_p.empty: return 0, 0, 0, 0, df_p
 
-    total_solo, total_share, total_actual_cars, total_people = 0, 0, 0, 0
-
-    for index, row in df_p.iterrows():
-        c_type = row.get('car_type', "")
-        if c_type in CO2_EMISSION_FACTORS:
-            factor = CO2_EMISSION_FACTORS[c_type]
-            capacity = MAX_CAPACITY[c_type]
-        else:
-            factor = 166
-            capacity = 5
-        try:
-            dist = float(row['distance'])
-            ppl = int(row['people'])
-            cars = math.ceil(ppl / capacity)
-            total_solo += ppl * dist * factor * 2
-            total_share += cars * dist * factor * 2
-            total_actual_cars += cars
-            total_people += ppl
-        except:
-            continue
+    rows = emission_rows(df_p)
+    total_solo = rows["solo_g"].sum()
+    total_share = rows["share_g"].sum()
+    total_actual_cars = int(rows["cars"].sum())
+    total_people = int(rows["people"].sum())
 
     return total_solo, total_share, total_actual_cars, total_people, df_p
 
-def split_car_info(car_str):
-    if not isinstance(car_str, str):
-        return str(car_str), "-"
-    if "|" in car_str:
-        parts = car_str.split("|")
-        return parts[0].strip(), parts[1].strip()
-    match = re.search(r'(.+?)[\s\（\(]+(.+?km/L)[\)\）]', car_str)
-    if match:
-        return match.group(1).strip(), match.group(2).strip()
-    return car_str, "-"
-
-def generate_qr_image(url: str):
+@st.cache_data(show_spinner=False)
+def generate_qr_image(url: str) -> bytes:
+    import qrcode
     qr = qrcode.QRCode(box_size=10, border=4)
     qr.add_data(url)
     qr.make(fit=True)
     img = qr.make_image(fill_color="black", back_color="white")
     buf = io.BytesIO()
     img.save(buf, format="PNG")
-    buf.seek(0)
-    return buf
-
-def render_car_count_card(solo_cars, share_cars, c=None):
-    if c is None:
-        c = _C["normal"]
-    reduction = solo_cars - share_cars
-    st.markdown(f"""
-    <div style="display:flex;align-items:center;justify-content:center;gap:28px;padding:10px 0 18px 0;">
-      <div style="text-align:center;line-height:1.1;">
-        <div style="font-size:13px;font-weight:600;color:{c['car_solo']};letter-spacing:0.06em;margin-bottom:2px;">1人1台の場合</div>
-        <div style="font-size:44px;font-weight:800;color:{c['car_solo']};">{solo_cars}<span style="font-size:20px;font-weight:600;">台</span></div>
-      </div>
-      <div style="display:flex;flex-direction:column;align-items:center;gap:6px;">
-        <div style="font-size:22px;color:{c['car_arrow']};">→</div>
-        <div style="font-size:13px;font-weight:700;color:{c['reduce_txt']};background:{c['reduce_bg']};padding:3px 12px;border-radius:20px;white-space:nowrap;">▼ {reduction}台 削減</div>
-      </div>
-      <div style="text-align:center;line-height:1.1;">
-        <div style="font-size:13px;font-weight:600;color:{c['car_share']};letter-spacing:0.06em;margin-bottom:2px;">相乗り</div>
-        <div style="font-size:44px;font-weight:800;color:{c['car_share']};">{share_cars}<span style="font-size:20px;font-weight:600;">台</span></div>
-      </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-def make_plotly_fig(chart_data, c=None):
-    if c is None:
-        c = _C["normal"]
-    fig = px.bar(
-        chart_data,
-        x="状況",
-        y="CO2排出量 (kg)",
-        color="状況",
-        color_discrete_sequence=[c["bar_solo"], c["bar_share"]],
-        text="CO2排出量 (kg)",
-        template="plotly_white",
-    )
+    return buf.getvalue()
+
+@functools.lru_cache(maxsize=256)
+def _car_count_html(solo_cars, share_cars) -> str:
+    return _CAR_COUNT_HTML.format(solo=solo_cars, share=share_cars, reduction=solo_cars - share_cars)
+
+def render_car_count_card(solo_cars, share_cars):
+    """色はテーマ CSS（.car-count-*）側でパレットから与える。"""
+    st.markdown(_car_count_html(solo_cars, share_cars), unsafe_allow_html=True)
+
+# --- 登録の時系列 ---
+# ライブモニターに表示する範囲（累積は範囲より前の登録も含めた値）
+TIMELINE_WINDOW = pd.Timedelta(hours=8)
+
+@st.cache_resource(max_entries=64)
+def timeline_tally(event_id):
+    """イベントごと・全セッション共通。現在の5分区間だけを集計し直す。"""
+    return TimelineTally()
+
+def make_timeline_fig(timeline, c):
+    import plotly.graph_objects as go
+    x = timeline.index.tz_convert(JST)
+    fig = go.Figure()
+    fig.add_bar(x=x, y=timeline["groups"], name="登録数（5分ごと）", marker=dict(color=c["bar_share"]),
+                hovertemplate="%{x|%H:%M}〜 %{y:.0f} 組<extra></extra>")
+    fig.add_scatter(x=x, y=timeline["cum_reduction_kg"], name="CO2削減量の累積 (kg)", yaxis="y2",
+                    mode="lines", line=dict(color=c["bar_solo"], width=3, shape="hv"),
+                    hovertemplate="%{x|%H:%M} 累計 %{y:.1f} kg<extra></extra>")
     fig.update_layout(
+        template="plotly_white",
         plot_bgcolor="rgba(0,0,0,0)",
         paper_bgcolor="rgba(0,0,0,0)",
-        showlegend=False,
-        yaxis=dict(showgrid=True, gridcolor=c["grid"], gridwidth=1),
-        xaxis=dict(showgrid=False),
-        font=dict(size=15, color=c["chart_font"]),
+        font=dict(size=13, color=c["chart_font"]),
         margin=dict(t=20, b=10, l=10, r=10),
-        bargap=0.35,
-    )
-    fig.update_traces(
-        texttemplate='<b>%{y:.1f} kg</b>',
-        textposition='inside',
-        textfont=dict(size=32, color=c["bar_text"]),
-        marker=dict(line=dict(width=0), cornerradius=8),
+        height=300,
+        bargap=0.1,
+        legend=dict(orientation="h", y=1.12, x=0),
+        xaxis=dict(showgrid=False, tickformat="%H:%M"),
+        yaxis=dict(title="登録数", showgrid=True, gridcolor=c["grid"], rangemode="tozero"),
+        yaxis2=dict(title="累積 kg", overlaying="y", side="right", showgrid=False, rangemode="tozero"),
     )
     return fig
 
+def show_registration_timeline(event_id, df_p, c):
+    now = pd.Timestamp.now(tz=JST)
+    timeline = timeline_tally(event_id).update(df_p, now)
+    timeline = timeline[timeline.index >= (now - TIMELINE_WINDOW).tz_convert("UTC").floor(BUCKET)]
+    if timeline.empty:
+        return
+    st.markdown("#### 登録の推移")
+    st.plotly_chart(make_timeline_fig(timeline, c), width="stretch")
+
 
 # --- ライブモニター用フラグメント ---
+LIVE_CHART_LABELS = ("1人1台の場合", "相乗り移動")
+_LIVE_MONITOR_HEADER_HTML = (
+    '<div class="live-monitor-header">'
+    '<p class="live-monitor-title">リアルタイム集計モニター</p>'
+    '<span class="live-badge"><span class="live-dot"></span>LIVE 10秒更新</span>'
+    '</div>'
+)
+
 @st.fragment(run_every=10)
-def show_live_monitor(current_event_id):
-    st.markdown("""
-    <div class="live-monitor-header">
-        <p class="live-monitor-title">リアルタイム集計モニター</p>
-        <span class="live-badge"><span class="live-dot"></span>LIVE 10秒更新</span>
-    </div>
-    """, unsafe_allow_html=True)
+def show_live_monitor(current_event_id, loc_addr):
+    st.markdown(_LIVE_MONITOR_HEADER_HTML, unsafe_allow_html=True)
     st.caption("この画面は自動で最新情報に更新されます。")
 
-    all_p = load_sheet("participants")
+    all_p = apply_refined_distances(load_sheet("participants"), current_event_id, loc_addr, MAPS_API_KEY,
+                                    request=False)
     total_solo, total_share, actual_cars, total_people, df_p = calculate_stats(all_p, current_event_id)
 
     if df_p.empty:
@@ -959,7 +666,7 @@ def show_live_monitor(current_event_id):
 
     reduction_kg = (total_solo - total_share) / 1000
     occupancy_rate = total_people / actual_cars if actual_cars > 0 else 0
-    cedar_trees = reduction_kg / 8.8  # 林野庁算定値: 8.8 kg-CO2/本/年（36〜40年生スギ人工林、1,000本/ha）
+    cedar_trees = reduction_kg / CEDAR_KG_PER_TREE
 
     c = _C["hc"] if st.session_state.get("hc_mode", False) else _C["normal"]
     render_metric_cards([
@@ -969,33 +676,666 @@ def show_live_monitor(current_event_id):
     ])
     st.caption("※ 杉の木換算：8.8 kg-CO₂/本/年（出典：林野庁「森林はどのぐらいの量の二酸化炭素を吸収しているの？」36〜40年生スギ人工林・1,000本/ha 基準）")
 
-    chart_data = pd.DataFrame({
-        "状況": ["1人1台の場合", "相乗り移動"],
-        "CO2排出量 (kg)": [total_solo/1000, total_share/1000],
-    })
-    st.plotly_chart(make_plotly_fig(chart_data, c), use_container_width=True)
-    render_car_count_card(total_people, actual_cars, c)
+    st.plotly_chart(co2_bar_figure(total_solo / 1000, total_share / 1000, _theme(), LIVE_CHART_LABELS),
+                    width="stretch")
+    render_car_count_card(total_people, actual_cars)
+
+    show_registration_timeline(current_event_id, df_p, c)
 
     st.markdown("#### 最新の参加者リスト")
-    display_df = df_p[["name", "start_point", "people", "car_type", "distance"]].copy()
-    display_df["start_point"] = display_df["start_point"].apply(get_city_level_address)
-    split_data = display_df["car_type"].apply(split_car_info)
-    display_df["car_name"] = [x[0] for x in split_data]
-    display_df["car_eff"]  = [x[1] for x in split_data]
-    display_df = display_df[["name", "start_point", "people", "car_name", "car_eff", "distance"]]
-    display_df.columns = ["グループ名", "出発地(市町村)", "人数", "車種", "燃費目安", "距離(km)"]
+    display_df = display_frame(df_p).rename(columns=REPORT_COLUMNS)
     st.dataframe(display_df.iloc[::-1], width="stretch", hide_index=True)
 
 
+# --- 複数イベントのライブウォール（主催者用） ---
+# 1画面に並べるイベントの上限（それ以上はカードが小さくなりすぎて投影で読めない）
+WALL_MAX_EVENTS = 12
+
+_WALL_CARD_HTML = (
+    '<div class="metric-card wall-card">'
+    '<div class="metric-card-label wall-card-title">{title}</div>'
+    '<div class="wall-card-row">'
+    '<div><div class="metric-card-value">{reduction:.1f} kg</div><div class="metric-card-label">CO2削減量</div></div>'
+    '<div><div class="metric-card-value">{occupancy:.2f}</div><div class="metric-card-label">人/台</div></div>'
+    '<div><div class="metric-card-value">{solo}→{share}</div><div class="metric-card-label">台数</div></div>'
+    '</div></div>'
+)
+
+def live_totals(version, all_p):
+    """全イベントのライブ集計（1回の groupby）。参加者シートのバージョンごとに全ワーカーで1回だけ計算する。"""
+    # "participants:" で始まるキーは参加者シートの更新時に消える。車種モデルが変われば別のキー
+    return shared_cache().memo(f"participants:live:{VEHICLE_MODEL.key}", version, lambda: aggregate_by_event(all_p))
+
+def wall_html(per_event, event_ids, titles) -> str:
+    totals = add_summary_columns(per_event[SUM_COLUMNS].reindex(event_ids, fill_value=0.0))
+    cards = "".join(
+        _WALL_CARD_HTML.format(
+            title=html.escape(titles.get(event_id, event_id)),
+            reduction=row.reduction_kg, occupancy=row.occupancy,
+            solo=int(row.people), share=int(row.cars),
+        )
+        for event_id, row in zip(event_ids, totals.itertuples())
+    )
+    return f'<div class="wall-grid">{cards}</div>'
+
+@st.fragment(run_every=10)
+def show_live_wall(event_ids, titles):
+    """選んだイベントのカードを並べる。シートの読み込みと集計はイベント数によらず1回。"""
+    version = shared_cache().version("participants")
+    per_event = live_totals(version, load_sheet("participants"))
+    st.markdown(wall_html(per_event, event_ids, titles), unsafe_allow_html=True)
+    st.caption(f"10秒ごとに更新（最終更新 {datetime.datetime.now(JST):%H:%M:%S}）")
+
+def show_live_wall_picker(events_df):
+    if events_df.empty or "event_id" not in events_df.columns:
+        st.info("イベントなし")
+        return
+    events = events_df.assign(event_id=events_df["event_id"].astype(str))[::-1]
+    titles = {r.event_id: f"{r.event_name}（{r.event_date}）" for r in events.itertuples()}
+    today = upcoming_event_ids(events_df, datetime.datetime.now(JST).date(), days=0, limit=WALL_MAX_EVENTS)
+    selected = st.multiselect("表示するイベント", list(titles), default=today, format_func=titles.get,
+                              max_selections=WALL_MAX_EVENTS, key="wall_events")
+    if not selected:
+        st.caption("表示するイベントを選んでください（既定は今日開催のイベント）。")
+        return
+    show_live_wall(selected, {event_id: titles[event_id] for event_id in selected})
+
+
+# --- アーカイブ済みイベント（閲覧のみ） ---
+def show_archived_event(event_id, info):
+    render_hero_header(
+        _icon(_P_CAR, 32, "white"),
+        info["event_name"],
+        f"{info['event_date']}  |  {info['location_name']}",
+    )
+    st.info("このイベントは終了し、アーカイブされています。登録内容の追加・修正はできません。")
+    if pd.notna(info.get("model_version")):
+        st.caption(f"集計値はアーカイブ時の車種モデル {info['model_version']} によるものです。")
+
+    c = _C["hc"] if st.session_state.get("hc_mode", False) else _C["normal"]
+    render_metric_cards([
+        {"icon": _icon(_P_LEAF,  36, c["icon"]), "value": f"{info['reduction_kg']:.2f} kg", "label": "CO2削減量"},
+        {"icon": _icon(_P_CAR,   36, c["icon"]), "value": f"{info['occupancy']:.2f} 人/台", "label": "相乗り率"},
+        {"icon": _icon(_P_TREE,  36, c["icon"]), "value": f"約 {info['cedar_trees']:.1f} 本", "label": "杉の木の年間吸収量相当"},
+    ])
+    st.plotly_chart(co2_bar_figure(info["solo_g"] / 1000, info["share_g"] / 1000, _theme()), width="stretch")
+    render_car_count_card(int(info["people"]), int(info["cars"]))
+
+    with st.expander("市区町村別ランキング"):
+        show_municipality_ranking(leaderboard(archived_municipalities(), event_id))
+
+    # 参加者行はスナップショットから、表示を求められたときにだけ読み込む
+    if st.toggle("参加者リストを表示", key="archived_list"):
+        directory = archive_dir()
+        path = directory / event_id / archive.PARTICIPANTS_FILE
+        df_p = archived_participants(str(directory), event_id, _mtime(path))
+        if df_p.empty:
+            st.caption("参加者データはありません。")
+        else:
+            st.dataframe(display_frame(df_p).rename(columns=REPORT_COLUMNS), width="stretch", hide_index=True)
+
+
+# --- 参加者の一括編集（主催者用） ---
+_BULK_COLUMNS = {"name": "グループ名", "people": "人数", "car_type": "車種", "distance": "距離(km)"}
+
+def bulk_changeset(all_p, edited, delete_rows=()):
+    """表の編集内容と delete_rows の削除を changeset にする。(changeset, 変更行数, 削除行数) を返す。
+
+    all_p は編集を始めた時点の行（participant_id と row_revision を含む）。
+    edited は index が all_p の行番号、列が _BULK_COLUMNS の見出しの DataFrame。
+    """
+    changes = edited.rename(columns={v: k for k, v in _BULK_COLUMNS.items()})[list(_BULK_COLUMNS)]
+    before = all_p.loc[changes.index, list(_BULK_COLUMNS)]
+
+    diff = pd.DataFrame(False, index=changes.index, columns=list(_BULK_COLUMNS))
+    for col in ("people", "distance"):
+        old, new = pd.to_numeric(before[col], errors="coerce"), pd.to_numeric(changes[col], errors="coerce")
+        diff[col] = ~(np.isclose(old, new) | (old.isna() & new.isna()))
+    for col in ("name", "car_type"):
+        diff[col] = before[col].astype(str) != changes[col].astype(str)
+
+    delete_rows = pd.Index(delete_rows)
+    changed = diff.any(axis=1) & ~diff.index.isin(delete_rows)
+    changeset = []
+    for idx in diff.index[changed]:
+        fields = {col: changes.at[idx, col] for col in _BULK_COLUMNS if diff.at[idx, col]}
+        if "distance" in fields:
+            # 手入力された距離は推定値として置き換えない
+            fields["distance_source"] = SOURCE_MEASURED
+        changeset.append(Update(all_p.at[idx, "participant_id"], fields, all_p.at[idx, REVISION_COLUMN]))
+    changeset.extend(Delete(all_p.at[idx, "participant_id"], all_p.at[idx, REVISION_COLUMN]) for idx in delete_rows)
+    return changeset, int(changed.sum()), len(delete_rows)
+
+def _next_bulk_generation():
+    st.session_state["bulk_generation"] = st.session_state.get("bulk_generation", 0) + 1
+
+@st.fragment
+def show_bulk_editor(events_df):
+    """イベントの参加者を表で選択・編集し、まとめて1回の書き込みで保存する。"""
+    if events_df.empty:
+        st.info("イベントなし")
+        return
+    events = events_df[::-1]
+    labels = {str(r.event_id): f"{r.event_name}（{r.event_date}）" for r in events.itertuples()}
+    event_id = st.selectbox("イベント", list(labels), format_func=labels.get, key="bulk_event")
+
+    all_p = load_sheet("participants")
+    if all_p.empty or "event_id" not in all_p.columns:
+        st.info("参加者なし")
+        return
+    current = all_p[all_p["event_id"].astype(str) == event_id]
+    # 保存のたびにキーを変えて、編集途中の状態を捨てる
+    editor_key = f"bulk_{event_id}_{st.session_state.get('bulk_generation', 0)}"
+    # 表の編集は行の位置で記録されるので、編集中は開いた時点の行のまま表示する
+    if st.session_state.get("bulk_rows", (None,))[0] != editor_key:
+        st.session_state["bulk_rows"] = (editor_key, current)
+    rows = st.session_state["bulk_rows"][1]
+    if rows.empty:
+        st.info("参加者なし")
+        return
+    stale = not current[["participant_id", REVISION_COLUMN]].reset_index(drop=True).equals(
+        rows[["participant_id", REVISION_COLUMN]].reset_index(drop=True))
+    if stale:
+        st.info("表を開いた後に参加者が追加・変更されました。未保存の編集を捨てて最新の内容を読み込めます。")
+        st.button("最新の内容を読み込む", key=f"{editor_key}_reload", on_click=_next_bulk_generation)
+
+    view = rows[list(_BULK_COLUMNS)].rename(columns=_BULK_COLUMNS)
+    view["距離(km)"] = pd.to_numeric(view["距離(km)"], errors="coerce")
+    view["人数"] = pd.to_numeric(view["人数"], errors="coerce")
+    view.insert(0, "選択", False)
+    view.insert(2, "出発地(市町村)", normalize_addresses(rows["start_point"])["label"])
+
+    edited = st.data_editor(
+        view,
+        key=editor_key,
+        hide_index=True,
+        width="stretch",
+        disabled=["出発地(市町村)"],
+        column_config={
+            "選択": st.column_config.CheckboxColumn(width="small"),
+            "人数": st.column_config.NumberColumn(min_value=1, max_value=10, step=1),
+            "車種": st.column_config.SelectboxColumn(options=list(CO2_EMISSION_FACTORS.keys()), required=True),
+            "距離(km)": st.column_config.NumberColumn(min_value=0.0, format="%.1f"),
+        },
+    )
+    selected = edited.index[edited["選択"]]
+    st.caption(f"{len(rows)} 件中 {len(selected)} 件を選択中。表の中で直接編集した内容も、下のボタンでまとめて保存されます。")
+
+    with st.form(f"bulk_actions_{event_id}"):
+        c1, c2, c3 = st.columns(3)
+        delete = c1.checkbox("選択した参加者を削除")
+        car_keys = ["変更しない", *CO2_EMISSION_FACTORS.keys()]
+        new_car = c2.selectbox("選択した参加者の車種", car_keys)
+        new_distance = c3.number_input("選択した参加者の距離 (km)", min_value=0.0, value=None, placeholder="変更しない")
+        submitted = st.form_submit_button("変更を保存（1回の書き込み）", type="primary", width="stretch")
+
+    if submitted:
+        # 表での直接編集は全行、一括操作は選択行だけが対象
+        edits = edited.drop(columns=["選択", "出発地(市町村)"])
+        if not delete:
+            if new_car != "変更しない":
+                edits.loc[selected, "車種"] = new_car
+            if new_distance is not None:
+                edits.loc[selected, "距離(km)"] = float(new_distance)
+        changeset, changed, deleted = bulk_changeset(rows, edits, selected if delete else ())
+        if changeset:
+            try:
+                commit_participants(changeset)
+            except ConflictError:
+                _next_bulk_generation()
+                st.session_state["bulk_conflict"] = "保存の前に他の人が同じ参加者を変更しました。最新の内容を表示しているので、もう一度編集してください。"
+                st.rerun()
+            _next_bulk_generation()
+            st.session_state["bulk_notice"] = f"{changed} 件を更新、{deleted} 件を削除しました。"
+            st.rerun()
+        else:
+            st.info("変更はありません。")
+
+
+# --- データの書き出し ---
+def show_export_buttons(key, load_participants, events_df, title, subtitle="", summarize=None):
+    """CSV / Parquet / 印刷用サマリーのダウンロードボタン。
+    ファイルはクリックされたときにだけ、チャンク単位で組み立てる。
+    summarize() が (イベント別集計, 全体合計) を返す場合、サマリーはそれを使う。"""
+    def csv_file():
+        return ChunkStream(iter_csv(load_participants(), events_df))
+
+    def parquet_file():
+        return ChunkStream(iter_parquet(load_participants(), events_df))
+
+    def summary_file():
+        if summarize is not None:
+            per_event, totals = summarize()
+        else:
+            per_event = with_event_info(aggregate_by_event(load_participants()), events_df)
+            totals = overall_totals(per_event) if not per_event.empty else {}
+        return ChunkStream(iter_summary_html(per_event, totals, title, subtitle))
+
+    col_csv, col_pq, col_sum = st.columns(3)
+    col_csv.download_button("参加者一覧 (CSV)", csv_file, file_name=f"{key}.csv", mime="text/csv",
+                            key=f"dl_csv_{key}", on_click="ignore", width="stretch")
+    col_pq.download_button("参加者一覧 (Parquet)", parquet_file, file_name=f"{key}.parquet",
+                           mime="application/vnd.apache.parquet", key=f"dl_parquet_{key}",
+                           on_click="ignore", width="stretch")
+    col_sum.download_button("印刷用サマリー (HTML)", summary_file, file_name=f"{key}_summary.html",
+                            mime="text/html", key=f"dl_summary_{key}", on_click="ignore", width="stretch")
+
+
+# --- 主催者ダッシュボード ---
+@st.cache_data(show_spinner=False, max_entries=8)
+def cross_event_stats(revision, _participants, _events, _archived):
+    """全イベントの集計を1回の groupby で求める。キャッシュキーはデータのリビジョンのみ。
+    アーカイブ済みのイベントは凍結した集計値をそのまま使う。
+    他のワーカーが同じリビジョンを集計済みなら共有キャッシュの結果を使う。"""
+    def compute():
+        events = _events
+        per_event = aggregate_by_event(_participants)
+        if not _archived.empty:
+            frozen = _archived[SUM_COLUMNS].drop(index=per_event.index, errors="ignore")
+            per_event = add_summary_columns(pd.concat([per_event[SUM_COLUMNS], frozen]))
+            events = pd.concat([_archived.reset_index(), events], ignore_index=True)
+        monthly = monthly_trend(per_event, events)
+        totals = overall_totals(per_event)
+        return with_event_info(per_event, events), monthly, totals
+
+    # "participants:" で始まるキーは参加者シートの更新時に消える。車種モデルが変われば別のキー
+    return shared_cache().memo(f"participants:stats:{VEHICLE_MODEL.key}:{revision}", 0, compute)
+
+
+def show_organizer_dashboard():
+    events_df, all_p = load_sheets("events", "participants")
+    archived = archived_events()
+    revision = f"{frame_revision(events_df)}:{frame_revision(all_p)}:{frame_revision(archived)}"
+    per_event, monthly, totals = cross_event_stats(revision, all_p, events_df, archived)
+
+    if per_event.empty:
+        st.info("集計できる参加データがありません。")
+        return
+
+    c = _C["hc"] if st.session_state.get("hc_mode", False) else _C["normal"]
+    render_metric_cards([
+        {"icon": _icon(_P_LEAF,  36, c["icon"]), "value": f"{totals['reduction_kg']:.2f} kg", "label": "全イベントのCO2削減量"},
+        {"icon": _icon(_P_CAR,   36, c["icon"]), "value": f"{totals['occupancy']:.2f} 人/台", "label": "平均相乗り率"},
+        {"icon": _icon(_P_TREE,  36, c["icon"]), "value": f"約 {totals['cedar_trees']:.1f} 本", "label": "杉の木の年間吸収量相当"},
+    ])
+    st.caption(f"集計対象: {len(per_event)} イベント / {int(totals['groups'])} グループ / {int(totals['people'])} 人")
+
+    if not monthly.empty:
+        import plotly.express as px
+        st.markdown("#### 月別のCO2削減量")
+        fig = px.bar(
+            monthly.reset_index(),
+            x="month",
+            y="reduction_kg",
+            labels={"month": "開催月", "reduction_kg": "CO2削減量 (kg)"},
+            color_discrete_sequence=[c["bar_share"]],
+            template="plotly_white",
+        )
+        fig.update_layout(
+            plot_bgcolor="rgba(0,0,0,0)",
+            paper_bgcolor="rgba(0,0,0,0)",
+            yaxis=dict(showgrid=True, gridcolor=c["grid"], gridwidth=1),
+            xaxis=dict(showgrid=False, type="category"),
+            font=dict(color=c["chart_font"]),
+            margin=dict(t=20, b=10, l=10, r=10),
+        )
+        st.plotly_chart(fig, width="stretch")
+
+    st.markdown("#### イベント別集計")
+    table = table_source = per_event.sort_values("event_date", ascending=False)
+    table = table[["event_name", "event_date", "location_name", "groups", "people", "cars",
+                   "reduction_kg", "occupancy", "cedar_trees"]]
+    table.columns = ["イベント名", "開催日", "開催場所", "グループ数", "人数", "台数",
+                     "CO2削減量(kg)", "相乗り率(人/台)", "杉の木換算(本)"]
+    st.dataframe(
+        table.round({"CO2削減量(kg)": 2, "相乗り率(人/台)": 2, "杉の木換算(本)": 1}),
+        width="stretch",
+        hide_index=True,
+    )
+
+    st.markdown("#### 市区町村別ランキング")
+    places = municipality_tally().update(all_p)
+    archived_places = archived_municipalities()
+    if not archived_places.empty:
+        places = pd.concat([archived_places.drop(index=places.index, errors="ignore"), places])
+    ranked = leaderboard(places)
+    show_municipality_ranking(ranked)
+    if not ranked.empty:
+        # 都道府県名・市区町村名の列は行政区域データ（N03_001 / N03_004）と突き合わせて地図にできる
+        st.download_button(
+            "地図用の集計表 (CSV)",
+            ranked.drop(columns="rank").to_csv(index=False).encode("utf-8-sig"),
+            file_name="ecoride_municipalities.csv",
+            mime="text/csv",
+            on_click="ignore",
+        )
+
+    st.markdown("#### データの書き出し")
+    def all_participants():
+        # アーカイブ済みイベントの参加者はクリックされたときにスナップショットから読む
+        snapshots = [archive.load_participants(archive_dir(), eid) for eid in archived.index]
+        return pd.concat([all_p, *snapshots], ignore_index=True)
+
+    export_events = pd.concat([archived.reset_index(), events_df], ignore_index=True)
+    show_export_buttons("ecoride_all_events", all_participants, export_events, "エコライド 全イベント集計",
+                        f"{len(per_event)} イベント", summarize=lambda: (table_source, totals))
+
+
+# --- グループ間相乗りの提案 ---
+@st.cache_data(show_spinner=False, max_entries=16)
+def carpool_plan(revision, _df_p):
+    """出発地の座標を格子に分けて、グループ間の相乗りを最適化する。
+    座標の無い行（ジオコーディング導入前の登録など）は市区町村をゾーンとして扱う。"""
+    rows = emission_rows(_df_p)
+    cols = _df_p.reindex(index=rows.index, columns=["start_lat", "start_lon"])
+    lat = pd.to_numeric(cols["start_lat"], errors="coerce")
+    lon = pd.to_numeric(cols["start_lon"], errors="coerce")
+    cells = grid_cells(lat, lon)
+    missing = cells == -1
+    if missing.any():
+        zones = normalize_addresses(_df_p.loc[rows.index[missing], "start_point"])["label"]
+        codes, _ = pd.factorize(zones)
+        # 格子番号と重ならないよう負の値に割り当てる（-1: ゾーン不明, -2: 予約済み）
+        cells[missing] = np.where(codes >= 0, -(codes + 10), -1)
+    return plan_carpool(rows, cells)
+
+
+def show_carpool_suggestions(df_p, total_share, actual_cars):
+    summary, cars = carpool_plan(frame_revision(df_p), df_p)
+    if summary["cars"] == 0:
+        st.info("試算できる参加データがありません。")
+        return
+
+    col_a, col_b = st.columns(2)
+    col_a.metric("現在の相乗り", f"{total_share / 1000:.1f} kg", f"{actual_cars} 台", delta_color="off")
+    col_b.metric(
+        "近所のグループで相乗りした場合",
+        f"{summary['co2_g'] / 1000:.1f} kg",
+        f"{(summary['co2_g'] - total_share) / 1000:+.1f} kg / {summary['cars']} 台",
+        delta_color="inverse",
+    )
+
+    shared = cars[cars["members"].map(len) > 1]
+    if shared.empty:
+        st.caption("近くから来ているグループが無いため、組み合わせの提案はありません。")
+        return
+    st.caption("出発地が近い（約3km四方・座標が無い場合は同じ市区町村の）グループ同士を、1席あたりの排出量が少ない車にまとめた試算です。")
+    names = df_p["name"].astype(str)
+    suggestions = pd.DataFrame({
+        "出発地(市町村)": [get_city_level_address(df_p.at[d, "start_point"]) for d in shared["driver"]],
+        "運転するグループ": [names[d] for d in shared["driver"]],
+        "同乗するグループ": ["、".join(names[m] for m in members[1:]) for members in shared["members"]],
+        "人数/定員": [f"{p}/{s}" for p, s in zip(shared["people"], shared["seats"])],
+        "距離(km)": shared["distance"].round(1),
+    })
+    st.dataframe(suggestions, width="stretch", hide_index=True)
+
+
+# --- 車種構成・相乗り率のシナリオ試算 ---
+@st.cache_data(show_spinner=False, max_entries=32)
+def scenario_table(revision, target_car, _df_p):
+    return reduction_grid(emission_rows(_df_p), target_car)
+
+
+@st.fragment
+def show_scenario_explorer(df_p, c):
+    """乗り換え先の車種を変えてもこのフラグメントだけが再実行される。"""
+    car_keys = list(CO2_EMISSION_FACTORS.keys())
+    target = st.selectbox(
+        "乗り換え先の車種", car_keys,
+        index=car_keys.index("ハイブリッド車 | 22km/L"), key="scenario_target",
+    )
+    table = scenario_table(frame_revision(df_p), target, df_p)
+    if not table.to_numpy().any():
+        st.info("試算できる参加データがありません。")
+        return
+
+    import plotly.express as px
+    name, _ = split_car_info(target)
+    fig = px.imshow(
+        table.to_numpy(),
+        x=[f"+{d:g}人" for d in table.columns],
+        y=[f"{s:.0%}" for s in table.index],
+        labels=dict(x="1台あたりの乗車人数の増加", y=f"{name}への乗り換え率", color="CO2削減量(kg)"),
+        color_continuous_scale="Greens",
+        text_auto=".1f",
+        aspect="auto",
+        origin="lower",
+    )
+    fig.update_layout(
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(size=13, color=c["chart_font"]),
+        margin=dict(t=20, b=10, l=10, r=10),
+    )
+    st.plotly_chart(fig, width="stretch")
+    st.caption("1人1台（現在の車種）で来た場合と比べた削減量です。左下が現在の相乗り状況、乗車人数は各車の定員が上限です。")
+
+
+# --- 市区町村別ランキング ---
+@st.cache_resource
+def municipality_tally():
+    """全セッション共通。参加者シートの変化分だけ集計し直す。"""
+    return MunicipalityTally()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _archived_municipalities(directory, mtime):
+    return archive.load_municipalities(directory)
+
+def archived_municipalities():
+    directory = archive_dir()
+    return _archived_municipalities(str(directory), _mtime(directory / archive.MUNICIPALITIES_FILE))
+
+def show_municipality_ranking(ranked, limit=20):
+    if ranked.empty:
+        st.info("集計できる参加データがありません。")
+        return
+    place = (ranked["prefecture"] + ranked["municipality"]).where(ranked["municipality"] != "", "（市区町村不明）")
+    table = pd.DataFrame({
+        "順位": ranked["rank"],
+        "市区町村": place,
+        "グループ数": ranked["groups"].astype(int),
+        "人数": ranked["people"].astype(int),
+        "距離合計(km)": ranked["distance_km"].round(1),
+        "CO2削減量(kg)": ranked["reduction_kg"].round(2),
+    })
+    st.dataframe(table.head(limit), width="stretch", hide_index=True)
+
+
+# --- 参加登録サイドバー用フラグメント ---
+@st.cache_resource
+def registration_index():
+    """全セッション共通。イベントごとの登録内容のハッシュ索引（重複登録の検知用）。"""
+    return RegistrationIndex()
+
+@st.fragment
+def show_registration_form(current_event_id, loc_addr, venue):
+    """出発地検索と登録フォーム。入力中の再実行はこのフラグメント内だけで完結し、
+    集計・グラフ・編集リストは登録成功時の st.rerun() でのみ更新される。"""
+    # 検索候補はこのフラグメント専用の状態として保持し、同じ語の再検索で API を呼ばない
+    suggestion_cache = st.session_state.setdefault("reg_suggestions", {})
+
+    # 地図サービスの本日の上限に達したら、候補は共有キャッシュのみ・距離は手入力に切り替える
+    degraded = maps_client(MAPS_API_KEY).budget_exhausted
+    # 出発地の距離を測れなかったときも、手入力の距離で登録できるようにする
+    manual_distance = degraded or st.session_state.get("reg_manual", False)
+
+    st.header("新規登録")
+    if degraded:
+        st.info("地図サービスの本日の利用上限に達しました。候補は過去の検索結果のみ表示します。距離を手入力して登録できます。")
+    elif manual_distance:
+        st.warning("地図で出発地から会場までの距離を測れませんでした。距離を手入力して「登録」を押すと、"
+                   "概算距離で登録し、後で測り直します。")
+    st.markdown("##### 1. 出発地を検索")
+    search_query = st.text_input("地名/駅名", key="search_box")
+    selected_address = None
+    if search_query:
+        suggestions = suggestion_cache.get(search_query)
+        if suggestions is None:
+            suggestions = get_place_suggestions(search_query, MAPS_API_KEY)
+            if suggestions:
+                suggestion_cache[search_query] = suggestions
+        if suggestions:
+            options = [s["label"] for s in suggestions]
+            selected_address = st.selectbox("候補を選択", options, key="reg_candidate")
+        else:
+            st.warning("候補なし（出発地を直接入力してください）" if degraded else "候補なし")
+
+    st.markdown("##### 2. 詳細登録")
+    with st.form("join_form"):
+        start_val = selected_address if selected_address else ""
+        f_start = st.text_input("出発地(確定)", value=start_val)
+        f_name = st.text_input("名前/グループ名")
+        f_ppl = st.number_input("人数", 1, 10, 2)
+        f_car = st.selectbox("車種", list(CO2_EMISSION_FACTORS.keys()))
+        f_manual = st.number_input("距離 (km)・手入力", 0.0, 1000.0, 0.0, step=0.5) if manual_distance else 0.0
+        submitted = st.form_submit_button("登録")
+
+    if submitted:
+        if not f_start:
+            st.error("出発地を入力してください")
+            return
+        values = {"start_point": f_start, "name": f_name, "people": f_ppl, "car_type": f_car, "manual": f_manual}
+        key = registration_key(f_name, f_start, f_ppl, f_car)
+        recent = _recent_registrations()
+        if recent.get((str(current_event_id), key), {}).get("done"):
+            st.info("同じ内容で登録済みです（二重送信のため登録しませんでした）。")
+            return
+        index = registration_index()
+        index.refresh(load_sheet("participants"), shared_cache().version("participants"))
+        if index.find(current_event_id, key) is not None and (str(current_event_id), key) not in recent:
+            # 距離の計算・書き込みの前に確認する
+            st.session_state["reg_duplicate"] = (str(current_event_id), key, values)
+        else:
+            register_participant(current_event_id, key, values, loc_addr, venue, degraded)
+
+    pending = st.session_state.get("reg_duplicate")
+    if pending and pending[0] == str(current_event_id):
+        _, key, values = pending
+        st.warning(
+            f"「{values['name']}」（{values['people']}名・{split_car_info(values['car_type'])[0]}）と同じ内容の登録が"
+            "既にあります。別のグループであれば「それでも登録する」を押してください。"
+        )
+        b1, b2 = st.columns(2)
+        if b1.button("それでも登録する", key="reg_duplicate_confirm", type="primary", width="stretch"):
+            st.session_state.pop("reg_duplicate", None)
+            register_participant(current_event_id, key, values, loc_addr, venue, degraded)
+        b2.button("登録しない", key="reg_duplicate_cancel", width="stretch",
+                  on_click=st.session_state.pop, args=("reg_duplicate", None))
+
+def _recent_registrations():
+    """このセッションで最近送った登録 {(event_id, 内容のハッシュ): {"id", "at", "done"}}（古いものは捨てる）。"""
+    now = time.monotonic()
+    recent = st.session_state.setdefault("reg_recent", {})
+    for k in [k for k, v in recent.items() if now - v["at"] > IDEMPOTENCY_WINDOW]:
+        del recent[k]
+    return recent
+
+def register_participant(current_event_id, key, values, loc_addr, venue, degraded):
+    """距離を求めて1件登録する。同じ内容の再送は同じ participant_id で書くので行は増えない。"""
+    recent = _recent_registrations()
+    # 書き込みの途中で再実行（連打）されても、同じ ID で書き直すだけにする
+    entry = recent.setdefault((str(current_event_id), key), {"id": new_participant_id(), "done": False})
+    entry["at"] = time.monotonic()
+
+    f_start = values["start_point"]
+    if values["manual"] > 0:
+        # 手入力の距離は推定値として扱い、上限が戻ったら実測値に置き換える。
+        # 出発地が見つからなければ座標は空のまま登録する。直前に Maps に問い合わせられなかった
+        # 出発地は、課金される問い合わせを重ねないようジオコーディングし直さない
+        if st.session_state.get("reg_geocode_unavailable") == f_start:
+            start = known_start_coords(f_start)
+        else:
+            start = geocode_address(f_start, MAPS_API_KEY)
+        dist, source = values["manual"], SOURCE_ESTIMATED
+    else:
+        with st.spinner("計算中..."):
+            dist, source, start, failure = resolve_distance(f_start, loc_addr, venue, MAPS_API_KEY)
+        if failure == GEOCODE_UNAVAILABLE:
+            st.session_state["reg_geocode_unavailable"] = f_start
+    if not dist:
+        del recent[(str(current_event_id), key)]
+        if degraded or st.session_state.get("reg_manual"):
+            st.error("距離を手入力してください。")
+            return
+        # 入力はフォームに残したまま、距離の手入力欄を出す
+        st.session_state["reg_manual"] = True
+        st.rerun()
+
+    commit_participants([Insert({
+        "participant_id": entry["id"],
+        "event_id": str(current_event_id), "name": values["name"],
+        "start_point": f_start, "distance": dist,
+        "people": values["people"], "car_type": values["car_type"],
+        "start_lat": start[0] if start else None,
+        "start_lon": start[1] if start else None,
+        "distance_source": source,
+        "registered_at": datetime.datetime.now(JST).isoformat(timespec="seconds"),
+    })])
+    entry["done"] = True
+    registration_index().add(current_event_id, key, entry["id"])
+    if source == SOURCE_ESTIMATED:
+        # 実測値は後でバックグラウンドで取得し、推定値を置き換える
+        distance_refiner(MAPS_API_KEY).request(current_event_id, f_start, loc_addr)
+        st.toast("地図サービスで距離を測れなかったため、概算距離で登録しました。")
+    st.session_state.pop("reg_suggestions", None)
+    st.session_state.pop("reg_manual", None)
+    st.session_state.pop("reg_geocode_unavailable", None)
+    st.success("登録しました！")
+    st.rerun()
+
+
+# --- キャッシュのプリウォーム ---
+APP_URL = "https://ecorideeventcalculator-2vhvzkr7oenknbuegaremc.streamlit.app/"
+
+def event_url(event_id):
+    return f"{APP_URL}?event_id={event_id}"
+
+@st.cache_resource
+def prewarmer():
+    return Prewarmer()
+
+def _prewarm_stats():
+    """参加者シートの読み込みと、全イベント共通の集計（市区町村別・重複検知の索引）の初期化。"""
+    version = shared_cache().version("participants")
+    all_p = load_sheet("participants")
+    municipality_tally().update(all_p)
+    registration_index().refresh(all_p, version)
+
+def _prewarm_event_page(event_id, events_df):
+    """参加者画面の QR コードと会場の座標（シートに無ければジオコーディング）。"""
+    generate_qr_image(event_url(event_id))
+    row = events_df[events_df["event_id"].astype(str) == str(event_id)]
+    if not row.empty:
+        event_data = row.iloc[0]
+        venue_coords(event_data, event_data.get("location_address", event_data.get("location_name")), MAPS_API_KEY)
+
+def prewarm_event(event_id):
+    """作成したイベントの初回表示に使うキャッシュをバックグラウンドで作る。"""
+    prewarmer().submit(f"event:{event_id}", [
+        ("participants", _prewarm_stats),
+        ("event_page", lambda: _prewarm_event_page(event_id, load_sheet("events"))),
+    ])
+
+@st.cache_resource
+def prewarm_on_startup():
+    """サーバー起動後の最初の実行で1回だけ、近日開催のイベントをプリウォームする。"""
+    def upcoming():
+        events_df = load_sheet("events")
+        today = datetime.datetime.now(JST).date()
+        for event_id in upcoming_event_ids(events_df, today):
+            _prewarm_event_page(event_id, events_df)
+    prewarmer().submit("startup", [("participants", _prewarm_stats), ("upcoming", upcoming)])
+    return True
+
+
 # --- メイン処理 ---
 
 if "hc_mode" not in st.session_state:
     st.session_state.hc_mode = False
 
-inject_css()
-if st.session_state.hc_mode:
-    inject_hc_css()
+inject_css(st.session_state.hc_mode)
 inject_head_icons()
+prewarm_on_startup()
 
 st.sidebar.markdown("---")
 st.session_state.hc_mode = st.sidebar.toggle(
@@ -1022,7 +1362,12 @@ if not current_event_id:
         "イベント作成・管理パネル",
         "イベントを作成して参加者に招待URLを共有しましょう",
     )
-    tab1, tab2 = st.tabs(["新規イベント作成", "作成済みイベントの管理"])
+    # 集計ダッシュボード（月別グラフで plotly.express を読み込む）・一括編集・ライブウォールは、
+    # そのタブを開いたときだけ実行する（on_change="rerun" でタブの切り替えが再実行になり .open が使える）
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(
+        ["新規イベント作成", "作成済みイベントの管理", "集計ダッシュボード", "参加者の一括編集", "ライブウォール"],
+        key="admin_tab", on_change="rerun",
+    )
 
     with tab1:
         with st.form("create_event"):
@@ -1035,10 +1380,14 @@ if not current_event_id:
             if st.form_submit_button("イベントを作成"):
                 if e_name and e_loc_name and e_loc_addr:
                     new_id = str(uuid.uuid4())[:8]
-                    append_to_sheet("events", {
+                    venue = geocode_address(e_loc_addr, MAPS_API_KEY)
+                    commit_events([Insert({
                         "event_id": new_id, "event_name": e_name, "event_date": str(e_date),
-                        "location_name": e_loc_name, "location_address": e_loc_addr
-                    })
+                        "location_name": e_loc_name, "location_address": e_loc_addr,
+                        "location_lat": venue[0] if venue else None,
+                        "location_lon": venue[1] if venue else None,
+                    })])
+                    prewarm_event(new_id)
                     st.success("作成しました！")
                     st.rerun()
                 else:
@@ -1046,11 +1395,17 @@ if not current_event_id:
 
     with tab2:
         st.subheader("作成済みイベント一覧")
-        events_df = load_sheet("events")
+        if "admin_notice" in st.session_state:
+            st.success(st.session_state.pop("admin_notice"))
+        events_df, all_p = load_sheets("events", "participants")
         if not events_df.empty and "location_name" in events_df.columns:
-            for index, row in events_df[::-1].iterrows():
-                base_url = "https://ecorideeventcalculator-2vhvzkr7oenknbuegaremc.streamlit.app/"
-                invite_url = f"{base_url}?event_id={row['event_id']}"
+            # 参加者の編集と同じく、フォームを表示した時点のリビジョンで比較交換する
+            seen_events = st.session_state.setdefault("event_seen_revisions", {})
+            for _, row in events_df[::-1].iterrows():
+                event_id = row['event_id']
+                base = seen_events.get(event_id, row[REVISION_COLUMN])
+                seen_events[event_id] = row[REVISION_COLUMN]
+                invite_url = event_url(event_id)
                 with st.container(border=True):
                     col_info, col_btn = st.columns([4, 1])
                     with col_info:
@@ -1061,10 +1416,19 @@ if not current_event_id:
                             unsafe_allow_html=True,
                         )
                     with col_btn:
-                        st.link_button("参加者画面へ", invite_url, use_container_width=True)
+                        st.link_button("参加者画面へ", invite_url, width="stretch")
+
+                    with st.expander("データの書き出し"):
+                        show_export_buttons(
+                            f"ecoride_{row['event_id']}",
+                            lambda eid=str(row['event_id']): all_p[all_p["event_id"].astype(str) == eid],
+                            events_df,
+                            row['event_name'],
+                            f"{row['event_date']}  |  {row['location_name']}",
+                        )
 
                     with st.expander("編集・削除"):
-                        with st.form(f"edit_{row['event_id']}"):
+                        with st.form(f"edit_{event_id}"):
                             col_l, col_r = st.columns(2)
                             with col_l:
                                 n_name = st.text_input("イベント名", value=row['event_name'])
@@ -1074,29 +1438,96 @@ if not current_event_id:
                                 n_date = st.text_input("開催日", value=row['event_date'])
                             st.markdown("---")
                             c_up, c_del = st.columns(2)
-                            if c_up.form_submit_button("更新する", use_container_width=True):
-                                events_df.at[index, 'event_name'] = n_name
-                                events_df.at[index, 'location_name'] = n_loc
-                                events_df.at[index, 'location_address'] = n_addr
-                                events_df.at[index, 'event_date'] = n_date
-                                update_sheet_data("events", events_df)
-                                st.rerun()
-                            if c_del.form_submit_button("削除する", type="primary", use_container_width=True):
-                                events_df = events_df.drop(index)
-                                update_sheet_data("events", events_df)
+                            change = None
+                            if c_up.form_submit_button("更新する", width="stretch"):
+                                fields = {"event_name": n_name, "location_name": n_loc,
+                                          "location_address": n_addr, "event_date": n_date}
+                                venue_changed = n_addr != row['location_address']
+                                if venue_changed:
+                                    venue = geocode_address(n_addr, MAPS_API_KEY)
+                                    fields["location_lat"] = venue[0] if venue else None
+                                    fields["location_lon"] = venue[1] if venue else None
+                                change = Update(event_id, fields, base)
+                            if c_del.form_submit_button("削除する", type="primary", width="stretch"):
+                                change = Delete(event_id, base)
+                            if change is not None:
+                                try:
+                                    commit_events([change])
+                                except ConflictError:
+                                    st.error("このイベントは他の人が先に変更・削除しました。最新の内容を表示したので、もう一度確認してください。")
+                                    change = None
+                            if isinstance(change, Update) and venue_changed:
+                                bar = st.progress(0.0, text="参加者の距離を再計算中...")
+                                updated, failed = recalculate_event_distances(
+                                    event_id, n_addr, venue, MAPS_API_KEY,
+                                    progress=lambda done, total: bar.progress(
+                                        done / total, text=f"参加者の距離を再計算中... {done}/{total} 地点"),
+                                )
+                                notice = f"会場の変更に合わせて {updated} 件の距離を再計算しました。"
+                                if failed:
+                                    notice += f"（{failed} 件は再計算できず、以前の距離のままです）"
+                                st.session_state["admin_notice"] = notice
+                            if change is not None:
                                 st.rerun()
         else:
             st.info("イベントなし")
 
+        st.subheader("終了したイベントのアーカイブ")
+        st.caption(f"開催日から {archive.GRACE_DAYS} 日を過ぎたイベントは、参加者データを圧縮スナップショットに移してシートを軽くできます。アーカイブ後は閲覧のみ可能です。")
+        candidates = archive.archivable_event_ids(events_df, datetime.datetime.now(JST).date())
+        if st.button(f"アーカイブする（対象 {len(candidates)} 件）", disabled=not candidates):
+            with st.spinner("スナップショットを書き出しています..."):
+                moved = archive_finished_events(events_df, all_p)
+            st.session_state["admin_notice"] = f"{moved} 件のイベントをアーカイブしました。"
+            st.rerun()
+        archived = archived_events()
+        if not archived.empty:
+            listing = archived.sort_values("event_date", ascending=False)
+            listing = pd.DataFrame({
+                "イベント名": listing["event_name"],
+                "開催日": listing["event_date"],
+                "人数": listing["people"].astype(int),
+                "CO2削減量(kg)": listing["reduction_kg"].round(2),
+                "閲覧URL": [event_url(eid) for eid in listing.index],
+            })
+            st.dataframe(listing, width="stretch", hide_index=True,
+                         column_config={"閲覧URL": st.column_config.LinkColumn()})
+
+    with tab3:
+        if tab3.open:
+            st.subheader("全イベントの集計")
+            show_organizer_dashboard()
+
+    with tab4:
+        if tab4.open:
+            st.subheader("参加者の一括編集")
+            if "bulk_notice" in st.session_state:
+                st.success(st.session_state.pop("bulk_notice"))
+            if "bulk_conflict" in st.session_state:
+                st.warning(st.session_state.pop("bulk_conflict"))
+            show_bulk_editor(load_sheet("events"))
+
+    with tab5:
+        if tab5.open:
+            st.subheader("ライブウォール")
+            show_live_wall_picker(load_sheet("events"))
+
 # ==========================================
 # モードB: 参加者・集計画面
 # ==========================================
 else:
-    events_df = load_sheet("events")
+    events_df, all_p = load_sheets("events", "participants")
     events_df["event_id"] = events_df["event_id"].astype(str)
     target_event = events_df[events_df["event_id"] == str(current_event_id)]
 
-    if target_event.empty:
+    archived = archived_events() if target_event.empty else None
+
+    if target_event.empty and str(current_event_id) in archived.index:
+        show_archived_event(str(current_event_id), archived.loc[str(current_event_id)])
+        if st.button("管理者用トップページに戻る"):
+            st.query_params.clear()
+            st.rerun()
+    elif target_event.empty:
         st.error("イベントが見つかりません。")
         if st.button("トップへ"):
             st.query_params.clear()
@@ -1117,66 +1548,39 @@ else:
             本アプリでは、**環境省「算定・報告・公表制度」** の排出係数を基に、一般的な実燃費を想定して算出しています。
             $$ \\text{1km排出量} = \\frac{\\text{燃料排出係数 (g/L)}}{\\text{想定燃費 (km/L)}} $$
             """)
-            data_items = [{"車種設定": k, "設定排出係数": v} for k, v in CO2_EMISSION_FACTORS.items()]
-            st.table(pd.DataFrame(data_items))
-            st.caption("出典: [環境省_算定方法・排出係数一覧](https://policies.env.go.jp/earth/ghg-santeikohyo/calc.html)")
+            # このイベント向けの上書き（車種モデルの event_overrides）を反映した値
+            car_labels = pd.Series(VEHICLE_MODEL.labels)
+            factors, capacities = VEHICLE_MODEL.lookup(car_labels, pd.Series(str(current_event_id), index=car_labels.index))
+            st.table(pd.DataFrame({
+                "車種設定": car_labels,
+                "設定排出係数": [f"{v:g}" for v in factors],
+                "定員": capacities.astype(int),
+            }))
+            st.caption(f"出典: [環境省_算定方法・排出係数一覧](https://policies.env.go.jp/earth/ghg-santeikohyo/calc.html)（車種モデル {MODEL_VERSION}）")
 
         st.sidebar.title("メニュー")
         app_mode = st.sidebar.radio("モード選択", ["参加登録・編集", "ライブモニター"], index=0)
 
         col_main, col_qr = st.columns([3, 2])
 
-        event_url = f"https://ecorideeventcalculator-2vhvzkr7oenknbuegaremc.streamlit.app/?event_id={current_event_id}"
+        invite_url = event_url(current_event_id)
         with col_qr:
             with st.expander("QRコードを表示", expanded=False):
-                st.image(generate_qr_image(event_url), use_container_width=True)
-                st.caption(f"参加登録URL：{event_url}")
+                st.image(generate_qr_image(invite_url), width="stretch")
+                st.caption(f"参加登録URL：{invite_url}")
 
         with col_main:
             if app_mode == "ライブモニター":
-                show_live_monitor(str(current_event_id))
+                show_live_monitor(str(current_event_id), loc_addr)
 
             else:
                 st.markdown("### 参加登録・編集モード")
 
                 st.sidebar.markdown("---")
-                st.sidebar.header("新規登録")
-                st.sidebar.markdown("##### 1. 出発地を検索")
-                search_query = st.sidebar.text_input("地名/駅名", key="search_box")
-                selected_address = None
-                if search_query:
-                    suggestions = get_place_suggestions(search_query, MAPS_API_KEY)
-                    if suggestions:
-                        options = [s["label"] for s in suggestions]
-                        selected_address = st.sidebar.selectbox("候補を選択", options)
-                    else:
-                        st.sidebar.warning("候補なし")
-
-                st.sidebar.markdown("##### 2. 詳細登録")
-                with st.sidebar.form("join_form"):
-                    start_val = selected_address if selected_address else ""
-                    f_start = st.text_input("出発地(確定)", value=start_val)
-                    f_name = st.text_input("名前/グループ名")
-                    f_ppl = st.number_input("人数", 1, 10, 2)
-                    f_car = st.selectbox("車種", list(CO2_EMISSION_FACTORS.keys()))
-                    if st.form_submit_button("登録"):
-                        if f_start:
-                            with st.spinner("計算中..."):
-                                dist = get_distance(f_start, loc_addr, MAPS_API_KEY)
-                            if dist:
-                                append_to_sheet("participants", {
-                                    "event_id": str(current_event_id), "name": f_name,
-                                    "start_point": f_start, "distance": dist,
-                                    "people": f_ppl, "car_type": f_car
-                                })
-                                st.success("登録しました！")
-                                st.rerun()
-                            else:
-                                st.error("場所不明")
-                        else:
-                            st.error("出発地を入力してください")
+                with st.sidebar:
+                    show_registration_form(str(current_event_id), loc_addr, venue_coords(event_data, loc_addr, MAPS_API_KEY))
 
-                all_p = load_sheet("participants")
+                all_p = apply_refined_distances(all_p, current_event_id, loc_addr, MAPS_API_KEY)
                 total_solo, total_share, actual_cars, total_people, df_p = calculate_stats(all_p, current_event_id)
 
                 if not df_p.empty:
@@ -1184,7 +1588,7 @@ else:
 
                     reduction_kg = (total_solo - total_share) / 1000
                     occupancy_rate = total_people / actual_cars if actual_cars > 0 else 0
-                    cedar_trees = reduction_kg / 8.8  # 林野庁算定値: 8.8 kg-CO2/本/年（36〜40年生スギ人工林、1,000本/ha）
+                    cedar_trees = reduction_kg / CEDAR_KG_PER_TREE
 
                     c = _C["hc"] if st.session_state.get("hc_mode", False) else _C["normal"]
                     render_metric_cards([
@@ -1194,25 +1598,37 @@ else:
                     ])
                     st.caption("※ 杉の木換算：8.8 kg-CO₂/本/年（出典：林野庁「森林はどのぐらいの量の二酸化炭素を吸収しているの？」36〜40年生スギ人工林・1,000本/ha 基準）")
 
-                    chart_data = pd.DataFrame({
-                        "状況": ["1人1台の場合", "相乗り"],
-                        "CO2排出量 (kg)": [total_solo/1000, total_share/1000],
-                    })
-                    st.plotly_chart(make_plotly_fig(chart_data, c), use_container_width=True)
-                    render_car_count_card(total_people, actual_cars, c)
+                    st.plotly_chart(co2_bar_figure(total_solo / 1000, total_share / 1000, _theme()),
+                                    width="stretch")
+                    render_car_count_card(total_people, actual_cars)
+
+                    with st.expander("グループ間の相乗りマッチング提案（試算）"):
+                        show_carpool_suggestions(df_p, total_share, actual_cars)
+
+                    with st.expander("車種構成・相乗り率のシナリオ試算"):
+                        show_scenario_explorer(df_p, c)
+
+                    with st.expander("市区町村別ランキング"):
+                        ranked = leaderboard(municipality_tally().update(all_p), current_event_id)
+                        show_municipality_ranking(ranked)
 
                     st.markdown("#### 登録内容の修正・削除")
                     st.caption("リスト上の出発地はプライバシー保護のため市町村のみ表示されます。")
 
                     car_keys = list(CO2_EMISSION_FACTORS.keys())
+                    # 前回の表示のときの各行のリビジョン。ボタンを押した実行ではシートを読み直しているので、
+                    # 利用者が見ていた内容はこちらで比べる（その間に他の人が変えていれば衝突）
+                    seen = st.session_state.setdefault("edit_seen_revisions", {})
                     for idx, row in df_p[::-1].iterrows():
-                        o_idx = row['original_index']
+                        pid = row['participant_id']
+                        base = seen.get(pid, row[REVISION_COLUMN])
+                        seen[pid] = row[REVISION_COLUMN]
                         safe_address = get_city_level_address(row['start_point'])
                         c_name, c_eff = split_car_info(row['car_type'])
                         title_str = f"{row['name']}  ({safe_address} | {c_name} | {row['people']}名)"
 
                         with st.expander(title_str):
-                            with st.form(f"edit_{o_idx}"):
+                            with st.form(f"edit_{pid}"):
                                 c1, c2 = st.columns(2)
                                 with c1:
                                     p_n = st.text_input("名前/グループ名", value=row['name'])
@@ -1225,17 +1641,27 @@ else:
                                     p_d = st.number_input("距離 (km)", value=float(row['distance']))
 
                                 b1, b2 = st.columns(2)
-                                if b1.form_submit_button("保存", use_container_width=True):
-                                    all_p.at[o_idx, 'name'] = p_n
-                                    all_p.at[o_idx, 'people'] = p_p
-                                    all_p.at[o_idx, 'car_type'] = p_c
-                                    all_p.at[o_idx, 'start_point'] = p_s
-                                    all_p.at[o_idx, 'distance'] = p_d
-                                    update_sheet_data("participants", all_p.drop(columns=['original_index']))
-                                    st.rerun()
-                                if b2.form_submit_button("削除", type="primary", use_container_width=True):
-                                    update_sheet_data("participants", all_p.drop(index=o_idx).drop(columns=['original_index']))
-                                    st.rerun()
+                                change = None
+                                if b1.form_submit_button("保存", width="stretch"):
+                                    fields = {"name": p_n, "people": p_p, "car_type": p_c,
+                                              "start_point": p_s, "distance": p_d}
+                                    if p_s != row['start_point']:
+                                        start = geocode_address(p_s, MAPS_API_KEY)
+                                        fields["start_lat"] = start[0] if start else None
+                                        fields["start_lon"] = start[1] if start else None
+                                    if p_d != float(row['distance']):
+                                        # 手入力された距離は推定値として置き換えない
+                                        fields["distance_source"] = SOURCE_MEASURED
+                                    change = Update(pid, fields, base)
+                                if b2.form_submit_button("削除", type="primary", width="stretch"):
+                                    change = Delete(pid, base)
+                                if change is not None:
+                                    try:
+                                        commit_participants([change])
+                                    except ConflictError:
+                                        st.error("この登録は他の人が先に変更・削除しました。最新の内容を表示したので、もう一度確認してください。")
+                                    else:
+                                        st.rerun()
                 else:
                     st.info("参加者なし")
 
@@ -0,0 +1,4 @@
+"""イベント相乗りCO2削減シミュレーターの共通モジュール群。
+
+UI 本体は eco_ride_app.py。ここに置くモジュールは Streamlit の画面描画を行わない。
+"""
@@ -0,0 +1,145 @@
+"""終了したイベントのアーカイブ（列指向スナップショット）。
+
+開催日から猶予期間が過ぎたイベントは、参加者行を zstd 圧縮の Parquet に、集計値を
+凍結した統計レコードとして書き出し、Google スプレッドシート（ホット）からは取り除く。
+これにより load_sheet() が読む行数は開催前・開催直後のイベント分だけになる。
+
+    <archive_dir>/
+        index.parquet              アーカイブ済みイベントの一覧と凍結した集計値
+        municipalities.parquet     市区町村別の凍結した集計値
+        <event_id>/participants.parquet
+
+スナップショットは書き込み → 読み戻して行数を確認 → 一覧の更新、の順に行い、
+呼び出し側は成功したイベントだけをシートから消す。アーカイブ済みのイベントは
+読み取り専用で、参加者行は開いたときに初めて読み込む。
+archive_dir は再起動で消えない場所（永続ボリュームなど）に置くこと。
+"""
+import datetime
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from ecoride.regions import add_reduction, aggregate_by_municipality
+from ecoride.stats import MODEL_VERSION, SUM_COLUMNS, add_summary_columns, aggregate_by_event
+
+# 開催日の翌日からこの日数が過ぎたらアーカイブ対象（後からの修正・削除の猶予）
+GRACE_DAYS = 30
+COMPRESSION = "zstd"
+
+INDEX_FILE = "index.parquet"
+MUNICIPALITIES_FILE = "municipalities.parquet"
+PARTICIPANTS_FILE = "participants.parquet"
+# 凍結した集計値と一緒に保存する列
+INDEX_COLUMNS = ["archived_at", "model_version"]
+EVENT_COLUMNS = ["event_id", "event_name", "event_date", "location_name", "location_address",
+                 "location_lat", "location_lon"]
+
+
+def archivable_event_ids(events_df: pd.DataFrame, today: datetime.date, grace_days=GRACE_DAYS) -> list:
+    """開催日 + grace_days を過ぎたイベントの event_id。開催日が読めないイベントは対象外。"""
+    if events_df.empty or "event_date" not in events_df.columns:
+        return []
+    dates = pd.to_datetime(events_df["event_date"], errors="coerce")
+    cutoff = pd.Timestamp(today) - pd.Timedelta(days=grace_days)
+    return events_df.loc[dates < cutoff, "event_id"].astype(str).drop_duplicates().tolist()
+
+
+def _write_atomic(df: pd.DataFrame, path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_parquet(tmp, index=False, compression=COMPRESSION)
+    os.replace(tmp, path)
+
+
+def _snapshot_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """シートの列は型が混ざっていることがあるので、文字列以外の object 列は文字列にそろえる。"""
+    df = df.reset_index(drop=True).drop(columns=["original_index"], errors="ignore")
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda v: v if v is None or isinstance(v, str) or pd.isna(v) else str(v))
+    return df
+
+
+def load_index(archive_dir) -> pd.DataFrame:
+    """アーカイブ済みイベントの一覧（index は event_id、列はイベント情報 + SUM_COLUMNS + INDEX_COLUMNS + 要約列）。
+
+    model_version は凍結した集計値を出したときの車種モデルの版。
+    """
+    path = Path(archive_dir) / INDEX_FILE
+    if not path.exists():
+        empty = pd.DataFrame(columns=EVENT_COLUMNS[1:] + SUM_COLUMNS + INDEX_COLUMNS)
+        empty.index.name = "event_id"
+        return add_summary_columns(empty.astype({c: float for c in SUM_COLUMNS}))
+    index = pd.read_parquet(path).set_index("event_id")
+    # 版を記録する前に作った一覧には model_version 列が無い
+    for col in INDEX_COLUMNS:
+        if col not in index.columns:
+            index[col] = None
+    return add_summary_columns(index)
+
+
+def load_municipalities(archive_dir) -> pd.DataFrame:
+    """アーカイブ済みイベントの市区町村別集計（index は event_id, prefecture, municipality）。"""
+    path = Path(archive_dir) / MUNICIPALITIES_FILE
+    if not path.exists():
+        return aggregate_by_municipality(pd.DataFrame())
+    table = pd.read_parquet(path).set_index(["event_id", "prefecture", "municipality"])
+    return add_reduction(table)
+
+
+def load_participants(archive_dir, event_id) -> pd.DataFrame:
+    """アーカイブ済みイベントの参加者行。スナップショットが無ければ空の DataFrame。"""
+    path = Path(archive_dir) / str(event_id) / PARTICIPANTS_FILE
+    if not path.exists():
+        return pd.DataFrame()
+    return pd.read_parquet(path)
+
+
+def archive_events(events_df: pd.DataFrame, participants_df: pd.DataFrame, event_ids, archive_dir) -> list:
+    """event_ids のイベントをスナップショットに書き出し、一覧に凍結した集計値を追加する。
+
+    返り値は書き出しと読み戻しの確認に成功した event_id のリスト。シートからの削除は
+    呼び出し側がこのリストに対してだけ行う。
+    """
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    events = events_df.assign(event_id=events_df["event_id"].astype(str))
+    events = events.drop_duplicates("event_id", keep="last").set_index("event_id")
+    if participants_df.empty or "event_id" not in participants_df.columns:
+        participants_df = pd.DataFrame(columns=["event_id"])
+    participants = participants_df.assign(event_id=participants_df["event_id"].astype(str))
+    groups = participants.groupby("event_id", sort=False)
+
+    archived = []
+    for event_id in map(str, event_ids):
+        if event_id not in events.index:
+            continue
+        rows = groups.get_group(event_id) if event_id in groups.groups else participants.iloc[:0]
+        event_dir = archive_dir / event_id
+        event_dir.mkdir(exist_ok=True)
+        path = event_dir / PARTICIPANTS_FILE
+        _write_atomic(_snapshot_frame(rows), path)
+        if len(pd.read_parquet(path, columns=["event_id"])) != len(rows):
+            continue
+        archived.append(event_id)
+    if not archived:
+        return []
+
+    stats = aggregate_by_event(participants[participants["event_id"].isin(archived)])[SUM_COLUMNS]
+    info = events.reindex(index=archived, columns=EVENT_COLUMNS[1:])
+    record = info.join(stats).fillna({c: 0.0 for c in SUM_COLUMNS})
+    record["archived_at"] = pd.Timestamp.now(tz="UTC").isoformat()
+    record["model_version"] = MODEL_VERSION
+    record.index.name = "event_id"
+
+    current = load_index(archive_dir)[EVENT_COLUMNS[1:] + SUM_COLUMNS + INDEX_COLUMNS]
+    current = current.drop(index=archived, errors="ignore")
+    index = pd.concat([current, record]) if not current.empty else record
+
+    places = aggregate_by_municipality(participants[participants["event_id"].isin(archived)])
+    places = places.drop(columns="reduction_kg").reset_index()
+    known = load_municipalities(archive_dir).drop(columns="reduction_kg").reset_index()
+    known = known[~known["event_id"].isin(archived)]
+    places = pd.concat([known, places], ignore_index=True) if not known.empty else places
+    _write_atomic(places, archive_dir / MUNICIPALITIES_FILE)
+    _write_atomic(_snapshot_frame(index.reset_index()), archive_dir / INDEX_FILE)
+    return archived
@@ -0,0 +1,177 @@
+"""参加者シートのエクスポートから全イベントの集計を一括で再計算する CLI。
+
+Streamlit を起動せずに ecoride.stats の排出量モデルを適用する。入力はチャンク単位で
+読み込み、チャンクごとの部分集計をプロセスプールで並列に計算してから合算するため、
+メモリに載らない大きさのファイルでも処理できる。
+
+    python -m ecoride.batch participants.csv --events events.csv -o report.csv
+    python -m ecoride.batch part-*.parquet -o report.parquet --workers 8
+    python -m ecoride.batch participants.csv --model-version 2025.1 -o report_2025.1.csv
+
+出力には集計に使った車種モデルの版（model_version 列）を付ける。--model-version で古い版を
+指定すれば、係数を更新した後でもその版で出した集計を再現できる。
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import pandas as pd
+
+from ecoride.stats import (
+    MODEL_VERSION,
+    SUM_COLUMNS,
+    add_summary_columns,
+    aggregate_by_event,
+    overall_totals,
+    with_event_info,
+)
+from ecoride.vehicles import load_model
+
+# 集計に必要な列だけを読む
+INPUT_COLUMNS = ["event_id", "people", "distance", "car_type"]
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE, columns=INPUT_COLUMNS):
+    """CSV / Parquet を DataFrame のチャンクとして順に読み込む。"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        present = [c for c in columns if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=chunksize, columns=present):
+            yield batch.to_pandas()
+    elif suffix in (".csv", ".txt", ".gz"):
+        yield from pd.read_csv(
+            path,
+            chunksize=chunksize,
+            usecols=lambda c: c in columns,
+            dtype={"event_id": str},
+        )
+    else:
+        raise ValueError(f"未対応の形式です: {path}（.csv / .parquet）")
+
+
+def partial_totals(chunk: pd.DataFrame, model=None) -> pd.DataFrame:
+    """1チャンク分のイベント別部分集計（合算可能な列のみ）。model は車種モデル（省略時は最新版）。"""
+    return aggregate_by_event(chunk, model)[SUM_COLUMNS]
+
+
+def _run_chunk(chunk, model):
+    return partial_totals(chunk, model), len(chunk)
+
+
+def _merge(parts):
+    return pd.concat(parts).groupby(level=0, sort=False).sum()
+
+
+def compute_totals(paths, workers=None, chunksize=DEFAULT_CHUNKSIZE, progress=None, model=None) -> pd.DataFrame:
+    """全ファイルを読み、イベント別の合計（SUM_COLUMNS + 要約列）を返す。model は partial_totals() と同じ。
+
+    プールに投入するチャンクは workers*2 個までに抑え、読み込みが計算を追い越して
+    メモリを使い切らないようにする。
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    parts = []
+    pending = set()
+    done_rows = 0
+
+    def collect(finished):
+        nonlocal parts, done_rows
+        for fut in finished:
+            part, n_rows = fut.result()
+            parts.append(part)
+            done_rows += n_rows
+        if len(parts) > 64:
+            parts = [_merge(parts)]
+        if progress:
+            progress(done_rows)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path in paths:
+            for chunk in iter_chunks(path, chunksize):
+                if len(pending) >= max_in_flight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending.add(pool.submit(_run_chunk, chunk, model))
+        finished, pending = wait(pending)
+        collect(finished)
+
+    if not parts:
+        return aggregate_by_event(pd.DataFrame())
+    totals = _merge(parts)
+    totals.index.name = "event_id"
+    return add_summary_columns(totals)
+
+
+def build_report(totals: pd.DataFrame, events_df=None, model_version=None) -> pd.DataFrame:
+    """イベント情報（名前・開催日・会場）と車種モデルの版を付けた出力用の表にする。"""
+    report = with_event_info(totals, events_df, how="right").reset_index()
+    report[["groups", "people", "cars"]] = report[["groups", "people", "cars"]].astype("int64")
+    report["model_version"] = str(model_version) if model_version is not None else MODEL_VERSION
+    return report
+
+
+def write_report(report: pd.DataFrame, totals: dict, output: Path, model_version=None) -> None:
+    suffix = output.suffix.lower()
+    if suffix in (".parquet", ".pq"):
+        report.to_parquet(output, index=False)
+    elif suffix == ".json":
+        payload = {
+            "model_version": str(model_version) if model_version is not None else MODEL_VERSION,
+            "overall": totals,
+            "events": report.to_dict(orient="records"),
+        }
+        output.write_text(json.dumps(payload, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+    else:
+        # Excel で開けるよう BOM 付き UTF-8
+        report.to_csv(output, index=False, encoding="utf-8-sig")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("participants", nargs="+", type=Path, help="参加者シートのエクスポート（CSV / Parquet）")
+    parser.add_argument("--events", type=Path, help="イベントシートのエクスポート（名前・開催日の付与用）")
+    parser.add_argument("-o", "--output", type=Path, default=Path("event_report.csv"),
+                        help="出力先（.csv / .parquet / .json、既定: event_report.csv）")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU 数）")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1チャンクの行数")
+    parser.add_argument("--model-version", help="集計に使う車種モデルの版（既定: 最新版。ecoride/vehicle_models/）")
+    args = parser.parse_args(argv)
+
+    try:
+        model = load_model(args.model_version)
+    except FileNotFoundError:
+        parser.error(f"車種モデルの版がありません: {args.model_version}")
+
+    def progress(rows):
+        print(f"\r{rows:,} 行を集計済み", end="", file=sys.stderr, flush=True)
+
+    per_event = compute_totals(args.participants, args.workers, args.chunksize, progress, model)
+    print(file=sys.stderr)
+
+    events_df = None
+    if args.events:
+        events_df = pd.concat(
+            iter_chunks(args.events, columns=["event_id", "event_name", "event_date", "location_name"]),
+            ignore_index=True,
+        )
+    report = build_report(per_event, events_df, model.version)
+    totals = overall_totals(per_event) if not per_event.empty else {}
+    write_report(report, totals, args.output, model.version)
+
+    print(f"{len(report)} イベントを {args.output} に書き出しました（車種モデル {model.version}）。")
+    if totals:
+        print(f"合計 CO2 削減量: {totals['reduction_kg']:.2f} kg / 平均相乗り率: {totals['occupancy']:.2f} 人/台 "
+              f"/ 杉の木換算: 約 {totals['cedar_trees']:.1f} 本")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
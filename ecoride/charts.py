@@ -0,0 +1,71 @@
+"""CO2 排出量の棒グラフ（1人1台の場合 / 相乗り）。
+
+参加者画面・ライブモニター（10秒ごと）・アーカイブ画面で同じグラフを描くが、合計値が
+変わらない再実行のほうが多い。px.bar の組み立ては 1回 30ms 程度かかるので、
+（表示の丸めで区別できない合計値, テーマ, ラベル）ごとに組み立て済みの Figure を保持する。
+
+st.plotly_chart は渡された Figure を毎回 JSON にする（1〜3ms）が、同じ合計値なら
+毎回同じ JSON になる。返す Figure はキャッシュの中身そのものなので、呼び出し側で変更しないこと。
+"""
+import functools
+
+import pandas as pd
+
+from ecoride.theme import PALETTES
+
+LABELS = ("1人1台の場合", "相乗り")
+# 棒の上の表示は 0.1 kg 単位なので、それより細かい違いでは作り直さない
+PRECISION = 1
+
+
+def build_co2_bar_figure(solo_kg, share_kg, c, labels=LABELS):
+    """棒グラフを組み立てる（キャッシュなし）。c はテーマのパレット。"""
+    import plotly.express as px
+
+    chart_data = pd.DataFrame({"状況": list(labels), "CO2排出量 (kg)": [solo_kg, share_kg]})
+    fig = px.bar(
+        chart_data,
+        x="状況",
+        y="CO2排出量 (kg)",
+        color="状況",
+        color_discrete_sequence=[c["bar_solo"], c["bar_share"]],
+        text="CO2排出量 (kg)",
+        template="plotly_white",
+    )
+    fig.update_layout(
+        plot_bgcolor="rgba(0,0,0,0)",
+        paper_bgcolor="rgba(0,0,0,0)",
+        showlegend=False,
+        yaxis=dict(showgrid=True, gridcolor=c["grid"], gridwidth=1),
+        xaxis=dict(showgrid=False),
+        font=dict(size=15, color=c["chart_font"]),
+        margin=dict(t=20, b=10, l=10, r=10),
+        bargap=0.35,
+    )
+    fig.update_traces(
+        texttemplate='<b>%{y:.1f} kg</b>',
+        textposition='inside',
+        textfont=dict(size=32, color=c["bar_text"]),
+        marker=dict(line=dict(width=0), cornerradius=8),
+    )
+    return fig
+
+
+# Figure は1つ 130KB 程度ある。合計値は登録のたびに増えて古い値には戻らないので、
+# 同時に表示しているイベント × テーマ × ラベル分が入れば足りる
+@functools.lru_cache(maxsize=64)
+def _cached_figure(solo_kg, share_kg, theme, labels):
+    return build_co2_bar_figure(solo_kg, share_kg, PALETTES[theme], labels)
+
+
+def co2_bar_figure(solo_kg, share_kg, theme="normal", labels=LABELS):
+    """棒グラフ（キャッシュあり）。theme は PALETTES のキー。"""
+    return _cached_figure(round(float(solo_kg), PRECISION), round(float(share_kg), PRECISION), theme, tuple(labels))
+
+
+def cache_info():
+    return _cached_figure.cache_info()
+
+
+def cache_clear():
+    _cached_figure.cache_clear()
@@ -0,0 +1,454 @@
+"""シート書き込みの楽観的排他制御（イベント単位のリビジョン + 比較交換 + 自動マージ）。
+
+各ワーカーが「読んだ DataFrame を丸ごと書き戻す」と、同時に行われた登録や修正が消えてしまう。
+ここでは書き込みを「変更の集合（changeset）」として表し、書く直前に最新のシートを
+読み直して適用する。
+
+- 行は participant_id（登録時に払い出す不変の ID）で指定する。行番号は削除でずれるため使わない。
+- イベント（パーティション）ごとにリビジョンを持ち、書き込んだ行には row_revision として
+  その時点のリビジョンを記録する。
+- 変更は「読んだ時点のリビジョン（base_revision）」付きで送る。対象行の row_revision が
+  base_revision 以下なら、その後に誰も触っていないので他の変更とマージして書ける（比較交換）。
+  超えていれば ConflictError。追加（Insert）は衝突しない。
+- 同時に届いた changeset はまとめて1回の書き込みにする（グループコミット）。書き込み中に
+  届いたものは次の1回にまとめられるので、同時登録が増えるほど1回あたりの件数が増え、
+  シートへの往復回数は増えない。
+- 書き込み権はパーティション単位（SharedCache.lease() の "write:<シート>@<パーティション>"）。
+  行単位で書けるストアなら、別のイベントへの書き込みは全ワーカーを通して同時に進む。
+  シート全体の貸与 "write:<シート>" は共有で取り、シート全体を書き直すとき（圧縮、
+  行単位で書けないストア）だけ排他で取る。
+
+行単位の書き込みでは行番号が変わらないように、削除した行は消さずに deleted_at を書いた
+「墓標」として残す（読むときに live_rows() で除く）。墓標は compact() でまとめて取り除く。
+
+ストアは次のメソッドを持つオブジェクト（WholeSheetStore、ecoride.sheets.WorksheetStore）。
+
+- read(): 最新のシート（キャッシュを通さない）。index はシートのデータ行の番号（0 始まり）
+- write_rows(df, updates, appends): read() で読んだ df の {行番号: 行} を書き換え、appends の行を末尾に追加
+- replace(df): シート全体を df で置き換える
+- row_level: write_rows() が指定した行だけを書くなら True
+"""
+import contextlib
+import datetime
+import threading
+from concurrent.futures import Future
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMN = "participant_id"
+REVISION_COLUMN = "row_revision"
+DELETED_COLUMN = "deleted_at"
+
+# 参加者 ID を決めるときに使う列（ID の無い古い行用）
+_LEGACY_ID_COLUMNS = ["event_id", "name", "start_point", "people", "car_type"]
+
+
+class ConflictError(Exception):
+    """読んだ後に他の人が同じ行を変更・削除した。"""
+
+
+class Insert(NamedTuple):
+    row: dict
+
+
+class Update(NamedTuple):
+    row_id: str
+    fields: dict
+    base_revision: int
+
+
+class Delete(NamedTuple):
+    row_id: str
+    base_revision: int
+
+
+def new_participant_id() -> str:
+    import uuid
+
+    return uuid.uuid4().hex[:16]
+
+
+def ensure_ids(df: pd.DataFrame, id_column=ID_COLUMN, legacy_columns=_LEGACY_ID_COLUMNS) -> pd.DataFrame:
+    """ID の無い行に、内容から決まる ID（同じ内容の行は出現順で区別）を付ける。
+
+    導入前に登録された行も、次に書き込まれるまでの間は読むたびに同じ ID になる。
+    """
+    if df.empty:
+        return df.reindex(columns=[*df.columns, *[c for c in (id_column, REVISION_COLUMN) if c not in df.columns]])
+    df = df.copy()
+    if id_column not in df.columns:
+        df[id_column] = np.nan
+    if REVISION_COLUMN not in df.columns:
+        df[REVISION_COLUMN] = 0
+    df[REVISION_COLUMN] = pd.to_numeric(df[REVISION_COLUMN], errors="coerce").fillna(0).astype("int64")
+
+    missing = df[id_column].isna() | (df[id_column].astype(str).str.strip() == "")
+    if missing.any():
+        content = df.loc[missing].reindex(columns=legacy_columns).astype(str)
+        hashes = pd.Series(pd.util.hash_pandas_object(content, index=False).to_numpy(), index=content.index)
+        occurrence = hashes.groupby(hashes).cumcount()
+        ids = "legacy-" + hashes.map("{:016x}".format) + "-" + occurrence.astype(str)
+        df[id_column] = df[id_column].astype(object)
+        df.loc[missing, id_column] = ids
+    df[id_column] = df[id_column].astype(str)
+    return df
+
+
+def deleted_rows(df: pd.DataFrame) -> pd.Series:
+    """墓標（deleted_at が書かれた行）かどうか。"""
+    if DELETED_COLUMN not in df.columns:
+        return pd.Series(False, index=df.index)
+    marks = df[DELETED_COLUMN]
+    return marks.notna() & (marks.astype(str).str.strip() != "")
+
+
+def live_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """墓標を除き、deleted_at の列も落とす。ID は墓標を含めた状態で ensure_ids() してから除くこと。"""
+    if DELETED_COLUMN not in df.columns:
+        return df
+    return df[~deleted_rows(df)].drop(columns=DELETED_COLUMN)
+
+
+def partition_revision(df: pd.DataFrame, partition_column, partition) -> int:
+    """df に含まれる partition の行の最大 row_revision。"""
+    if df.empty or partition_column not in df.columns or REVISION_COLUMN not in df.columns:
+        return 0
+    rows = df[df[partition_column].astype(str) == str(partition)]
+    if rows.empty:
+        return 0
+    return int(pd.to_numeric(rows[REVISION_COLUMN], errors="coerce").fillna(0).max())
+
+
+def apply_changesets(df, changesets, partition_column, revisions, id_column=ID_COLUMN):
+    """changeset を順に適用する。
+
+    revisions は {パーティション: 現在のリビジョン}（無いものは 0 とみなす）。
+    各 changeset は全体が適用されるか、ConflictError で全体が捨てられるかのどちらか。
+    先に適用した changeset の結果（追加した行を含む）は、後の changeset から見える。
+    同じ changeset の中で先に書いた行は、自分の変更なので比較しない。
+    返り値は (適用後の DataFrame, [changeset ごとの {パーティション: 新リビジョン} または ConflictError])。
+    このバッチで書いた行の row_revision は、そのパーティションの現在のリビジョン + 1。
+    """
+    table = df.set_index(id_column, drop=False)
+    table = table[~table.index.duplicated(keep="last")]
+    deleted = set()
+    inserted = {}  # 行 ID → 追加する行（追加順）
+    results = []
+
+    def next_revision(partition):
+        return int(revisions.get(partition, 0)) + 1
+
+    def current(row_id):
+        """(パーティション, row_revision)。無い・削除済みなら None。"""
+        if row_id in inserted:
+            row = inserted[row_id]
+            return str(row[partition_column]), int(row[REVISION_COLUMN])
+        if row_id in table.index and row_id not in deleted:
+            return str(table.at[row_id, partition_column]), int(table.at[row_id, REVISION_COLUMN])
+        return None
+
+    for changeset in changesets:
+        try:
+            touched = {}
+            plan = []
+            state = {}  # この changeset で書いた行 → 適用後の状態（削除なら None）
+            for op in changeset:
+                if isinstance(op, Insert):
+                    row_id = str(op.row[id_column])
+                    exists = state[row_id] is not None if row_id in state else current(row_id) is not None
+                    if exists:
+                        continue  # 同じ登録の再送は1件として扱う
+                    partition = str(op.row[partition_column])
+                    plan.append(("insert", row_id, dict(op.row, **{REVISION_COLUMN: next_revision(partition)})))
+                    touched[partition] = next_revision(partition)
+                    state[row_id] = (partition, next_revision(partition))
+                    continue
+
+                row_id = str(op.row_id)
+                found = state[row_id] if row_id in state else current(row_id)
+                if found is None:
+                    if isinstance(op, Delete):
+                        continue  # 既に消えている行の削除は結果が同じ
+                    raise ConflictError(f"{row_id} は既に削除されています")
+                partition, revision = found
+                if row_id not in state and revision > op.base_revision:
+                    raise ConflictError(f"{row_id} は他の人が更新しました")
+                touched[partition] = next_revision(partition)
+                if isinstance(op, Delete):
+                    plan.append(("delete", row_id, None))
+                    state[row_id] = None
+                else:
+                    plan.append(("update", row_id, dict(op.fields, **{REVISION_COLUMN: next_revision(partition)})))
+                    state[row_id] = (partition, next_revision(partition))
+        except ConflictError as e:
+            results.append(e)
+            continue
+
+        for kind, row_id, values in plan:
+            if kind == "insert":
+                inserted[row_id] = values
+            elif kind == "delete":
+                if inserted.pop(row_id, None) is None:
+                    deleted.add(row_id)
+            elif row_id in inserted:
+                inserted[row_id] = dict(inserted[row_id], **values)
+            else:
+                for col, value in values.items():
+                    if col not in table.columns:
+                        table[col] = None
+                    if table[col].dtype != object and not _fits(table[col], value):
+                        table[col] = table[col].astype(object)
+                    table.at[row_id, col] = value
+        results.append(touched)
+
+    table = table[~table.index.isin(deleted)]
+    if inserted:
+        table = pd.concat([table, pd.DataFrame(list(inserted.values()))], ignore_index=True)
+    return table.reset_index(drop=True), results
+
+
+def _fits(series, value):
+    """値を列の dtype のまま入れられるか（入れられなければ object 列にする）。"""
+    if value is None:
+        return series.dtype.kind == "f"
+    try:
+        return np.can_cast(np.min_scalar_type(value), series.dtype, casting="same_kind")
+    except TypeError:
+        return False
+
+
+class WholeSheetStore:
+    """シート全体を読み書きするだけのストア（read() / write(df) の関数の組）。
+
+    行単位では書けないので、SheetCommitter はシート全体の貸与を排他で取って使う。
+    同時に書くワーカーがいないので、削除した行は墓標にせずそのまま取り除く。
+    """
+
+    row_level = False
+
+    def __init__(self, read, write):
+        self._read = read
+        self._write = write
+
+    def read(self):
+        return self._read()
+
+    def write_rows(self, df, updates, appends):
+        rows = df.to_dict("index")
+        rows.update(updates)
+        kept = [row for row in rows.values() if not _is_tombstone(row)]
+        self._write(pd.DataFrame(kept + list(appends)))
+
+    def replace(self, df):
+        self._write(df)
+
+
+def _is_tombstone(row) -> bool:
+    mark = row.get(DELETED_COLUMN)
+    return mark is not None and not pd.isna(mark) and str(mark).strip() != ""
+
+
+class _Lane:
+    """同じパーティションの組への changeset の待ち行列（リーダーが1人ずつ書き込む）。"""
+
+    def __init__(self):
+        self.queue = []
+        self.flushing = False
+
+
+class SheetCommitter:
+    """1つのワークシートへの changeset をまとめて書き込む（グループコミット）。
+
+    store はシートの読み書き（モジュールの説明を参照）。cache は ecoride.sharedcache.SharedCache
+    （パーティションのリビジョンと書き込み権の管理）。スレッドから commit() を呼ぶと、
+    changeset が触るパーティションの組ごとに、最初の1人がリーダーになって溜まった changeset を
+    まとめて適用・書き込みし、他のスレッドは結果を待つ。別のパーティションへの書き込みは
+    リーダーが別なので同時に進む。パーティションの列は Update で変えられない。
+    """
+
+    def __init__(self, sheet, store, cache, partition_column="event_id", id_column=ID_COLUMN, lease_ttl=60.0):
+        self.sheet = sheet
+        self._store = store
+        self._cache = cache
+        self.partition_column = partition_column
+        self.id_column = id_column
+        self.lease_ttl = lease_ttl
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._partitions = {}  # 行 ID → パーティション（最後に読んだシート）
+        self.writes = 0  # 実際にシートへ書き込んだ回数（計測用）
+
+    def revision_name(self, partition):
+        return f"{self.sheet}@{partition}"
+
+    def revision(self, partition, df=None) -> int:
+        """パーティションの現在のリビジョン。df（読み込み済みのシート）があればその行も考慮する。"""
+        version = self._cache.version(self.revision_name(partition))
+        if df is not None:
+            version = max(version, partition_revision(df, self.partition_column, partition))
+        return version
+
+    def commit(self, changeset, timeout=None) -> dict:
+        """changeset（op のリスト）を書き込み、{パーティション: 新リビジョン} を返す。
+
+        衝突した場合は ConflictError（changeset の一部だけが書かれることはない）。
+        """
+        result = self.commit_all([changeset], timeout)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def commit_all(self, changesets, timeout=None) -> list:
+        """複数の changeset をそれぞれ独立に書き込む（衝突したものだけが捨てられる）。
+
+        返り値は changeset ごとの {パーティション: 新リビジョン} または ConflictError。
+        """
+        changesets = [list(changeset) for changeset in changesets]
+        keys = self._lane_keys(changesets)
+        futures = [Future() for _ in changesets]
+        leaders = []
+        with self._lock:
+            for key, changeset, future in zip(keys, changesets, futures):
+                self._lanes.setdefault(key, _Lane()).queue.append((changeset, future))
+            for key in dict.fromkeys(keys):
+                lane = self._lanes[key]
+                if not lane.flushing:
+                    lane.flushing = True
+                    leaders.append(key)
+        for key in leaders:
+            self._drain(key)
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout))
+            except ConflictError as e:
+                results.append(e)
+        return results
+
+    def compact(self) -> int:
+        """墓標をシートから取り除き、取り除いた行数を返す。
+
+        シート全体を書き直すので、全パーティションの書き込みを止めて（シート全体の排他の貸与）行う。
+        """
+        if not self._store.row_level:
+            return 0
+        with self._cache.lease(f"write:{self.sheet}", ttl=self.lease_ttl):
+            # 古い行の ID は墓標を含めた出現順で決まるので、ID を書き込んでから墓標を除く
+            df = ensure_ids(self._store.read(), self.id_column)
+            dead = deleted_rows(df)
+            if not dead.any():
+                return 0
+            self._store.replace(live_rows(df).reset_index(drop=True))
+            self._cache.publish(self.sheet)
+        return int(dead.sum())
+
+    def _read_live(self):
+        """最新のシート（墓標を除く。index はシートの行番号）。行 ID → パーティションも覚え直す。"""
+        df = live_rows(ensure_ids(self._store.read(), self.id_column))
+        if self.partition_column in df.columns:
+            self._partitions = dict(zip(df[self.id_column], df[self.partition_column].astype(str)))
+        return df
+
+    def _lane_keys(self, changesets):
+        """changeset ごとの、触るパーティションの組（ソート済みのタプル）。"""
+        by_id = self.partition_column == self.id_column
+        ids = {str(op.row_id) for changeset in changesets for op in changeset if not isinstance(op, Insert)}
+        for changeset in changesets:
+            for op in changeset:
+                if isinstance(op, Update) and self.partition_column in op.fields and not by_id:
+                    raise ValueError(f"{self.partition_column} は変更できません")
+        if not by_id and not ids <= self._partitions.keys():
+            self._read_live()
+        keys = []
+        for changeset in changesets:
+            partitions = set()
+            for op in changeset:
+                if isinstance(op, Insert):
+                    partitions.add(str(op.row[self.partition_column]))
+                elif by_id:
+                    partitions.add(str(op.row_id))
+                elif str(op.row_id) in self._partitions:
+                    partitions.add(self._partitions[str(op.row_id)])
+            keys.append(tuple(sorted(partitions)))
+        return keys
+
+    def _drain(self, key):
+        lane = self._lanes[key]
+        while True:
+            with self._lock:
+                batch, lane.queue = lane.queue, []
+                if not batch:
+                    lane.flushing = False
+                    del self._lanes[key]
+                    return
+            try:
+                self._flush(key, batch)
+            except BaseException as e:
+                for _changeset, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    @contextlib.contextmanager
+    def _leases(self, partitions):
+        """partitions への書き込み権。行単位で書けないストアではシート全体を排他で取る。"""
+        with contextlib.ExitStack() as stack:
+            if not self._store.row_level:
+                stack.enter_context(self._cache.lease(f"write:{self.sheet}", ttl=self.lease_ttl))
+            else:
+                stack.enter_context(self._cache.lease(f"write:{self.sheet}", ttl=self.lease_ttl, shared=True))
+                # 複数のパーティションにまたがる場合も、全員が同じ順に取るのでデッドロックしない
+                for partition in partitions:
+                    stack.enter_context(self._cache.lease(f"write:{self.sheet}@{partition}", ttl=self.lease_ttl))
+            yield
+
+    def _flush(self, partitions, batch):
+        with self._leases(partitions):
+            df = self._read_live()
+            if self.partition_column in df.columns:
+                mine = df[df[self.partition_column].astype(str).isin(partitions)]
+            else:
+                mine = df.iloc[:0]
+            revisions = {p: self.revision(p, mine) for p in partitions}
+
+            updated, results = apply_changesets(
+                mine, [changeset for changeset, _f in batch], self.partition_column, revisions, self.id_column,
+            )
+            written = {}
+            for result in results:
+                if isinstance(result, dict):
+                    written.update(result)
+            if written:
+                updates, appends = self._row_changes(mine, updated)
+                self._store.write_rows(df, updates, appends)
+                with self._lock:
+                    self.writes += 1
+                for partition, revision in written.items():
+                    self._cache.advance(self.revision_name(partition), revision)
+                self._cache.publish(self.sheet)
+
+        for (_changeset, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _row_changes(self, before, after):
+        """適用前後の行 → ({行番号: 書き換える行}, [追加する行])。削除した行は墓標として書き換える。"""
+        positions = pd.Series(before.index, index=before[self.id_column].astype(str))
+        positions = positions[~positions.index.duplicated(keep="last")]
+        old_revisions = before[REVISION_COLUMN]
+        updates, appends = {}, []
+        for row in after.to_dict("records"):
+            row_id = str(row[self.id_column])
+            if row_id not in positions.index:
+                appends.append(row)
+            elif row[REVISION_COLUMN] != old_revisions.at[positions[row_id]]:
+                updates[positions[row_id]] = row
+        deleted_at = datetime.datetime.now().astimezone().isoformat(timespec="seconds")
+        remaining = set(after[self.id_column].astype(str))
+        for row_id, position in positions.items():
+            if row_id not in remaining:
+                updates[position] = dict(before.loc[position].to_dict(), **{DELETED_COLUMN: deleted_at})
+        return updates, appends
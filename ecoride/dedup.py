@@ -0,0 +1,76 @@
+"""参加登録の重複検知。
+
+登録内容（グループ名・出発地・人数・車種）を正規化してハッシュにし、イベントごとに
+ハッシュ → participant_id の索引を持つ。登録ボタンが押されたら、距離の計算やシートへの
+書き込みの前にこの索引を引くので、二重送信や家族による同じグループの登録を
+地図サービスの呼び出しなしで見つけられる。
+
+正規化は NFKC（全角英数・半角カナをそろえる）→ 空白の除去 → 大文字小文字の同一視。
+"""
+import threading
+
+import pandas as pd
+
+KEY_COLUMNS = ["name", "start_point", "people", "car_type"]
+
+# 同じセッションから同じ内容が送られたら、この秒数の間は二重送信とみなす
+IDEMPOTENCY_WINDOW = 120
+
+
+def _normalize_text(series: pd.Series) -> pd.Series:
+    text = series.map(lambda v: "" if v is None or (isinstance(v, float) and v != v) else str(v))
+    return text.str.normalize("NFKC").str.replace(r"\s+", "", regex=True).str.casefold()
+
+
+def registration_keys(df: pd.DataFrame) -> pd.Series:
+    """行ごとの登録内容のハッシュ（uint64）。"""
+    cols = df.reindex(columns=KEY_COLUMNS)
+    normalized = pd.DataFrame({
+        "name": _normalize_text(cols["name"]),
+        "start_point": _normalize_text(cols["start_point"]),
+        "people": pd.to_numeric(cols["people"], errors="coerce").astype("Int64").astype(str),
+        "car_type": _normalize_text(cols["car_type"]),
+    }, index=df.index)
+    return pd.Series(pd.util.hash_pandas_object(normalized, index=False).to_numpy(), index=df.index)
+
+
+def registration_key(name, start_point, people, car_type) -> int:
+    row = pd.DataFrame([{"name": name, "start_point": start_point, "people": people, "car_type": car_type}])
+    return int(registration_keys(row).iloc[0])
+
+
+class RegistrationIndex:
+    """イベントごとの 登録内容のハッシュ → participant_id。
+
+    refresh() にシートとそのバージョンを渡すと、バージョンが変わったときだけ作り直す。
+    書き込んだ直後（シートを読み直す前）の登録は add() で索引に入れる。スレッドセーフ。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = {}
+
+    def refresh(self, df: pd.DataFrame, version) -> None:
+        with self._lock:
+            if version == self._version:
+                return
+        index = {}
+        if not df.empty and "event_id" in df.columns:
+            keys = registration_keys(df)
+            ids = df["participant_id"] if "participant_id" in df.columns else pd.Series(None, index=df.index)
+            table = pd.DataFrame({"event_id": df["event_id"].astype(str), "key": keys, "id": ids})
+            for event_id, rows in table.groupby("event_id", sort=False):
+                index[event_id] = dict(zip(rows["key"].tolist(), rows["id"].tolist()))
+        with self._lock:
+            self._index = index
+            self._version = version
+
+    def find(self, event_id, key):
+        """同じ内容の登録の participant_id（無ければ None）。"""
+        with self._lock:
+            return self._index.get(str(event_id), {}).get(key)
+
+    def add(self, event_id, key, participant_id) -> None:
+        with self._lock:
+            self._index.setdefault(str(event_id), {})[key] = participant_id
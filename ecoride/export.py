@@ -0,0 +1,249 @@
+"""参加者一覧・集計のエクスポート（CSV / Parquet / 印刷用サマリー）。
+
+出力はチャンク単位で組み立ててバイト列として順に返す。イベント全体の表示用 DataFrame や
+文字列を一度に作らないので、大きなイベントでも中間データのメモリは 1チャンク分で済む。
+Streamlit の st.download_button には ChunkStream を返す関数を渡し、クリック時にだけ生成する。
+"""
+import html
+import io
+
+import numpy as np
+import pandas as pd
+
+from ecoride.geo import SOURCE_ESTIMATED, SOURCE_MEASURED
+from ecoride.regions import normalize_addresses
+from ecoride.stats import CEDAR_KG_PER_TREE, MODEL_VERSION, emission_rows
+from ecoride.vehicles import split_car_info
+
+DEFAULT_CHUNKSIZE = 20_000
+
+# 出力列（内部名 → 見出し）。ライブモニターの参加者リストと同じ表示列に排出量を加えたもの
+REPORT_COLUMNS = {
+    "event_id": "イベントID",
+    "event_name": "イベント名",
+    "name": "グループ名",
+    "municipality": "出発地(市町村)",
+    "people": "人数",
+    "car_name": "車種",
+    "car_eff": "燃費目安",
+    "distance": "距離(km)",
+    "distance_source": "距離の根拠",
+    "solo_kg": "1人1台の場合(kg)",
+    "share_kg": "相乗り(kg)",
+    "reduction_kg": "CO2削減量(kg)",
+}
+
+_SOURCE_LABELS = {SOURCE_MEASURED: "実測", SOURCE_ESTIMATED: "推定"}
+
+
+def _map_unique(series: pd.Series, func) -> pd.Series:
+    """同じ値が多い列（車種）は重複を除いてから変換する。"""
+    uniques = series.drop_duplicates()
+    return series.map(dict(zip(uniques, map(func, uniques))))
+
+
+def display_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """参加者行の表示用の列: name, municipality, people, car_name, car_eff, distance, distance_source。"""
+    cars = _map_unique(df["car_type"], split_car_info)
+    out = pd.DataFrame({
+        "name": df["name"],
+        "municipality": normalize_addresses(df["start_point"])["label"],
+        "people": df["people"],
+        "car_name": cars.str[0],
+        "car_eff": cars.str[1],
+        "distance": df["distance"],
+    }, index=df.index)
+    if "distance_source" in df.columns:
+        out["distance_source"] = df["distance_source"].map(_SOURCE_LABELS).fillna("実測")
+    return out
+
+
+def report_frame(df: pd.DataFrame, events_df=None) -> pd.DataFrame:
+    """表示列に往復の排出量 [kg] を加えた出力用の表（列は REPORT_COLUMNS の内部名）。"""
+    out = display_frame(df)
+    out.insert(0, "event_id", df["event_id"].astype(str) if "event_id" in df.columns else "")
+    if events_df is not None and not events_df.empty:
+        names = events_df.drop_duplicates("event_id", keep="last")
+        names = pd.Series(names["event_name"].to_numpy(), index=names["event_id"].astype(str))
+        out.insert(1, "event_name", out["event_id"].map(names))
+    rows = emission_rows(df)
+    out["solo_kg"] = rows["solo_g"].reindex(out.index) / 1000
+    out["share_kg"] = rows["share_g"].reindex(out.index) / 1000
+    out["reduction_kg"] = out["solo_kg"] - out["share_kg"]
+    return out.reindex(columns=[c for c in REPORT_COLUMNS if c in out.columns])
+
+
+def iter_report_frames(df: pd.DataFrame, events_df=None, chunksize=DEFAULT_CHUNKSIZE):
+    """report_frame() を chunksize 行ずつ。参加者がいなければ見出しだけの空の表を1つ返す。"""
+    if df.empty:
+        yield pd.DataFrame(columns=list(REPORT_COLUMNS))
+        return
+    for start in range(0, len(df), chunksize):
+        yield report_frame(df.iloc[start:start + chunksize], events_df)
+
+
+def iter_csv(df: pd.DataFrame, events_df=None, chunksize=DEFAULT_CHUNKSIZE):
+    """CSV（Excel で開けるよう BOM 付き UTF-8、見出しは日本語）をチャンクごとのバイト列で返す。"""
+    yield "\ufeff".encode("utf-8")
+    header = True
+    for frame in iter_report_frames(df, events_df, chunksize):
+        frame = frame.rename(columns=REPORT_COLUMNS).round(3)
+        yield frame.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+
+
+class _Sink(io.RawIOBase):
+    """書き込まれたバイト列を溜めておき、drain() で取り出す出力先。"""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def iter_parquet(df: pd.DataFrame, events_df=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Parquet をチャンク = 1 行グループとして書き、書けた分からバイト列で返す。"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _Sink()
+    writer = None
+    for frame in iter_report_frames(df, events_df, chunksize):
+        frame = frame.astype({"name": str, "municipality": str, "car_name": str, "car_eff": str})
+        frame["people"] = pd.to_numeric(frame["people"], errors="coerce")
+        frame["distance"] = pd.to_numeric(frame["distance"], errors="coerce")
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        else:
+            table = table.cast(writer.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+_SUMMARY_HEAD = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: "Hiragino Sans", "Noto Sans JP", sans-serif; color: #1b2a22; margin: 24px; }}
+h1 {{ font-size: 20px; margin: 0 0 4px; }}
+.meta {{ color: #555; font-size: 12px; margin-bottom: 16px; }}
+.cards {{ display: flex; gap: 12px; margin-bottom: 20px; }}
+.card {{ flex: 1; border: 1px solid #c9d8cf; border-radius: 8px; padding: 10px 14px; }}
+.card b {{ display: block; font-size: 20px; }}
+table {{ width: 100%; border-collapse: collapse; font-size: 12px; }}
+th, td {{ border-bottom: 1px solid #dde6e0; padding: 4px 6px; text-align: right; }}
+th:first-child, td:first-child, th:nth-child(2), td:nth-child(2) {{ text-align: left; }}
+thead {{ display: table-header-group; }}
+tr {{ break-inside: avoid; }}
+@media print {{ body {{ margin: 0; }} @page {{ size: A4; margin: 14mm; }} }}
+</style></head><body>
+"""
+
+_SUMMARY_ROW = "<tr><td>{name}</td><td>{date}</td><td>{groups}</td><td>{people}</td><td>{cars}</td>" \
+               "<td>{reduction:.2f}</td><td>{occupancy:.2f}</td><td>{cedar:.1f}</td></tr>\n"
+
+
+def iter_summary_html(per_event: pd.DataFrame, totals: dict, title, subtitle="", chunksize=500):
+    """印刷用サマリー（HTML）。per_event は with_event_info() 済みのイベント別集計。
+
+    ブラウザで開いて印刷（PDF 保存）する想定。
+    """
+    esc = html.escape
+    yield _SUMMARY_HEAD.format(title=esc(str(title))).encode("utf-8")
+    head = [f"<h1>{esc(str(title))}</h1>"]
+    if subtitle:
+        head.append(f'<div class="meta">{esc(str(subtitle))}</div>')
+    if totals:
+        head.append(
+            '<div class="cards">'
+            f'<div class="card">CO2削減量<b>{totals["reduction_kg"]:.2f} kg</b></div>'
+            f'<div class="card">平均相乗り率<b>{totals["occupancy"]:.2f} 人/台</b></div>'
+            f'<div class="card">杉の木の年間吸収量相当<b>約 {totals["cedar_trees"]:.1f} 本</b></div>'
+            f'<div class="card">参加<b>{int(totals["groups"])} 組 / {int(totals["people"])} 人</b></div>'
+            '</div>'
+        )
+    head.append(
+        "<table><thead><tr><th>イベント名</th><th>開催日</th><th>グループ数</th><th>人数</th><th>台数</th>"
+        "<th>CO2削減量(kg)</th><th>相乗り率(人/台)</th><th>杉の木換算(本)</th></tr></thead><tbody>\n"
+    )
+    yield "".join(head).encode("utf-8")
+
+    table = per_event.reindex(columns=["event_name", "event_date", "groups", "people", "cars",
+                                       "reduction_kg", "occupancy", "cedar_trees"])
+    for start in range(0, len(table), chunksize):
+        part = table.iloc[start:start + chunksize]
+        yield "".join(
+            _SUMMARY_ROW.format(
+                name=esc(str(r.event_name)), date=esc(str(r.event_date)),
+                groups=int(np.nan_to_num(r.groups)), people=int(np.nan_to_num(r.people)),
+                cars=int(np.nan_to_num(r.cars)), reduction=np.nan_to_num(r.reduction_kg),
+                occupancy=np.nan_to_num(r.occupancy), cedar=np.nan_to_num(r.cedar_trees),
+            )
+            for r in part.itertuples(index=False)
+        ).encode("utf-8")
+
+    yield (
+        "</tbody></table>"
+        f'<p class="meta">※ 杉の木換算：{CEDAR_KG_PER_TREE} kg-CO₂/本/年（林野庁、36〜40年生スギ人工林・1,000本/ha 基準）</p>'
+        f'<p class="meta">※ 排出係数：車種モデル {esc(MODEL_VERSION)}</p>'
+        "</body></html>\n"
+    ).encode("utf-8")
+
+
+class ChunkStream(io.RawIOBase):
+    """バイト列のイテレータを読み取り専用のファイルとして見せる。
+
+    先頭への seek(0) は読み始める前に限り許す（st.download_button が読む前に呼ぶため）。
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._started = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset == 0 and whence == io.SEEK_SET and not self._started:
+            return 0
+        raise io.UnsupportedOperation("ChunkStream は先頭以外へ seek できません")
+
+    def readinto(self, b):
+        self._started = True
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def readall(self):
+        self._started = True
+        parts = [self._buffer]
+        self._buffer = b""
+        parts.extend(self._chunks)
+        return b"".join(parts)
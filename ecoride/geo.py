@@ -0,0 +1,30 @@
+"""座標からの距離推定（オフライン・ベクトル演算）。
+
+Google Maps に問い合わせられないときの代替や、多数の行の一括再計算に使う。
+直線距離（haversine）に道路係数を掛けて道のりを近似する。
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# 直線距離 → 道のりの換算係数。国内の一般道では 1.2〜1.4 程度になることが多い
+ROAD_FACTOR = 1.3
+
+# participants シートの distance_source 列の値
+SOURCE_MEASURED = "measured"    # Distance Matrix API の道のり
+SOURCE_ESTIMATED = "estimated"  # 座標からの推定値
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """2点間の大円距離 [km]。引数は配列でもスカラーでもよい（ブロードキャストされる）。"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def estimate_road_km(lat, lon, dest_lat, dest_lon, road_factor=ROAD_FACTOR) -> np.ndarray:
+    """道のりの推定値 [km]（小数第1位に丸める）。座標が欠けている要素は NaN。"""
+    return np.round(haversine_km(lat, lon, dest_lat, dest_lon) * road_factor, 1)
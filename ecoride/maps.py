@@ -0,0 +1,187 @@
+"""Google Maps Web サービス（Places Autocomplete / Distance Matrix / Geocoding）の呼び出し。
+
+画面表示は行わない。通信エラーは MapsError として送出し、呼び出し側（eco_ride_app.py）が
+メッセージ表示や推定距離へのフォールバックを決める。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+AUTOCOMPLETE_URL = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# 応答が遅いときに登録フォームを待たせすぎない
+REQUEST_TIMEOUT = 5
+
+
+class MapsError(Exception):
+    """Maps API に到達できない、または想定外の応答を受け取った。"""
+
+
+def _get_json(url, params):
+    import requests
+
+    try:
+        response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
+        return response.json()
+    except Exception as e:
+        raise MapsError(str(e)) from e
+
+
+class MapsUnavailable(MapsError):
+    """レート制限の待ち時間内に呼び出し枠が空かなかった、または本日の利用上限に達した。"""
+
+
+class MapsClient:
+    """API キー・レート制限・日次上限を束ねた Maps クライアント。
+
+    プロセス内の全セッションで1つを共有する想定（eco_ride_app.py では st.cache_resource）。
+    limiter が飽和しているときは最大 max_wait 秒まで順番を待ち、それでも空かなければ
+    MapsUnavailable を送出する。日次上限に達した後は通信せずに MapsUnavailable を送出する。
+    """
+
+    def __init__(self, api_key, limiter=None, quota=None, max_wait=3.0):
+        self.api_key = api_key
+        self.limiter = limiter
+        self.quota = quota
+        self.max_wait = max_wait
+
+    @property
+    def budget_exhausted(self):
+        return self.quota is not None and self.quota.exhausted
+
+    def _call(self, url, params):
+        if self.budget_exhausted:
+            raise MapsUnavailable("本日の利用上限に達しました")
+        if self.limiter is not None and not self.limiter.acquire(timeout=self.max_wait):
+            raise MapsUnavailable("混雑のため時間内に問い合わせできませんでした")
+        # 待っている間に他のスレッドが上限を使い切ることがあるので、消費は通信の直前に行う
+        if self.quota is not None and not self.quota.try_consume():
+            raise MapsUnavailable("本日の利用上限に達しました")
+        return _get_json(url, dict(params, key=self.api_key))
+
+    def place_suggestions(self, query):
+        """地名の候補リスト [{"label", "value"}, ...]。該当なしは空リスト。"""
+        params = {"input": query, "language": "ja", "components": "country:jp"}
+        data = self._call(AUTOCOMPLETE_URL, params)
+        if data.get("status") == "OK":
+            return [{"label": p["description"], "value": p["description"]} for p in data["predictions"]]
+        return []
+
+    def distance_km(self, origin, destination):
+        """道のり [km]。経路が見つからない場合は None。"""
+        params = {"origins": origin, "destinations": destination, "language": "ja"}
+        data = self._call(DISTANCE_MATRIX_URL, params)
+        if data.get("status") == "OK":
+            rows = data.get("rows", [])
+            if rows and rows[0].get("elements"):
+                elm = rows[0]["elements"][0]
+                if elm.get("status") == "OK":
+                    return elm["distance"]["value"] / 1000.0
+        return None
+
+    def geocode(self, address):
+        """住所 → (緯度, 経度)。見つからない場合は None。"""
+        params = {"address": address, "language": "ja", "region": "jp"}
+        data = self._call(GEOCODE_URL, params)
+        status = data.get("status")
+        if status == "OK" and data.get("results"):
+            loc = data["results"][0]["geometry"]["location"]
+            return float(loc["lat"]), float(loc["lng"])
+        if status not in ("OK", "ZERO_RESULTS"):
+            # 上限超過・キー不正などは「住所が無い」とは区別する（呼び出し側でキャッシュさせない）
+            raise MapsError(f"{status}: {data.get('error_message', '')}")
+        return None
+
+
+def distance_many(client, origins, destination, max_workers=8, progress=None):
+    """複数の出発地から同じ目的地までの道のりを並列に測る。{出発地: km または None}。
+
+    同時実行数は max_workers、呼び出し頻度は client のレート制限に従う。
+    progress(完了数, 全体数) は呼び出し元のスレッドから呼ばれる。
+    """
+    origins = list(dict.fromkeys(o for o in origins if isinstance(o, str) and o))
+    results = {}
+    if not origins:
+        return results
+
+    def measure(origin):
+        try:
+            return client.distance_km(origin, destination)
+        except MapsError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="distance-many") as pool:
+        futures = {pool.submit(measure, o): o for o in origins}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            results[futures[fut]] = fut.result()
+            if progress:
+                progress(done, len(origins))
+    return results
+
+
+class DistanceRefiner:
+    """推定距離で登録された出発地を、バックグラウンドで Distance Matrix により測り直す。
+
+    キーは (event_id, start_point, 目的地)。同じキーの依頼は実行中・結果待ちの間は
+    重複させない。結果は take_results() で取り出し、呼び出し側がまとめて書き込む。
+    測れなかったキーは retry_delay 秒（失敗のたびに倍、最大 max_retry_delay 秒）待つまで
+    依頼を受け付けず、max_attempts 回測れなければ諦める（課金される問い合わせを繰り返さない）。
+    MapsUnavailable（レート制限・日次上限）は問い合わせていないので回数に数えず、待つだけにする。
+    """
+
+    def __init__(self, client, max_workers=2, max_attempts=3, retry_delay=60.0, max_retry_delay=3600.0,
+                 clock=time.monotonic):
+        self._client = client
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="distance-refiner")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._results = {}
+        self._failures = {}  # キー → (失敗した回数, 次に依頼を受け付ける時刻)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._clock = clock
+
+    def request(self, event_id, origin, destination) -> bool:
+        """測り直しを依頼する。受け付けたら True（実行中・結果待ち・待機中・諦めたキーは False）。"""
+        key = (str(event_id), origin, destination)
+        with self._lock:
+            if key in self._pending or key in self._results:
+                return False
+            attempts, retry_at = self._failures.get(key, (0, 0.0))
+            if attempts >= self.max_attempts or self._clock() < retry_at:
+                return False
+            self._pending.add(key)
+        self._pool.submit(self._measure, key)
+        return True
+
+    def _measure(self, key):
+        _event_id, origin, destination = key
+        attempted = True
+        try:
+            km = self._client.distance_km(origin, destination)
+        except MapsUnavailable:
+            km, attempted = None, False
+        except MapsError:
+            km = None
+        with self._lock:
+            self._pending.discard(key)
+            if km is not None:
+                self._results[key] = km
+                self._failures.pop(key, None)
+                return
+            attempts, _ = self._failures.get(key, (0, 0.0))
+            attempts += attempted
+            delay = min(self.retry_delay * 2 ** max(attempts - 1, 0), self.max_retry_delay)
+            self._failures[key] = (attempts, self._clock() + delay)
+
+    def take_results(self, event_id):
+        """測り直しが終わった {(start_point, 目的地): km} を取り出す（取り出した分は消える）。"""
+        event_id = str(event_id)
+        with self._lock:
+            done = {k: v for k, v in self._results.items() if k[0] == event_id}
+            for k in done:
+                del self._results[k]
+        return {(origin, dest): km for (_e, origin, dest), km in done.items()}
@@ -0,0 +1,78 @@
+"""イベントの初回表示に使うキャッシュの事前作成（プリウォーム）。
+
+新しいイベントの URL を最初に開いた人は、シートの読み込み・会場のジオコーディング・
+QR コードの生成・集計の初期化をすべて待つことになる。イベント作成時とサーバー起動時に
+これらをバックグラウンドで済ませておき、印刷した QR コードの最初の読み取りでも
+2回目以降と同じ速さで表示できるようにする。
+
+作業の中身（キャッシュの種類）は呼び出し側が (名前, 関数) のリストで渡す。
+同じキーの作業は、実行中または完了後は重ねて行わない。
+"""
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# サーバー起動時にプリウォームする範囲（開催日が今日からこの日数以内のイベント）
+UPCOMING_DAYS = 14
+MAX_UPCOMING = 20
+
+
+def upcoming_event_ids(events_df: pd.DataFrame, today: datetime.date, days=UPCOMING_DAYS, limit=MAX_UPCOMING) -> list:
+    """開催日が today 〜 today + days のイベントの event_id（開催日の近い順に最大 limit 件）。"""
+    if events_df.empty or "event_date" not in events_df.columns:
+        return []
+    dates = pd.to_datetime(events_df["event_date"], errors="coerce")
+    start = pd.Timestamp(today)
+    mask = (dates >= start) & (dates <= start + pd.Timedelta(days=days))
+    upcoming = events_df.assign(_date=dates)[mask].sort_values("_date")
+    return upcoming["event_id"].astype(str).drop_duplicates().head(limit).tolist()
+
+
+class Prewarmer:
+    """(名前, 関数) の作業をキーごとにバックグラウンドで順に実行する。
+
+    作業の失敗は他の作業を止めず、status() で確認できる（例外は記録するだけ）。
+    """
+
+    def __init__(self, max_workers=2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prewarm")
+        self._lock = threading.Lock()
+        self._jobs = {}      # キー → Future
+        self._status = {}    # キー → {作業名: 所要秒数 または 例外の文字列}
+
+    def submit(self, key, tasks, force=False):
+        """キー key の作業を依頼する。実行中・完了済みなら何もしない（force=True なら完了済みでもやり直す）。"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and (not job.done() or not force):
+                return job
+            self._status[key] = {}
+            job = self._pool.submit(self._run, key, list(tasks))
+            self._jobs[key] = job
+            return job
+
+    def _run(self, key, tasks):
+        for name, task in tasks:
+            t0 = time.perf_counter()
+            try:
+                task()
+                result = time.perf_counter() - t0
+            except Exception as e:
+                result = f"{type(e).__name__}: {e}"
+            with self._lock:
+                self._status[key][name] = result
+        return self.status(key)
+
+    def status(self, key) -> dict:
+        with self._lock:
+            return dict(self._status.get(key, {}))
+
+    def wait(self, key, timeout=None) -> dict:
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None:
+            job.result(timeout)
+        return self.status(key)
@@ -0,0 +1,86 @@
+"""Maps API 呼び出し用のレート制限（トークンバケット）と1日あたりの利用上限。"""
+import datetime
+import threading
+import time
+
+# Google Maps Platform の日次上限は太平洋時間で切り替わるが、運用上は国内イベントの暦日で数える
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+class TokenBucket:
+    """rate 回/秒、最大 burst 回まで連続で許可するトークンバケット（スレッドセーフ）。"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._updated)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """トークンがあれば1つ消費して True。待たない。"""
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """トークンが得られるまで待つ。timeout 秒以内に得られなければ False。"""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = (1.0 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0 or wait > remaining:
+                    return False
+            time.sleep(wait)
+
+
+class DailyQuota:
+    """1日あたりの呼び出し回数の上限（日付は tz の暦日で切り替わる）。スレッドセーフ。"""
+
+    def __init__(self, limit, tz=None, today=None):
+        self.limit = int(limit)
+        self._today = today or (lambda: datetime.datetime.now(tz or JST).date())
+        self._day = self._today()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        day = self._today()
+        if day != self._day:
+            self._day = day
+            self._used = 0
+
+    def try_consume(self, n=1):
+        """残りがあれば n 回分を消費して True。"""
+        with self._lock:
+            self._roll()
+            if self._used + n > self.limit:
+                return False
+            self._used += n
+            return True
+
+    @property
+    def remaining(self):
+        with self._lock:
+            self._roll()
+            return max(0, self.limit - self._used)
+
+    @property
+    def exhausted(self):
+        return self.remaining <= 0
@@ -0,0 +1,168 @@
+"""出発地の市区町村単位の集計（ランキング・コロプレス図用）。
+
+出発地の住所はプライバシー保護のため「都道府県 + 市区町村」までに丸めて扱う
+（1件ずつ丸める get_city_level_address と同じ丸め方）。住所の正規化は重複を除いた値に対して
+pandas の文字列演算でまとめて行い、行ごとに正規表現を呼ばない。
+
+集計の列は groups, people, distance_km（片道距離の合計）, solo_g, share_g と
+reduction_kg。prefecture / municipality は国土数値情報の行政区域データ
+（N03_001 / N03_004）の名前と突き合わせればそのままコロプレス図に使える。
+"""
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ecoride.stats import emission_rows
+
+PREFECTURES = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県",
+    "茨城県", "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県",
+    "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県",
+    "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県",
+    "奈良県", "和歌山県", "鳥取県", "島根県", "岡山県", "広島県", "山口県",
+    "徳島県", "香川県", "愛媛県", "高知県", "福岡県", "佐賀県", "長崎県",
+    "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+]
+
+_POSTAL = r"日本、\s*〒\d{3}-\d{4}\s*"
+_CITY = "(?P<prefecture>" + "|".join(PREFECTURES) + r"|.+?[都道府県])(?P<municipality>.+?[市区町村])"
+
+KEY_COLUMNS = ["prefecture", "municipality"]
+VALUE_COLUMNS = ["groups", "people", "distance_km", "solo_g", "share_g"]
+
+
+def get_city_level_address(address):
+    if not isinstance(address, str):
+        return str(address)
+    clean_addr = re.sub(r'日本、\s*〒\d{3}-\d{4}\s*', '', address)
+    match = re.search(r'(.+?[都道府県])(.+?[市区町村])', clean_addr)
+    if match:
+        return match.group(0)
+    return clean_addr
+
+
+def normalize_addresses(addresses) -> pd.DataFrame:
+    """住所の列 → prefecture, municipality, label（表示用の「都道府県市区町村」）。
+
+    市区町村まで読み取れない住所は prefecture / municipality が空文字で、label は
+    郵便番号を除いた住所そのまま。同じ住所は1回だけ処理する。
+    """
+    addresses = pd.Series(addresses)
+    codes, uniques = pd.factorize(addresses, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+    is_str = uniques.map(type).eq(str).to_numpy()
+    text = uniques.map(str)
+    text[is_str] = text[is_str].str.replace(_POSTAL, "", regex=True)
+
+    parts = text.str.extract(_CITY)
+    parts[~is_str] = np.nan  # 文字列でない値（空欄など）は丸めない
+    parts = parts.fillna("")
+    matched = parts["municipality"].ne("").to_numpy()
+    label = np.where(matched, parts["prefecture"] + parts["municipality"], text)
+
+    out = pd.DataFrame({
+        "prefecture": parts["prefecture"].to_numpy()[codes],
+        "municipality": parts["municipality"].to_numpy()[codes],
+        "label": label[codes],
+    }, index=addresses.index)
+    return out
+
+
+def municipality_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """参加者行ごとの集計値（event_id, prefecture, municipality と VALUE_COLUMNS）。"""
+    rows = emission_rows(df)
+    places = normalize_addresses(df.loc[rows.index, "start_point"])
+    return pd.DataFrame({
+        "event_id": rows["event_id"],
+        "prefecture": places["prefecture"],
+        "municipality": places["municipality"],
+        "groups": 1.0,
+        "people": rows["people"],
+        "distance_km": rows["distance"],
+        "solo_g": rows["solo_g"],
+        "share_g": rows["share_g"],
+    }, index=rows.index)
+
+
+def add_reduction(table: pd.DataFrame) -> pd.DataFrame:
+    table = table.copy()
+    table["reduction_kg"] = (table["solo_g"] - table["share_g"]) / 1000
+    return table
+
+
+def aggregate_by_municipality(df: pd.DataFrame) -> pd.DataFrame:
+    """(event_id, prefecture, municipality) ごとの合計。"""
+    rows = municipality_rows(df) if not df.empty and "start_point" in df.columns else None
+    if rows is None or rows.empty:
+        empty = pd.DataFrame(columns=["event_id", *KEY_COLUMNS, *VALUE_COLUMNS])
+        return add_reduction(empty.astype({c: float for c in VALUE_COLUMNS}).set_index(["event_id", *KEY_COLUMNS]))
+    return add_reduction(rows.groupby(["event_id", *KEY_COLUMNS], sort=False)[VALUE_COLUMNS].sum())
+
+
+def leaderboard(per_event: pd.DataFrame, event_id=None) -> pd.DataFrame:
+    """CO2 削減量の多い順の市区町村ランキング。event_id を省略すると全イベントの合計。"""
+    table = per_event
+    if event_id is not None:
+        ids = table.index.get_level_values("event_id")
+        table = table[ids == str(event_id)]
+    ranked = table[VALUE_COLUMNS].groupby(level=KEY_COLUMNS, sort=False).sum()
+    ranked = add_reduction(ranked).sort_values("reduction_kg", ascending=False).reset_index()
+    ranked.insert(0, "rank", np.arange(1, len(ranked) + 1))
+    return ranked
+
+
+class MunicipalityTally:
+    """参加者シートの変化分だけを反映して、市区町村別の集計を保つ。
+
+    update() に毎回シート全体を渡すと、行の内容のハッシュを前回と比べて、追加・削除された
+    行（修正は「古い行の削除 + 新しい行の追加」）の分だけ合計を増減する。住所の正規化と
+    排出量の計算は新しく現れた行にしか行わない。スレッドセーフ。
+    """
+
+    _HASH_COLUMNS = ["event_id", "start_point", "people", "distance", "car_type"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = np.empty(0, dtype="uint64")                    # 前回の行ハッシュの並び
+        self._counts = pd.Series(dtype="int64")                     # 行ハッシュ → 件数
+        self._contrib = pd.DataFrame(columns=["event_id", *KEY_COLUMNS, *VALUE_COLUMNS])  # 行ハッシュ → 1件分
+        self._totals = aggregate_by_municipality(pd.DataFrame())
+
+    def _hashes(self, df):
+        cols = df.reindex(columns=self._HASH_COLUMNS)
+        return pd.Series(pd.util.hash_pandas_object(cols, index=False).to_numpy(), index=df.index)
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """df（参加者シート全体）に合わせて集計を更新し、(event_id, 都道府県, 市区町村) ごとの表を返す。"""
+        hashes = self._hashes(df) if not df.empty else pd.Series(dtype="uint64")
+        with self._lock:
+            # 前回と同じ並びの同じ行なら差分を取るまでもない（ほとんどの再描画はこれ）
+            if np.array_equal(hashes.to_numpy(), self._last):
+                return self._totals.copy()
+            self._last = hashes.to_numpy()
+            counts = hashes.value_counts()
+            delta = counts.sub(self._counts, fill_value=0).astype("int64")
+            delta = delta[delta != 0]
+            if delta.empty:
+                return self._totals.copy()
+
+            new = delta.index.difference(self._contrib.index)
+            if len(new):
+                first = hashes[hashes.isin(new)].drop_duplicates()
+                # 距離・人数が読めない行は全列 NaN のまま残し（集計には入らない）、次回も計算し直さない
+                rows = municipality_rows(df.loc[first.index]).reindex(first.index)
+                rows.index = first.to_numpy()
+                self._contrib = pd.concat([self._contrib, rows]) if len(self._contrib) else rows
+
+            change = self._contrib.reindex(delta.index).dropna(subset=["event_id"])
+            change[VALUE_COLUMNS] = change[VALUE_COLUMNS].mul(delta.reindex(change.index), axis=0)
+            change = change.groupby(["event_id", *KEY_COLUMNS], sort=False)[VALUE_COLUMNS].sum()
+            totals = self._totals[VALUE_COLUMNS].add(change, fill_value=0)
+            totals = totals[totals["groups"] > 0]
+            self._totals = add_reduction(totals)
+
+            self._counts = counts
+            self._contrib = self._contrib[self._contrib.index.isin(counts.index)]
+            return self._totals.copy()
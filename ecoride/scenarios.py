@@ -0,0 +1,71 @@
+"""車種構成と相乗り率の what-if 試算（ベクトル演算）。
+
+イベントの参加者全体について、次の2軸の組み合わせで往復の CO2 排出量を求める。
+
+- 車種の切り替え率 s: 各グループが確率 s で目標車種（EV・ハイブリッド等）に乗り換える
+- 相乗り人数の増加 Δ: 1台あたりの乗車人数が Δ 人増える（定員が上限）
+
+グループ i の台数は k_i(c) = p_i / min(p_i / ceil(p_i / c) + Δ, c)（Δ=0 なら現在の
+ceil(p_i / c) と一致）。期待排出量は s について線形なので、
+E(s, Δ) = (1 - s)·A(Δ) + s·B(Δ) として A, B を Δ ごとに一度だけ行方向に合計すれば、
+格子全体が (Δ の数 × 行数) の一回の計算で求まる。
+"""
+import numpy as np
+import pandas as pd
+
+from ecoride.stats import VEHICLE_MODEL
+
+DEFAULT_SHIFTS = np.round(np.arange(0.0, 1.0001, 0.1), 2)
+DEFAULT_OCCUPANCY_DELTAS = np.array([0.0, 0.5, 1.0, 1.5, 2.0, 3.0])
+
+
+def _cars(people, capacity, deltas):
+    """(Δ の数, 行数) の台数（期待値）。"""
+    current_occ = people / np.ceil(people / capacity)
+    occ = np.minimum(current_occ[None, :] + deltas[:, None], capacity[None, :])
+    return people[None, :] / occ
+
+
+def emission_grid(rows: pd.DataFrame, target_factor, target_capacity,
+                  shifts=DEFAULT_SHIFTS, occupancy_deltas=DEFAULT_OCCUPANCY_DELTAS) -> np.ndarray:
+    """(shift の数, Δ の数) の往復排出量 [g-CO2]。
+
+    rows は ecoride.stats.emission_rows() の結果（people, distance, factor, capacity 列）。
+    target_factor, target_capacity は乗り換え先の値（スカラーまたは行ごとの配列）。
+    """
+    shifts = np.asarray(shifts, dtype=float)
+    deltas = np.asarray(occupancy_deltas, dtype=float)
+    people = rows["people"].to_numpy(dtype=float)
+    keep = people > 0
+    people = people[keep]
+    distance = rows["distance"].to_numpy(dtype=float)[keep]
+    factor = rows["factor"].to_numpy(dtype=float)[keep]
+    capacity = rows["capacity"].to_numpy(dtype=float)[keep]
+    target_factor = np.broadcast_to(np.asarray(target_factor, dtype=float), keep.shape)[keep]
+    target_cap = np.broadcast_to(np.asarray(target_capacity, dtype=float), keep.shape)[keep]
+    if people.size == 0:
+        return np.zeros((shifts.size, deltas.size))
+
+    trip = distance * 2
+    stay = (_cars(people, capacity, deltas) * (trip * factor)[None, :]).sum(axis=1)
+    switch = (_cars(people, target_cap, deltas) * (trip * target_factor)[None, :]).sum(axis=1)
+    return (1 - shifts)[:, None] * stay[None, :] + shifts[:, None] * switch[None, :]
+
+
+def reduction_grid(rows: pd.DataFrame, target_car, shifts=DEFAULT_SHIFTS,
+                   occupancy_deltas=DEFAULT_OCCUPANCY_DELTAS, model=None) -> pd.DataFrame:
+    """1人1台（現在の車種）と比べた CO2 削減量 [kg] の表。index は切り替え率、columns は Δ。
+
+    target_car は車種の表示名（乗り換え先の車種）。乗り換え先の排出係数・定員は、現在の車種と
+    同じく各行のイベントの上書き（event_overrides）を反映する。model は車種モデル（省略時は VEHICLE_MODEL）。
+    """
+    model = model or VEHICLE_MODEL
+    target = pd.Series(target_car, index=rows.index, dtype=object)
+    target_factor, target_capacity = model.lookup(target, rows["event_id"] if "event_id" in rows.columns else None)
+    solo = float(rows["solo_g"].sum()) if len(rows) else 0.0
+    grid = emission_grid(rows, target_factor, target_capacity, shifts, occupancy_deltas)
+    return pd.DataFrame(
+        (solo - grid) / 1000,
+        index=pd.Index(np.asarray(shifts, dtype=float), name="shift"),
+        columns=pd.Index(np.asarray(occupancy_deltas, dtype=float), name="occupancy_delta"),
+    )
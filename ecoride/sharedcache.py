@@ -0,0 +1,197 @@
+"""複数プロセス（Streamlit のレプリカ）で共有するキャッシュと変更通知。
+
+SQLite ファイル1つで、次の2つを提供する。全ワーカーが同じファイルを開けば、あるワーカーでの
+登録が他のワーカーにもすぐ見える。共有できるのは同じホストで動くワーカーどうし（コンテナなら
+同じボリュームを共有する）だけ。WAL モードは共有メモリとファイルロックを使うので、
+NFS・SMB などのネットワークファイルシステム上では正しく動かず、別のホストとは共有できない。
+
+- 変更通知: 名前（シート名など）ごとのバージョン番号と変更ログ。書き込み側が publish() で
+  バージョンを上げ、読み込み側は version() / changes_since() で変更を知る。
+- キャッシュ: キーごとに「どのバージョンの時点で作った値か」を記録する。get() は
+  バージョンが一致し、max_age 秒以内の値だけを返す。
+
+読み込み前にバージョンを取得してから値を作り、そのバージョンで put() すること。
+作っている間に publish() が走れば、その値は古いバージョンとして扱われ使われない。
+値は pickle で保存するので、信頼できるプロセス間でのみ共有する。
+"""
+import contextlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, version INTEGER NOT NULL, at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY, version INTEGER NOT NULL, stored_at REAL NOT NULL, value BLOB NOT NULL
+);
+"""
+
+# 変更ログはこの件数を超えたら古いものから消す
+MAX_CHANGES = 10_000
+
+
+class SharedCache:
+    """SQLite ファイルによるプロセス間キャッシュ。max_age 秒を過ぎた値は使わない（None なら無期限）。"""
+
+    def __init__(self, path, max_age=None, clock=time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._clock = clock
+        self._local = threading.local()
+        self._db().executescript(_SCHEMA)
+
+    def _db(self):
+        """スレッドごとの接続（autocommit。読み込みは1文ずつなのでトランザクション不要）。"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _write(self):
+        return _Transaction(self._db())
+
+    # --- 変更通知 ---
+    def version(self, name) -> int:
+        row = self._db().execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def publish(self, name) -> int:
+        """name が変更されたことを全ワーカーに知らせる。新しいバージョンを返す。
+
+        キー name と "name:" で始まるキーのキャッシュは消す。
+        """
+        with self._write() as db:
+            db.execute(
+                "INSERT INTO versions (name, version) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+                (name,),
+            )
+            version = db.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()[0]
+            seq = db.execute(
+                "INSERT INTO changes (name, version, at) VALUES (?, ?, ?)", (name, version, self._clock())
+            ).lastrowid
+            db.execute("DELETE FROM changes WHERE seq <= ?", (seq - MAX_CHANGES,))
+            db.execute("DELETE FROM entries WHERE key = ? OR key LIKE ?", (name, f"{name}:%"))
+        return version
+
+    def advance(self, name, version) -> int:
+        """name のバージョンを version まで進める（下げはしない）。変更ログにも残す。"""
+        with self._write() as db:
+            db.execute(
+                "INSERT INTO versions (name, version) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET version = MAX(version, excluded.version)",
+                (name, int(version)),
+            )
+            version = db.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()[0]
+            db.execute("INSERT INTO changes (name, version, at) VALUES (?, ?, ?)", (name, version, self._clock()))
+        return version
+
+    @contextlib.contextmanager
+    def lease(self, name, ttl=30.0, timeout=60.0, poll=0.02, shared=False):
+        """全ワーカーで name を1人だけが持てる貸与（ロック）。ttl 秒で自動的に失効する。
+
+        shared=True なら共有の貸与: 何人でも同時に持てるが、排他の貸与とは同時に持てない。
+        排他の貸与を待っているワーカーがいる間は新しい共有の貸与を出さない（排他側が待たされ続けない）。
+        持ち主のプロセスが落ちても ttl 後には他のワーカーが取れる。
+        timeout 秒以内に取れなければ TimeoutError。
+        """
+        owner = f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex}"
+        readers = f"{name}#shared:"
+        key = readers + owner if shared else name
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                with self._write() as db:
+                    now = self._clock()
+                    db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+                    if shared:
+                        # 排他の貸与（取得待ちを含む）が無ければ取れる
+                        held = db.execute("SELECT 1 FROM leases WHERE name = ?", (name,)).fetchone() is None
+                        if held:
+                            db.execute(
+                                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?)", (key, owner, now + ttl)
+                            )
+                    else:
+                        # 先に自分の行を入れて新しい共有の貸与を止め、共有の持ち主が全員返すのを待つ
+                        db.execute(
+                            "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                            "ON CONFLICT(name) DO UPDATE SET expires = excluded.expires WHERE owner = excluded.owner",
+                            (name, owner, now + ttl),
+                        )
+                        mine = db.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()[0] == owner
+                        held = mine and db.execute(
+                            "SELECT 1 FROM leases WHERE substr(name, 1, ?) = ? LIMIT 1", (len(readers), readers)
+                        ).fetchone() is None
+                if held:
+                    break
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{name} の書き込み権を取得できませんでした")
+                time.sleep(poll)
+            yield
+        finally:
+            with self._write() as db:
+                db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (key, owner))
+
+    def changes_since(self, seq) -> tuple[int, list]:
+        """seq より後の変更 [(seq, name, version), ...] と、最新の seq を返す。"""
+        rows = self._db().execute(
+            "SELECT seq, name, version FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        return (rows[-1][0] if rows else seq), rows
+
+    # --- キャッシュ ---
+    def get(self, key, version=0):
+        """version の時点で作られた値。無い・古い・max_age を過ぎている場合は None。"""
+        row = self._db().execute(
+            "SELECT version, stored_at, value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[0] != version:
+            return None
+        if self.max_age is not None and self._clock() - row[1] > self.max_age:
+            return None
+        return pickle.loads(row[2])
+
+    def put(self, key, version, value) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._write() as db:
+            db.execute(
+                "INSERT INTO entries (key, version, stored_at, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET version = excluded.version, "
+                "stored_at = excluded.stored_at, value = excluded.value "
+                "WHERE excluded.version >= entries.version",
+                (key, version, self._clock(), blob),
+            )
+
+    def memo(self, key, version, compute):
+        """get() が外れたら compute() の結果を put() して返す。"""
+        value = self.get(key, version)
+        if value is None:
+            value = compute()
+            self.put(key, version, value)
+        return value
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE 〜 COMMIT を with 文で（例外時は ROLLBACK）。"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
@@ -0,0 +1,151 @@
+"""複数のワークシートをまとめて読む（Sheets API の values.batchGet）。
+
+streamlit_gsheets の conn.read() は1シートごとにスプレッドシートを開き直し
+（メタデータの取得）、ワークシートを探し、値を取得するので、events と participants を
+読むだけで6回ほど往復する。開いたスプレッドシートを使い回し、必要なシートの値を
+batchGet 1回で取得すれば、ページの表示に必要な往復は1回になる。
+
+値から DataFrame への変換は gspread_dataframe.get_as_dataframe（conn.read() の中身）と
+同じ規則にするので、どちらで読んでも同じ列と型になる。
+
+WorksheetStore は、同じ変換で読んだシートの行を、行番号を指定して書き換える（シート全体を
+書き直さないので、別のイベントの行を書いている他のワーカーの変更を消さない）。
+"""
+import numbers
+import re
+
+import numpy as np
+import pandas as pd
+
+# get_as_dataframe と同じ値の取得方法（数値は数値のまま、日時は表示どおりの文字列）
+VALUE_PARAMS = {"valueRenderOption": "UNFORMATTED_VALUE", "dateTimeRenderOption": "FORMATTED_STRING"}
+
+# TextParser が見出しの無い列に付ける名前
+_UNNAMED = re.compile(r"^Unnamed: \d+")
+
+
+def _a1_sheet(name) -> str:
+    """ワークシート名を A1 表記の範囲にする（シート全体）。"""
+    return "'{}'".format(str(name).replace("'", "''"))
+
+
+def values_to_frame(values: list) -> pd.DataFrame:
+    """batchGet の values（先頭行が見出し）→ DataFrame。
+
+    get_as_dataframe と同様に、行の長さをそろえてから型を推定し、空の行と
+    見出しの無い空の列を落とす。
+    """
+    if not values:
+        return pd.DataFrame()
+    width = max(len(row) for row in values)
+    rows = [list(row) + [""] * (width - len(row)) for row in values]
+    df = pd.io.parsers.TextParser(rows).read()
+    df = df.dropna(how="all", axis=0)
+    empty_unnamed = [c for c in df.columns if _UNNAMED.match(str(c)) and df[c].isna().all()]
+    return df.drop(columns=empty_unnamed)
+
+
+def batch_read(spreadsheet, worksheets) -> dict:
+    """spreadsheet（gspread の Spreadsheet）から worksheets を1回のリクエストで読み、名前 → DataFrame。
+
+    存在しないシートが含まれていると API がリクエスト全体をエラーにする（gspread の APIError）。
+    """
+    worksheets = list(worksheets)
+    response = spreadsheet.values_batch_get([_a1_sheet(w) for w in worksheets], params=VALUE_PARAMS)
+    ranges = response.get("valueRanges", [])
+    return {name: values_to_frame(r.get("values", [])) for name, r in zip(worksheets, ranges)}
+
+
+def _cell(value):
+    """DataFrame の値 → Sheets API に送る値（gspread_dataframe.set_with_dataframe と同じ規則）。"""
+    if value is None or (np.ndim(value) == 0 and pd.isna(value)):
+        return ""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, numbers.Real):
+        return value
+    return str(value)
+
+
+class WorksheetStore:
+    """1枚のワークシートを行単位で読み書きする（ecoride.concurrency.SheetCommitter のストア）。
+
+    read() は batch_read と同じ DataFrame（index はデータ行の番号。空の行は落ちるが番号は保たれる）。
+    write_rows() は書き換える行だけを1回の batchUpdate で書き、追加する行は append（INSERT_ROWS）で
+    表の末尾に足すので、他のパーティションの行を上書きしない。足りない列は見出しの行の末尾に足す
+    （見出しの書き換えは cache の貸与 "header:<シート>" で1人ずつ）。
+    """
+
+    row_level = True
+
+    def __init__(self, spreadsheet, worksheet, cache, lease_ttl=60.0):
+        self.spreadsheet = spreadsheet
+        self.worksheet = worksheet
+        self._cache = cache
+        self.lease_ttl = lease_ttl
+        self._sheet = None
+        self._header = []
+
+    def _ws(self):
+        if self._sheet is None:
+            self._sheet = self.spreadsheet.worksheet(self.worksheet)
+        return self._sheet
+
+    def read(self) -> pd.DataFrame:
+        response = self.spreadsheet.values_batch_get([_a1_sheet(self.worksheet)], params=VALUE_PARAMS)
+        values = response.get("valueRanges", [{}])[0].get("values", [])
+        self._header = list(values[0]) if values else []
+        return values_to_frame(values)
+
+    def write_rows(self, df, updates, appends):
+        appends = list(appends)
+        if not updates and not appends:
+            return
+        columns = self._columns([c for row in [*updates.values(), *appends] for c in row])
+        value_input = {"value_input_option": "USER_ENTERED"}
+        if updates:
+            self._ws().batch_update([
+                {"range": f"A{position + 2}", "values": [[_cell(row.get(c)) for c in columns]]}
+                for position, row in sorted(updates.items())
+            ], **value_input)
+        if appends:
+            self._ws().append_rows(
+                [[_cell(row.get(c)) for c in columns] for row in appends],
+                insert_data_option="INSERT_ROWS", table_range="A1", **value_input,
+            )
+
+    def replace(self, df):
+        from gspread_dataframe import set_with_dataframe
+
+        ws = self._ws()
+        ws.clear()
+        set_with_dataframe(ws, df)
+        self._header = [str(c) for c in df.columns]
+
+    def _columns(self, needed) -> list:
+        """シートの列の並び（DataFrame の列名。見出しの無い列は values_to_frame と同じ "Unnamed: n"）。
+
+        needed のうちシートに無い列は見出しの末尾に足す。
+        """
+        columns = _column_names(self._header)
+        missing = [c for c in dict.fromkeys(needed) if c not in columns]
+        if not missing:
+            return columns
+        with self._cache.lease(f"header:{self.worksheet}", ttl=self.lease_ttl):
+            ws = self._ws()
+            header = ws.row_values(1)
+            missing = [c for c in missing if c not in _column_names(header)]
+            if missing:
+                header = header + missing
+                if len(header) > ws.col_count:
+                    ws.add_cols(len(header) - ws.col_count)
+                ws.update(range_name="A1", values=[header], value_input_option="RAW")
+        self._header = header
+        return _column_names(header)
+
+
+def _column_names(header) -> list:
+    """見出しの行 → TextParser が付ける列名（空は "Unnamed: n"、重複は "name.1"）。"""
+    if not header:
+        return []
+    return list(pd.io.parsers.TextParser([list(header)]).read().columns)
@@ -0,0 +1,131 @@
+"""CO2 排出量モデルと集計処理（Streamlit に依存しない）。
+
+参加者シート1行 = 1グループ。1人1台で来た場合と、グループで相乗りした場合の往復排出量を
+ベクトル演算で求め、イベント単位・月単位の集計を1回の groupby で行う。
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from ecoride.vehicles import load_model
+
+# --- 設定・定数 ---
+# 車種モデル（ecoride/vehicle_models/ の最新版）。起動時に参照用の配列へ展開する
+VEHICLE_MODEL = load_model()
+MODEL_VERSION = VEHICLE_MODEL.version
+
+# 表示名 → 基本の排出係数 [g-CO2/km]・定員（画面の選択肢と what-if 試算用）
+CO2_EMISSION_FACTORS = VEHICLE_MODEL.factors_by_label()
+MAX_CAPACITY = VEHICLE_MODEL.capacities_by_label()
+
+# 不明な車種は車種モデルの default_class として扱う
+DEFAULT_FACTOR = VEHICLE_MODEL.default_factor
+DEFAULT_CAPACITY = VEHICLE_MODEL.default_capacity
+
+# 林野庁算定値: 8.8 kg-CO2/本/年（36〜40年生スギ人工林、1,000本/ha）
+CEDAR_KG_PER_TREE = 8.8
+
+# 合算可能な（チャンクごとの部分集計を足し合わせられる）列
+SUM_COLUMNS = ["groups", "people", "cars", "solo_g", "share_g"]
+
+
+def frame_revision(df: pd.DataFrame) -> str:
+    """DataFrame の内容から短いリビジョン文字列を作る（キャッシュキー用）。"""
+    if df.empty:
+        return "empty"
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def emission_rows(df: pd.DataFrame, model=None) -> pd.DataFrame:
+    """参加者行ごとの排出量を計算する。距離・人数が数値にならない行は除外する。
+
+    返り値の列: event_id, people, distance, factor, capacity, cars, solo_g, share_g
+    （solo_g / share_g は往復の g-CO2）。model は車種モデル（省略時は VEHICLE_MODEL）。
+    """
+    model = model or VEHICLE_MODEL
+    index = df.index
+    if "car_type" in df.columns:
+        car = df["car_type"]
+    else:
+        car = pd.Series("", index=index)
+    factor, capacity = model.lookup(car, df["event_id"] if "event_id" in df.columns else None)
+
+    nan = pd.Series(np.nan, index=index)
+    dist = pd.to_numeric(df["distance"], errors="coerce") if "distance" in df.columns else nan
+    ppl = pd.to_numeric(df["people"], errors="coerce") if "people" in df.columns else nan
+    ppl = np.trunc(ppl)
+    valid = np.isfinite(dist) & np.isfinite(ppl)
+
+    out = pd.DataFrame({
+        "event_id": df["event_id"].astype(str) if "event_id" in df.columns else "",
+        "people": ppl,
+        "distance": dist,
+        "factor": factor,
+        "capacity": capacity,
+    }, index=index)[valid]
+    out["cars"] = np.ceil(out["people"] / out["capacity"])
+    round_trip = out["distance"] * out["factor"] * 2
+    out["solo_g"] = out["people"] * round_trip
+    out["share_g"] = out["cars"] * round_trip
+    return out
+
+
+def add_summary_columns(totals: pd.DataFrame) -> pd.DataFrame:
+    """合計列から削減量・相乗り率・杉の木換算を付け加える。"""
+    totals = totals.copy()
+    totals["reduction_kg"] = (totals["solo_g"] - totals["share_g"]) / 1000
+    cars = totals["cars"].where(totals["cars"] > 0)
+    totals["occupancy"] = (totals["people"] / cars).fillna(0.0)
+    totals["cedar_trees"] = totals["reduction_kg"] / CEDAR_KG_PER_TREE
+    return totals
+
+
+def aggregate_by_event(df_participants: pd.DataFrame, model=None) -> pd.DataFrame:
+    """全イベント分の合計を1回の groupby で求める（index は event_id）。model は emission_rows() と同じ。"""
+    if df_participants.empty or "event_id" not in df_participants.columns:
+        empty = pd.DataFrame(columns=SUM_COLUMNS, dtype=float)
+        empty.index.name = "event_id"
+        return add_summary_columns(empty)
+
+    rows = emission_rows(df_participants, model)
+    totals = rows.groupby("event_id", sort=False).agg(
+        groups=("people", "size"),
+        people=("people", "sum"),
+        cars=("cars", "sum"),
+        solo_g=("solo_g", "sum"),
+        share_g=("share_g", "sum"),
+    )
+    return add_summary_columns(totals)
+
+
+def overall_totals(per_event: pd.DataFrame) -> dict:
+    """イベント別集計を全体の合計にまとめる。"""
+    sums = per_event[SUM_COLUMNS].sum()
+    return add_summary_columns(sums.to_frame().T).iloc[0].to_dict()
+
+
+def monthly_trend(per_event: pd.DataFrame, events_df: pd.DataFrame) -> pd.DataFrame:
+    """開催月ごとの合計（index は "YYYY-MM"）。開催日が読めないイベントは除外する。"""
+    if events_df.empty or "event_date" not in events_df.columns:
+        return add_summary_columns(pd.DataFrame(columns=SUM_COLUMNS, dtype=float))
+
+    events = events_df.assign(event_id=events_df["event_id"].astype(str))
+    events = events.drop_duplicates("event_id", keep="last").set_index("event_id")
+    dates = pd.to_datetime(events["event_date"], errors="coerce")
+    month = dates.dt.strftime("%Y-%m").reindex(per_event.index)
+    monthly = per_event[SUM_COLUMNS].groupby(month.rename("month")).sum().sort_index()
+    return add_summary_columns(monthly)
+
+
+def with_event_info(per_event: pd.DataFrame, events_df: pd.DataFrame, how: str = "inner") -> pd.DataFrame:
+    """イベント別集計にイベント名・開催日・会場名を付ける。"""
+    if events_df is None or events_df.empty or "event_id" not in events_df.columns:
+        return per_event
+    info = events_df.assign(event_id=events_df["event_id"].astype(str))
+    info = info.drop_duplicates("event_id", keep="last").set_index("event_id")
+    info = info.reindex(columns=["event_name", "event_date", "location_name"])
+    return info.join(per_event, how=how)
@@ -0,0 +1,116 @@
+"""テーマ CSS のビルド（最小化 + コンテンツハッシュ付き静的ファイル）。
+
+ecoride/css/*.css を元に、通常モードとハイコントラストモードのパレットから
+static/theme-<mode>.<hash>.css を書き出す。ファイル名にハッシュを含めるため
+ブラウザは長期キャッシュでき、毎回の再実行では <link> タグだけを送れば済む。
+静的ファイルの .css を text/css で配信する Streamlit（requirements.txt の下限、1.66 で確認）が必要。
+古い版は許可リスト外の拡張子を text/plain + nosniff で返すので、ブラウザが CSS を適用しない。
+
+    python -m ecoride.theme   # static/ 以下を再生成
+"""
+import hashlib
+import re
+from pathlib import Path
+
+# --- カラーテーマ ---
+PALETTES = {
+    "normal": {
+        "bar_solo":   "#EF5350",
+        "bar_share":  "#66BB6A",
+        "bar_text":   "white",
+        "grid":       "rgba(200,230,201,0.6)",
+        "chart_font": "#1A2B1A",
+        "car_solo":   "#EF5350",
+        "car_share":  "#66BB6A",
+        "car_arrow":  "#888",
+        "reduce_txt": "#66BB6A",
+        "reduce_bg":  "rgba(102,187,106,0.18)",
+        "icon":       "#2E7D32",
+    },
+    "hc": {
+        "bar_solo":   "#CC0000",
+        "bar_share":  "#005500",
+        "bar_text":   "white",
+        "grid":       "rgba(0,0,0,0.4)",
+        "chart_font": "#000000",
+        "car_solo":   "#CC0000",
+        "car_share":  "#005500",
+        "car_arrow":  "#000000",
+        "reduce_txt": "#FFFFFF",
+        "reduce_bg":  "rgba(0,100,0,0.9)",
+        "icon":       "#005500",
+    },
+}
+
+CSS_DIR = Path(__file__).resolve().parent / "css"
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+STATIC_URL = "/app/static"
+
+# モードごとの元 CSS。hc は通常モードの CSS の後に重ねて読み込む。
+_SOURCES = {
+    "normal": "base.css",
+    "hc": "hc.css",
+}
+
+# パレット依存のルール（以前は render_car_count_card のインライン style だった）
+_PALETTE_RULES = """
+.car-count-solo {{ color: {car_solo}; }}
+.car-count-share {{ color: {car_share}; }}
+.car-count-arrow {{ color: {car_arrow}; }}
+.car-count-reduce {{ color: {reduce_txt}; background: {reduce_bg}; }}
+"""
+
+_ASSET_RE = re.compile(r"^theme-(?P<mode>[a-z]+)\.[0-9a-f]{10}\.css$")
+
+
+def minify_css(css: str) -> str:
+    """コメントと余分な空白を取り除く。セレクタ内の結合子は変更しない。"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+def build_css(mode: str) -> str:
+    source = (CSS_DIR / _SOURCES[mode]).read_text(encoding="utf-8")
+    return minify_css(source + _PALETTE_RULES.format(**PALETTES[mode]))
+
+
+def asset_filename(mode: str, css: str) -> str:
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:10]
+    return f"theme-{mode}.{digest}.css"
+
+
+def ensure_theme_assets(static_dir: Path = STATIC_DIR) -> dict[str, str]:
+    """全モードの CSS を書き出し、モード名 → 配信 URL を返す。
+
+    同じハッシュのファイルが既にあれば書き込まない。古いハッシュのファイルは削除する。
+    """
+    urls = {}
+    current = set()
+    for mode in _SOURCES:
+        css = build_css(mode)
+        name = asset_filename(mode, css)
+        path = static_dir / name
+        if not path.exists():
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(css, encoding="utf-8")
+            tmp.replace(path)
+        current.add(name)
+        urls[mode] = f"{STATIC_URL}/{name}"
+
+    for old in static_dir.glob("theme-*.css"):
+        if _ASSET_RE.match(old.name) and old.name not in current:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+    return urls
+
+
+if __name__ == "__main__":
+    for mode, url in ensure_theme_assets().items():
+        size = (STATIC_DIR / url.rsplit("/", 1)[1]).stat().st_size
+        print(f"{mode:7s} {url}  ({size:,} bytes)")
@@ -0,0 +1,121 @@
+"""登録の時系列（5分ごとの登録数・CO2 削減量と累積）。
+
+参加者行の registered_at（登録時刻、ISO 8601）を BUCKET ごとに区切って集計する。
+TimelineTally は、現在の区間より前の区間を確定済みとして保持し、更新のたびに
+集計し直すのは現在の区間の行だけにする。ライブモニターは10秒ごとに再描画されるが、
+8時間のイベントでも1回の更新で排出量を計算するのは直近5分の登録分で済み、
+前回から登録が無ければ前回の結果をそのまま返す。
+
+確定済みの区間の行が修正・削除されたかは、行数と row_revision の合計で判定し、
+変わっていたときだけ全区間を集計し直す（修正は row_revision を必ず上げるため）。
+registered_at の無い行（導入前の登録）は時系列に含めない。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ecoride.stats import emission_rows
+
+TIMESTAMP_COLUMN = "registered_at"
+BUCKET = pd.Timedelta(minutes=5)
+COLUMNS = ["groups", "people", "reduction_kg"]
+
+
+def parse_timestamps(values) -> pd.Series:
+    """registered_at → UTC の Timestamp（読めない値は NaT）。"""
+    return pd.to_datetime(pd.Series(values), format="ISO8601", utc=True, errors="coerce")
+
+
+def bucket_totals(df: pd.DataFrame, stamps: pd.Series) -> pd.DataFrame:
+    """区間の開始時刻（UTC）ごとの groups, people, reduction_kg。"""
+    rows = emission_rows(df)
+    if rows.empty:
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], tz="UTC", name="bucket"), dtype=float)
+    table = pd.DataFrame({
+        "bucket": stamps.reindex(rows.index).dt.floor(BUCKET),
+        "groups": 1.0,
+        "people": rows["people"],
+        "reduction_kg": (rows["solo_g"] - rows["share_g"]) / 1000,
+    })
+    return table.groupby("bucket")[COLUMNS].sum()
+
+
+def with_cumulative(buckets: pd.DataFrame) -> pd.DataFrame:
+    """空の区間を 0 で埋め、累積列（cum_groups, cum_people, cum_reduction_kg）を加える。"""
+    if buckets.empty:
+        return buckets.assign(**{f"cum_{c}": pd.Series(dtype=float) for c in COLUMNS})
+    full = pd.date_range(buckets.index.min(), buckets.index.max(), freq=BUCKET, name="bucket")
+    out = buckets.reindex(full, fill_value=0.0)
+    for col in COLUMNS:
+        out[f"cum_{col}"] = out[col].cumsum()
+    return out
+
+
+class TimelineTally:
+    """1イベントの登録の時系列を、現在の区間だけ集計し直して保つ。スレッドセーフ。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = None                   # 現在の区間の開始時刻
+        self._closed = None                 # 確定済みの区間の集計
+        self._fingerprint = None            # 確定済みの区間の (行数, row_revision の合計)
+        self._latest_fingerprint = None     # 現在の区間の同じもの
+        self._result = None                 # 前回の返り値（どちらも変わらなければそのまま返す）
+        self._parsed = pd.Series(dtype="datetime64[ns, UTC]")  # registered_at の文字列 → 解析結果
+
+    def _timestamps(self, values: pd.Series) -> pd.Series:
+        """文字列の解析は初めて見た値だけにする（同じ行は毎回同じ文字列）。"""
+        text = values.map(lambda v: v if isinstance(v, str) else None)
+        with self._lock:
+            parsed = self._parsed
+        new = pd.Index(text.dropna().unique()).difference(parsed.index)
+        if len(new):
+            parsed = pd.concat([parsed, parse_timestamps(new).set_axis(new)])
+            with self._lock:
+                self._parsed = parsed
+        stamps = parsed.reindex(text.fillna("").to_numpy())
+        stamps.index = values.index
+        return stamps
+
+    def update(self, df: pd.DataFrame, now: pd.Timestamp) -> pd.DataFrame:
+        """df（このイベントの参加者行）の区間ごとの集計（with_cumulative 済み）を返す。"""
+        if df.empty or TIMESTAMP_COLUMN not in df.columns:
+            return with_cumulative(bucket_totals(df.iloc[:0], pd.Series(dtype="datetime64[ns, UTC]")))
+        stamps = self._timestamps(df[TIMESTAMP_COLUMN])
+        open_start = pd.Timestamp(now).tz_convert("UTC").floor(BUCKET)
+        closed = (stamps < open_start).to_numpy()
+        revisions = pd.to_numeric(df.get("row_revision", 0), errors="coerce")
+        revisions = np.zeros(len(df)) if np.ndim(revisions) == 0 else np.nan_to_num(revisions.to_numpy(dtype=float))
+        fingerprint = (int(closed.sum()), float(revisions[closed].sum()))
+        current = (stamps >= open_start).to_numpy()
+        latest_fingerprint = (open_start, int(current.sum()), float(revisions[current].sum()))
+
+        with self._lock:
+            if (self._result is not None and open_start == self._open and fingerprint == self._fingerprint
+                    and latest_fingerprint == self._latest_fingerprint):
+                return self._result
+            if self._closed is None or self._open is None or open_start < self._open:
+                self._closed = bucket_totals(df[closed], stamps[closed])
+            elif open_start != self._open:
+                # 前回の現在区間（とその後の空き区間）が確定した分だけ足す
+                newly = closed & (stamps >= self._open).to_numpy()
+                expected = (self._fingerprint[0] + int(newly.sum()), self._fingerprint[1] + float(revisions[newly].sum()))
+                if expected == fingerprint:
+                    self._closed = pd.concat([self._closed, bucket_totals(df[newly], stamps[newly])])
+                else:
+                    self._closed = bucket_totals(df[closed], stamps[closed])
+            elif fingerprint != self._fingerprint:
+                self._closed = bucket_totals(df[closed], stamps[closed])
+            self._open = open_start
+            self._fingerprint = fingerprint
+            closed_totals = self._closed
+
+        latest = bucket_totals(df[current], stamps[current])
+        buckets = pd.concat([closed_totals, latest]) if not latest.empty else closed_totals
+        result = with_cumulative(buckets)
+        with self._lock:
+            if self._open == open_start:
+                self._result = result
+                self._latest_fingerprint = latest_fingerprint
+        return result
@@ -0,0 +1,154 @@
+"""車種モデル（車種ごとの排出係数と定員）の読み込みと、参照用の配列への展開。
+
+モデルは ecoride/vehicle_models/<version>.json に版ごとに置く。係数を変えるときは
+ファイルを書き換えず新しい版を追加するので、古い版で出した集計もその版を読み込めば
+同じ値を再現できる。集計結果には版（VehicleModel.version）を一緒に保存する。
+
+    {
+      "version": "2025.1",
+      "default_class": "gasoline",            シートの車種が不明な行に使う車種
+      "classes": [{"id": "gasoline", "label": "ガソリン車 (普通) | 14km/L",
+                   "factor": 166, "capacity": 5}, ...],
+      "aliases": {"旧表示名": "gasoline"},    表示名を変えた車種の古い表示名
+      "event_overrides": {"<event_id>": {"microbus": {"capacity": 25}}}
+    }
+
+factor は 1km あたりの g-CO2、capacity は乗車定員。読み込み時に、表示名 → 車種番号の
+索引と (イベント, 車種) の係数・定員の表に展開するので、集計では行ごとの辞書引きや
+既定値への置き換えをせず、配列の添字だけで係数を引ける。
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = Path(__file__).resolve().parent / "vehicle_models"
+
+
+def split_car_info(car_str):
+    """車種の表示名 → (車種名, 燃費目安)。"ガソリン車 (普通) | 14km/L" の形式と旧形式の両方を読む。"""
+    if not isinstance(car_str, str):
+        return str(car_str), "-"
+    if "|" in car_str:
+        parts = car_str.split("|")
+        return parts[0].strip(), parts[1].strip()
+    match = re.search(r'(.+?)[\s\（\(]+(.+?km/L)[\)\）]', car_str)
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return car_str, "-"
+
+
+def _version_key(version: str):
+    """"2025.10" が "2025.9" より後になるように、数字の部分は数値で比べる。"""
+    return tuple(int(p) if p.isdigit() else p for p in str(version).split("."))
+
+
+def available_versions(model_dir=MODEL_DIR) -> list:
+    """置いてある版（古い順）。"""
+    return sorted((p.stem for p in Path(model_dir).glob("*.json")), key=_version_key)
+
+
+class VehicleModel:
+    """1つの版の車種モデル。factors / capacities は (イベント, 車種) の表で、
+
+    行 0 が基本の値、行 1〜 が event_overrides のあるイベント。列の最後は不明な車種
+    （default_class と同じ値）。
+    """
+
+    def __init__(self, config: dict):
+        self.version = str(config["version"])
+        self.source = config.get("source", "")
+        classes = config["classes"]
+        ids = [c["id"] for c in classes]
+        labels = [c["label"] for c in classes]
+        for name, values in (("id", ids), ("label", labels)):
+            duplicated = sorted({v for v in values if values.count(v) > 1})
+            if duplicated:
+                raise ValueError(f"車種モデル {self.version}: 重複した {name}: {duplicated}")
+        position = {class_id: i for i, class_id in enumerate(ids)}
+        default_class = config.get("default_class", ids[0])
+        if default_class not in position:
+            raise ValueError(f"車種モデル {self.version}: default_class {default_class!r} がありません")
+
+        self.classes = classes
+        self.class_ids = ids
+        self.labels = labels
+        # 表示名（と古い表示名）→ 車種番号
+        aliases = config.get("aliases", {})
+        unknown = sorted(set(aliases.values()) - set(position))
+        if unknown:
+            raise ValueError(f"車種モデル {self.version}: aliases の車種がありません: {unknown}")
+        self._label_index = pd.Index(labels + list(aliases))
+        self._label_codes = np.array([position[i] for i in ids] + [position[i] for i in aliases.values()])
+        self._unknown = len(ids)
+
+        base_factors = [float(c["factor"]) for c in classes]
+        base_capacities = [float(c["capacity"]) for c in classes]
+        if min(base_capacities) < 1 or min(base_factors) < 0:
+            raise ValueError(f"車種モデル {self.version}: 定員は1以上、排出係数は0以上にしてください")
+        d = position[default_class]
+        factors = [base_factors + [base_factors[d]]]
+        capacities = [base_capacities + [base_capacities[d]]]
+        overrides = config.get("event_overrides", {})
+        for event_id, changes in overrides.items():
+            row_f, row_c = list(factors[0]), list(capacities[0])
+            for class_id, values in changes.items():
+                if class_id not in position:
+                    raise ValueError(f"車種モデル {self.version}: イベント {event_id} の車種 {class_id!r} がありません")
+                i = position[class_id]
+                row_f[i] = float(values.get("factor", row_f[i]))
+                row_c[i] = float(values.get("capacity", row_c[i]))
+            # 不明な車種は default_class の（上書き後の）値
+            row_f[-1], row_c[-1] = row_f[d], row_c[d]
+            factors.append(row_f)
+            capacities.append(row_c)
+        self.factors = np.array(factors)
+        self.capacities = np.array(capacities)
+        self._event_index = pd.Index([str(e) for e in overrides])
+
+        self.default_factor = float(self.factors[0, -1])
+        self.default_capacity = float(self.capacities[0, -1])
+        # 同じ版の番号のまま中身が変わった場合も区別できるよう、キャッシュキーには内容のハッシュも含める
+        digest = hashlib.sha1(json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        self.key = f"{self.version}-{digest.hexdigest()[:8]}"
+
+    def class_codes(self, car: pd.Series) -> np.ndarray:
+        """車種の表示名 → 車種番号（不明な表示名は最後の列の番号）。"""
+        found = self._label_index.get_indexer(car)
+        return np.where(found >= 0, self._label_codes[found], self._unknown)
+
+    def event_rows(self, event_ids: pd.Series) -> np.ndarray:
+        """event_id → 表の行（上書きの無いイベントは 0）。"""
+        if self._event_index.empty:
+            return np.zeros(len(event_ids), dtype=np.intp)
+        return self._event_index.get_indexer(event_ids.astype(str)) + 1
+
+    def lookup(self, car: pd.Series, event_ids=None):
+        """行ごとの (排出係数, 定員) の配列。"""
+        codes = self.class_codes(car)
+        rows = np.zeros(len(codes), dtype=np.intp) if event_ids is None else self.event_rows(event_ids)
+        return self.factors[rows, codes], self.capacities[rows, codes]
+
+    def factors_by_label(self) -> dict:
+        """表示名 → 基本の排出係数（設定ファイルの値のまま。画面の選択肢・根拠の表に使う）。"""
+        return {c["label"]: c["factor"] for c in self.classes}
+
+    def capacities_by_label(self) -> dict:
+        return {c["label"]: c["capacity"] for c in self.classes}
+
+
+def load_model(version=None, model_dir=MODEL_DIR) -> VehicleModel:
+    """version の車種モデル（省略時は最新版）。"""
+    if version is None:
+        versions = available_versions(model_dir)
+        if not versions:
+            raise FileNotFoundError(f"車種モデルがありません: {model_dir}")
+        version = versions[-1]
+    path = Path(model_dir) / f"{version}.json"
+    config = json.loads(path.read_text(encoding="utf-8"))
+    if str(config.get("version")) != str(version):
+        raise ValueError(f"{path.name}: ファイル名と version {config.get('version')!r} が一致しません")
+    return VehicleModel(config)
@@ -0,0 +1,48 @@
+import json
+
+import pandas as pd
+
+from ecoride import batch
+from ecoride.stats import MODEL_VERSION
+from ecoride.vehicles import MODEL_DIR, load_model
+
+
+def _participants(path):
+    pd.DataFrame({
+        "event_id": ["e1", "e1", "e2"],
+        "people": [4, 2, 3],
+        "distance": [10, 20, 30],
+        "car_type": ["ガソリン車 (普通) | 14km/L", "軽自動車 | 16km/L", "ガソリン車 (普通) | 14km/L"],
+    }).to_csv(path, index=False)
+
+
+def test_report_records_model_version(tmp_path):
+    src, out = tmp_path / "p.csv", tmp_path / "report.json"
+    _participants(src)
+    assert batch.main([str(src), "-o", str(out), "--workers", "1"]) == 0
+    payload = json.loads(out.read_text(encoding="utf-8"))
+    assert payload["model_version"] == MODEL_VERSION
+    assert {e["model_version"] for e in payload["events"]} == {MODEL_VERSION}
+
+
+def test_model_version_option_recomputes_with_that_model(tmp_path, monkeypatch):
+    # 係数を変えた新しい版を置いても、--model-version で古い版の集計を再現できる
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+    config = json.loads((MODEL_DIR / f"{MODEL_VERSION}.json").read_text(encoding="utf-8"))
+    (model_dir / f"{MODEL_VERSION}.json").write_text(json.dumps(config), encoding="utf-8")
+    newer = dict(config, version="9999.1",
+                 classes=[dict(c, factor=c["factor"] * 2) for c in config["classes"]])
+    (model_dir / "9999.1.json").write_text(json.dumps(newer), encoding="utf-8")
+    monkeypatch.setattr(batch, "load_model", lambda version=None: load_model(version, model_dir))
+
+    src = tmp_path / "p.csv"
+    _participants(src)
+    reports = {}
+    for version in ("9999.1", MODEL_VERSION):
+        out = tmp_path / f"{version}.csv"
+        assert batch.main([str(src), "-o", str(out), "--workers", "1", "--model-version", version]) == 0
+        reports[version] = pd.read_csv(out, encoding="utf-8-sig").set_index("event_id")
+    assert set(reports["9999.1"]["model_version"].astype(str)) == {"9999.1"}
+    assert set(reports[MODEL_VERSION]["model_version"].astype(str)) == {MODEL_VERSION}
+    assert (reports["9999.1"]["solo_g"] == reports[MODEL_VERSION]["solo_g"] * 2).all()
@@ -0,0 +1,243 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from ecoride.concurrency import (
+    DELETED_COLUMN,
+    REVISION_COLUMN,
+    ConflictError,
+    Delete,
+    Insert,
+    SheetCommitter,
+    Update,
+    WholeSheetStore,
+    apply_changesets,
+    live_rows,
+)
+from ecoride.sharedcache import SharedCache
+
+
+def _sheet(*rows):
+    return pd.DataFrame(list(rows), columns=["participant_id", "event_id", "people", REVISION_COLUMN])
+
+
+def _row(pid, event="e1", people=1):
+    return {"participant_id": pid, "event_id": event, "people": people}
+
+
+def _apply(df, changesets, revisions=None):
+    return apply_changesets(df, changesets, "event_id", revisions or {})
+
+
+def _people(df):
+    return dict(zip(df["participant_id"], df["people"]))
+
+
+# --- apply_changesets ---
+
+def test_insert_update_delete():
+    df = _sheet(("a", "e1", 1, 1), ("b", "e1", 2, 1))
+    out, results = _apply(df, [[Insert(_row("c", people=3))], [Update("a", {"people": 5}, 1)], [Delete("b", 1)]],
+                          {"e1": 1})
+    assert _people(out) == {"a": 5, "c": 3}
+    assert results == [{"e1": 2}, {"e1": 2}, {"e1": 2}]
+    assert out.set_index("participant_id")[REVISION_COLUMN].to_dict() == {"a": 2, "c": 2}
+
+
+def test_stale_update_conflicts():
+    df = _sheet(("a", "e1", 1, 3))
+    out, results = _apply(df, [[Update("a", {"people": 5}, 2)]], {"e1": 3})
+    assert isinstance(results[0], ConflictError)
+    assert _people(out) == {"a": 1}
+
+
+def test_update_on_row_inserted_in_same_batch():
+    out, results = _apply(_sheet(), [[Insert(_row("a"))], [Update("a", {"people": 4}, 1)]])
+    assert results == [{"e1": 1}, {"e1": 1}]
+    assert _people(out) == {"a": 4}
+    assert out.at[0, REVISION_COLUMN] == 1
+
+
+def test_update_on_row_inserted_in_same_batch_with_stale_base():
+    df = _sheet(("x", "e1", 1, 4))
+    out, results = _apply(df, [[Insert(_row("a"))], [Update("a", {"people": 4}, 0)]], {"e1": 4})
+    assert results[0] == {"e1": 5}
+    assert isinstance(results[1], ConflictError)
+    assert _people(out) == {"x": 1, "a": 1}
+
+
+def test_insert_then_update_in_one_changeset():
+    out, results = _apply(_sheet(), [[Insert(_row("a")), Update("a", {"people": 7}, 0)]])
+    assert results == [{"e1": 1}]
+    assert _people(out) == {"a": 7}
+
+
+def test_insert_then_delete_in_same_batch():
+    out, results = _apply(_sheet(("x", "e1", 1, 0)), [[Insert(_row("a"))], [Delete("a", 1)]])
+    assert results == [{"e1": 1}, {"e1": 1}]
+    assert _people(out) == {"x": 1}
+
+
+def test_delete_then_update_conflicts():
+    df = _sheet(("a", "e1", 1, 1))
+    out, results = _apply(df, [[Delete("a", 1)], [Update("a", {"people": 5}, 1)]], {"e1": 1})
+    assert results[0] == {"e1": 2}
+    assert isinstance(results[1], ConflictError)
+    assert out.empty
+
+
+def test_update_then_delete_with_same_base_conflicts():
+    df = _sheet(("a", "e1", 1, 1))
+    out, results = _apply(df, [[Update("a", {"people": 5}, 1)], [Delete("a", 1)]], {"e1": 1})
+    assert results[0] == {"e1": 2}
+    assert isinstance(results[1], ConflictError)
+    assert _people(out) == {"a": 5}
+
+
+def test_duplicate_insert_is_idempotent():
+    df = _sheet(("a", "e1", 1, 1))
+    out, results = _apply(df, [[Insert(_row("a", people=9))], [Insert(_row("b"))], [Insert(_row("b"))]], {"e1": 1})
+    assert _people(out) == {"a": 1, "b": 1}
+    assert len(results) == 3 and not any(isinstance(r, ConflictError) for r in results)
+
+
+def test_delete_of_missing_row_is_noop():
+    df = _sheet(("a", "e1", 1, 1))
+    out, results = _apply(df, [[Delete("zzz", 0)]], {"e1": 1})
+    assert results == [{}]
+    assert _people(out) == {"a": 1}
+
+
+def test_changeset_is_atomic():
+    df = _sheet(("a", "e1", 1, 1), ("b", "e1", 1, 3))
+    out, results = _apply(df, [[Update("a", {"people": 2}, 1), Update("b", {"people": 2}, 1)]], {"e1": 3})
+    assert isinstance(results[0], ConflictError)
+    assert _people(out) == {"a": 1, "b": 1}
+
+
+def test_revisions_are_per_partition():
+    df = _sheet(("a", "e1", 1, 5), ("b", "e2", 1, 1))
+    out, results = _apply(df, [[Update("a", {"people": 2}, 5), Update("b", {"people": 2}, 1)]], {"e1": 5, "e2": 1})
+    assert results == [{"e1": 6, "e2": 2}]
+
+
+# --- SheetCommitter ---
+
+class MemoryStore:
+    """行単位で書けるストア（ecoride.sheets.WorksheetStore の代わり）。書き込みの回数と中身を記録する。"""
+
+    row_level = True
+
+    def __init__(self, df):
+        self.rows = df.to_dict("records")
+        self.lock = threading.Lock()
+        self.written = []
+
+    def read(self):
+        with self.lock:
+            return pd.DataFrame(self.rows)
+
+    def write_rows(self, df, updates, appends):
+        with self.lock:
+            for position, row in updates.items():
+                self.rows[position] = dict(row)
+            self.rows.extend(dict(row) for row in appends)
+            self.written.append((sorted(updates), len(appends)))
+
+    def replace(self, df):
+        with self.lock:
+            self.rows = df.to_dict("records")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedCache(tmp_path / "cache.sqlite")
+
+
+def test_committer_writes_only_changed_rows(cache):
+    store = MemoryStore(_sheet(("a", "e1", 1, 0), ("b", "e2", 1, 0), ("c", "e1", 1, 0)))
+    committer = SheetCommitter("participants", store, cache)
+    committer.commit([Update("c", {"people": 4}, 0), Insert(_row("d"))])
+    assert store.written == [([2], 1)]
+    assert _people(pd.DataFrame(store.rows)) == {"a": 1, "b": 1, "c": 4, "d": 1}
+
+
+def test_committer_delete_leaves_tombstone_until_compacted(cache):
+    store = MemoryStore(_sheet(("a", "e1", 1, 0), ("b", "e1", 1, 0)))
+    committer = SheetCommitter("participants", store, cache)
+    committer.commit([Delete("a", 0)])
+    raw = store.read()
+    assert len(raw) == 2 and raw[DELETED_COLUMN].notna().sum() == 1
+    assert list(live_rows(raw)["participant_id"]) == ["b"]
+    # 墓標の行番号が残っているので、後ろの行は同じ番号のまま書き換えられる
+    committer.commit([Update("b", {"people": 3}, 0)])
+    assert store.written[-1] == ([1], 0)
+    assert committer.compact() == 1
+    assert list(store.read()["participant_id"]) == ["b"]
+
+
+def test_committer_conflict_is_reported(cache):
+    store = MemoryStore(_sheet(("a", "e1", 1, 0)))
+    committer = SheetCommitter("participants", store, cache)
+    committer.commit([Update("a", {"people": 2}, 0)])
+    with pytest.raises(ConflictError):
+        committer.commit([Update("a", {"people": 3}, 0)])
+
+
+def test_committer_rejects_partition_change(cache):
+    committer = SheetCommitter("participants", MemoryStore(_sheet(("a", "e1", 1, 0))), cache)
+    with pytest.raises(ValueError):
+        committer.commit([Update("a", {"event_id": "e2"}, 0)])
+
+
+def test_committer_partitions_write_concurrently(cache):
+    """別のイベントへの書き込みは、互いの書き込み権を待たない。"""
+    store = MemoryStore(_sheet())
+    committer = SheetCommitter("participants", store, cache)
+    inside = threading.Barrier(2, timeout=10)
+    write_rows = store.write_rows
+
+    def slow_write(df, updates, appends):
+        inside.wait()  # 両方のイベントの書き込みが同時に書き込み権を持っていないと進めない
+        write_rows(df, updates, appends)
+
+    store.write_rows = slow_write
+    threads = [threading.Thread(target=committer.commit, args=([Insert(_row(f"p{i}", event=f"e{i}"))],))
+               for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(r["participant_id"] for r in store.rows) == ["p0", "p1"]
+
+
+def test_committer_concurrent_increments_are_not_lost(cache):
+    store = MemoryStore(_sheet(("c0", "e0", 0, 0), ("c1", "e1", 0, 0)))
+    committer = SheetCommitter("participants", store, cache)
+
+    def increment(pid):
+        for _ in range(10):
+            while True:
+                row = store.read().set_index("participant_id").loc[pid]
+                try:
+                    committer.commit([Update(pid, {"people": int(row["people"]) + 1}, int(row[REVISION_COLUMN]))])
+                    break
+                except ConflictError:
+                    pass
+
+    threads = [threading.Thread(target=increment, args=(f"c{i % 2}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert _people(pd.DataFrame(store.rows)) == {"c0": 30, "c1": 30}
+
+
+def test_whole_sheet_store_drops_deleted_rows(cache):
+    sheet = {"df": _sheet(("a", "e1", 1, 0), ("b", "e1", 1, 0))}
+    store = WholeSheetStore(lambda: sheet["df"], lambda df: sheet.update(df=df))
+    committer = SheetCommitter("participants", store, cache)
+    committer.commit_all([[Delete("a", 0)], [Insert(_row("c"))]])
+    assert list(sheet["df"]["participant_id"]) == ["b", "c"]
+    assert DELETED_COLUMN not in sheet["df"].columns
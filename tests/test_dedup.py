@@ -0,0 +1,67 @@
+import pandas as pd
+
+from ecoride.dedup import RegistrationIndex, registration_key, registration_keys
+
+CAR = "軽自動車 | 16km/L"
+
+
+def test_key_ignores_width_whitespace_and_case():
+    base = registration_key("Yamada 家", "東京都新宿区 西新宿", 2, CAR)
+    assert registration_key("ＹＡＭＡＤＡ家", "東京都新宿区西新宿", 2, CAR) == base   # NFKC・空白・大文字
+    assert registration_key("yamada　家", " 東京都新宿区\t西新宿 ", "2", CAR) == base  # 全角空白・人数の文字列
+    assert registration_key("ﾔﾏﾀﾞ", "新宿", 2, CAR) == registration_key("ヤマダ", "新宿", 2, CAR)  # 半角カナ
+
+
+def test_key_distinguishes_contents():
+    base = registration_key("山田家", "新宿", 2, CAR)
+    assert registration_key("山田家", "新宿", 3, CAR) != base
+    assert registration_key("山田家", "渋谷", 2, CAR) != base
+    assert registration_key("山田家", "新宿", 2, "ハイブリッド車 | 22km/L") != base
+
+
+def test_keys_match_single_key():
+    df = pd.DataFrame([
+        {"name": "山田家", "start_point": "新宿", "people": 2.0, "car_type": CAR},
+        {"name": None, "start_point": "渋谷", "people": "x", "car_type": CAR},
+    ])
+    keys = registration_keys(df)
+    assert keys.iloc[0] == registration_key("山田家", "新宿", 2, CAR)
+    assert keys.iloc[1] == registration_key("", "渋谷", None, CAR)
+
+
+def _sheet(*rows):
+    return pd.DataFrame([
+        {"participant_id": pid, "event_id": event, "name": name, "start_point": "新宿", "people": 2, "car_type": CAR}
+        for pid, event, name in rows
+    ])
+
+
+def test_index_finds_per_event():
+    index = RegistrationIndex()
+    index.refresh(_sheet(("p1", "e1", "山田家"), ("p2", "e2", "佐藤家")), 1)
+    key = registration_key("山田家", "新宿", 2, CAR)
+    assert index.find("e1", key) == "p1"
+    assert index.find("e2", key) is None
+    assert index.find("e1", registration_key("佐藤家", "新宿", 2, CAR)) is None
+
+
+def test_refresh_is_noop_for_same_version():
+    index = RegistrationIndex()
+    index.refresh(_sheet(("p1", "e1", "山田家")), 1)
+    added = registration_key("鈴木家", "新宿", 2, CAR)
+    index.add("e1", added, "p9")
+    # 同じバージョンなら渡されたシートが違っても作り直さない（add した登録も残る）
+    index.refresh(_sheet(("p2", "e1", "佐藤家")), 1)
+    assert index.find("e1", registration_key("山田家", "新宿", 2, CAR)) == "p1"
+    assert index.find("e1", added) == "p9"
+    assert index.find("e1", registration_key("佐藤家", "新宿", 2, CAR)) is None
+    # バージョンが変われば渡されたシートで作り直す
+    index.refresh(_sheet(("p2", "e1", "佐藤家")), 2)
+    assert index.find("e1", registration_key("佐藤家", "新宿", 2, CAR)) == "p2"
+    assert index.find("e1", added) is None
+
+
+def test_refresh_empty_sheet():
+    index = RegistrationIndex()
+    index.refresh(pd.DataFrame(), 1)
+    assert index.find("e1", registration_key("山田家", "新宿", 2, CAR)) is None
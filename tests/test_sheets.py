@@ -0,0 +1,95 @@
+import re
+
+import pandas as pd
+
+from ecoride.concurrency import DELETED_COLUMN, REVISION_COLUMN, Delete, Insert, SheetCommitter, Update, live_rows
+from ecoride.sharedcache import SharedCache
+from ecoride.sheets import WorksheetStore, batch_read
+
+
+class FakeWorksheet:
+    """gspread の Worksheet のうち WorksheetStore が使う部分（セルは文字列・数値のまま持つ）。"""
+
+    def __init__(self, values):
+        self.values = [list(row) for row in values]
+        self.col_count = max(len(row) for row in values)
+        self.requests = []
+
+    def _put(self, row, values):
+        while len(self.values) < row:
+            self.values.append([])
+        line = self.values[row - 1]
+        line.extend([""] * (len(values) - len(line)))
+        line[:len(values)] = values
+
+    def batch_update(self, data, **kwargs):
+        self.requests.append("batch_update")
+        for item in data:
+            self._put(int(re.fullmatch(r"A(\d+)", item["range"]).group(1)), item["values"][0])
+
+    def append_rows(self, values, **kwargs):
+        self.requests.append("append_rows")
+        self.values.extend(list(row) for row in values)
+
+    def row_values(self, row):
+        return list(self.values[row - 1])
+
+    def add_cols(self, cols):
+        self.col_count += cols
+
+    def update(self, range_name, values, **kwargs):
+        self.requests.append("update")
+        self._put(1, values[0])
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def worksheet(self, title):
+        return self.sheets[title]
+
+    def values_batch_get(self, ranges, params=None):
+        return {"valueRanges": [{"values": self.sheets[r.strip("'")].values} for r in ranges]}
+
+
+def _spreadsheet():
+    return FakeSpreadsheet({"participants": FakeWorksheet([
+        ["participant_id", "event_id", "name", "people"],
+        ["a", "e1", "A", 1],
+        ["b", "e2", "B", 2],
+        ["c", "e1", "C", 3],
+    ])})
+
+
+def test_committer_writes_rows_in_place(tmp_path):
+    spreadsheet = _spreadsheet()
+    ws = spreadsheet.sheets["participants"]
+    cache = SharedCache(tmp_path / "c.sqlite")
+    committer = SheetCommitter("participants", WorksheetStore(spreadsheet, "participants", cache), cache)
+    new_row = {"participant_id": "d", "event_id": "e1", "name": "D", "people": 1}
+    committer.commit([Update("c", {"people": 5}, 0), Insert(new_row)])
+    # 見出しに row_revision を足し、c の行（4行目）だけを書き換えて d を追加する
+    assert ws.values[0] == ["participant_id", "event_id", "name", "people", REVISION_COLUMN]
+    assert ws.values[3] == ["c", "e1", "C", 5, 1]
+    assert ws.values[4] == ["d", "e1", "D", 1, 1]
+    assert ws.values[2] == ["b", "e2", "B", 2]
+
+    committer.commit([Delete("a", 0)])
+    assert ws.values[0][-1] == DELETED_COLUMN
+    assert ws.values[1][:5] == ["a", "e1", "A", 1, 0] and ws.values[1][5]
+    frame = live_rows(batch_read(spreadsheet, ["participants"])["participants"])
+    assert list(frame["participant_id"]) == ["b", "c", "d"]
+    assert list(frame.index) == [1, 2, 3]  # 行番号は墓標の分もそのまま
+
+
+def test_unnamed_columns_keep_their_values(tmp_path):
+    spreadsheet = FakeSpreadsheet({"participants": FakeWorksheet([
+        ["participant_id", "", "event_id", "people", REVISION_COLUMN],
+        ["a", "memo", "e1", 1, 0],
+    ])})
+    cache = SharedCache(tmp_path / "c.sqlite")
+    store = WorksheetStore(spreadsheet, "participants", cache)
+    SheetCommitter("participants", store, cache).commit([Update("a", {"people": 2}, 0)])
+    assert spreadsheet.sheets["participants"].values[1] == ["a", "memo", "e1", 2, 1]
+    assert isinstance(store.read(), pd.DataFrame)
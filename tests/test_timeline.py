@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from ecoride.timeline import BUCKET, TimelineTally, bucket_totals, parse_timestamps, with_cumulative
+
+START = pd.Timestamp("2026-10-30T09:00:00+09:00")
+CAR = "ガソリン車 (普通) | 14km/L"
+
+
+def _row(pid, minutes, people=2, revision=0):
+    return {
+        "participant_id": pid, "event_id": "e1", "people": people, "distance": 10.0, "car_type": CAR,
+        "registered_at": (START + pd.Timedelta(minutes=minutes)).isoformat(), "row_revision": revision,
+    }
+
+
+def _expected(df):
+    return with_cumulative(bucket_totals(df, parse_timestamps(df["registered_at"]).set_axis(df.index)))
+
+
+def _check(tally, rows, now_minutes):
+    df = pd.DataFrame(rows)
+    result = tally.update(df, START + pd.Timedelta(minutes=now_minutes))
+    # 解析済みの時刻の単位（ns / us）の違いは問わない
+    pd.testing.assert_frame_equal(result, _expected(df), check_freq=False, check_index_type=False)
+    return result
+
+
+@pytest.fixture
+def rows():
+    return [_row("a", 1), _row("b", 3), _row("c", 7), _row("d", 12)]
+
+
+def test_matches_full_recompute_across_rollover(rows):
+    tally = TimelineTally()
+    _check(tally, rows, 13)
+    rows.append(_row("e", 14))
+    _check(tally, rows, 14)
+    # 区間をまたぐ: 10〜15分の区間が確定し、新しい区間に登録が入る
+    rows.append(_row("f", 16))
+    _check(tally, rows, 16)
+    # 登録の無い区間を2つ飛ばして進む
+    rows.append(_row("g", 31))
+    _check(tally, rows, 32)
+
+
+def test_unchanged_rows_return_previous_result(rows):
+    tally = TimelineTally()
+    first = _check(tally, rows, 13)
+    assert tally.update(pd.DataFrame(rows), START + pd.Timedelta(minutes=14)) is first
+
+
+def test_edit_of_closed_row_is_recomputed(rows):
+    tally = TimelineTally()
+    _check(tally, rows, 13)
+    rows[0] = _row("a", 1, people=5, revision=1)
+    _check(tally, rows, 13)
+    # 区間の切り替えと同時に確定済みの行が修正された場合も全体を集計し直す
+    rows[1] = _row("b", 3, people=4, revision=1)
+    rows.append(_row("e", 16))
+    _check(tally, rows, 16)
+
+
+def test_delete_of_closed_row_is_recomputed(rows):
+    tally = TimelineTally()
+    _check(tally, rows, 13)
+    del rows[2]
+    _check(tally, rows, 13)
+    del rows[0]
+    rows.append(_row("e", 17))
+    _check(tally, rows, 17)
+
+
+def test_rows_without_timestamp_are_ignored(rows):
+    tally = TimelineTally()
+    rows.append(dict(_row("x", 2), registered_at=None))
+    rows.append(dict(_row("y", 2), registered_at="not a time"))
+    result = _check(tally, rows, 13)
+    assert result["cum_groups"].iloc[-1] == 4
+
+
+def test_empty_and_missing_column():
+    tally = TimelineTally()
+    assert tally.update(pd.DataFrame(), START).empty
+    assert tally.update(pd.DataFrame([{"event_id": "e1", "people": 1}]), START).empty
+    assert BUCKET == pd.Timedelta(minutes=5)
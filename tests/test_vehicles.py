@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from ecoride.vehicles import VehicleModel, available_versions, load_model
+
+
+def _config(**changes):
+    config = {
+        "version": "test.1",
+        "default_class": "gasoline",
+        "classes": [
+            {"id": "gasoline", "label": "ガソリン車", "factor": 166, "capacity": 5},
+            {"id": "kei", "label": "軽自動車", "factor": 145, "capacity": 4},
+            {"id": "microbus", "label": "マイクロバス", "factor": 431, "capacity": 29},
+        ],
+        "aliases": {"軽自動車 (旧)": "kei"},
+        "event_overrides": {"e2": {"microbus": {"capacity": 25}, "gasoline": {"factor": 100}}},
+    }
+    config.update(changes)
+    return config
+
+
+def _lookup(model, cars, events=None):
+    factors, capacities = model.lookup(pd.Series(cars), None if events is None else pd.Series(events))
+    return list(factors), list(capacities)
+
+
+def test_lookup_uses_per_event_override():
+    model = VehicleModel(_config())
+    cars = ["マイクロバス", "マイクロバス", "軽自動車"]
+    assert _lookup(model, cars, ["e1", "e2", "e2"]) == ([431, 431, 145], [29, 25, 4])
+    # event_id を渡さなければ基本の値
+    assert _lookup(model, cars) == ([431, 431, 145], [29, 29, 4])
+
+
+def test_lookup_resolves_alias():
+    model = VehicleModel(_config())
+    assert _lookup(model, ["軽自動車 (旧)", "軽自動車"]) == ([145, 145], [4, 4])
+
+
+def test_unknown_label_gets_default_class():
+    model = VehicleModel(_config())
+    assert _lookup(model, ["不明な車", None, ""]) == ([166, 166, 166], [5, 5, 5])
+    assert (model.default_factor, model.default_capacity) == (166, 5)
+    # 不明な車種にも、そのイベントで上書きした default_class の値を使う
+    assert _lookup(model, ["不明な車"], ["e2"]) == ([100], [5])
+
+
+def test_key_changes_when_a_factor_changes():
+    base = VehicleModel(_config())
+    changed = _config()
+    changed["classes"][1] = dict(changed["classes"][1], factor=140)
+    assert VehicleModel(changed).key != base.key
+    assert VehicleModel(changed).version == base.version
+    assert VehicleModel(_config()).key == base.key
+
+
+def test_invalid_config_is_rejected():
+    with pytest.raises(ValueError):
+        VehicleModel(_config(default_class="ev"))
+    with pytest.raises(ValueError):
+        VehicleModel(_config(aliases={"旧": "ev"}))
+    with pytest.raises(ValueError):
+        VehicleModel(_config(event_overrides={"e1": {"ev": {"factor": 0}}}))
+
+
+def test_load_model_reads_the_shipped_versions():
+    versions = available_versions()
+    assert load_model().version == versions[-1]
+    assert load_model(versions[0]).version == versions[0]
+    with pytest.raises(FileNotFoundError):
+        load_model("0.0")